@@ -0,0 +1,61 @@
+"""csvtag: a toolkit for csv tag, a format of cs tag that supports inversion
+
+The public functions are imported on first access, so `import csvtag` stays fast
+for short-lived invocations and heavy dependencies are loaded only when needed.
+"""
+
+from __future__ import annotations
+
+import importlib
+import sys
+import types
+
+# Public name -> module that defines it
+_LAZY_ATTRIBUTES = {
+    "call": "csvtag.caller",
+    "call_records": "csvtag.caller",
+    "call_many": "csvtag.parallel",
+    "call_parallel": "csvtag.parallel",
+    "to_sequence": "csvtag.to_sequence",
+    "revcomp": "csvtag.revcomp",
+    "split_by_tag": "csvtag.splitter",
+    "split_by_inversion": "csvtag.splitter",
+    "split_by_nucleotide": "csvtag.splitter",
+    "combine_neighboring_csv_tags": "csvtag.combiner",
+    "to_html": "csvtag.to_html",
+    "to_vcf": "csvtag.to_vcf",
+}
+
+__all__ = sorted(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name: str):
+    if name == "__version__":
+        from importlib.metadata import PackageNotFoundError, version
+
+        try:
+            value = version("csvtag")
+        except PackageNotFoundError:
+            value = "unknown"
+    elif name in _LAZY_ATTRIBUTES:
+        value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name]), name)
+    else:
+        raise AttributeError(f"module 'csvtag' has no attribute '{name}'")
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
+
+
+class _Module(types.ModuleType):
+    def __setattr__(self, name: str, value) -> None:
+        # Importing a submodule sets it as an attribute of the package, so keep
+        # `csvtag.to_sequence` and `csvtag.revcomp` pointing to the functions of the same name
+        if isinstance(value, types.ModuleType) and value.__name__ == _LAZY_ATTRIBUTES.get(name):
+            value = getattr(value, name)
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _Module
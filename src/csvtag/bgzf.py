@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import os
+import struct
+import zlib
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO
+
+###########################################################
+# BGZF (blocked gzip) blocks
+###########################################################
+
+# Maximum number of uncompressed bytes per block, as in htslib
+BLOCK_SIZE = 0xFF00
+
+# The empty block marking the end of a BGZF file
+EOF_BLOCK = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+
+def compress_block(data: bytes, level: int = 6) -> bytes:
+    """Compress bytes (up to BLOCK_SIZE) into a BGZF block"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    cdata = compressor.compress(data) + compressor.flush()
+    header = struct.pack("<4BI2BH2BHH", 0x1F, 0x8B, 8, 4, 0, 0, 0xFF, 6, ord("B"), ord("C"), 2, len(cdata) + 25)
+    return header + cdata + struct.pack("<2I", zlib.crc32(data), len(data))
+
+
+def read_block(f: BinaryIO, block_offset: int) -> tuple[bytes, int]:
+    """Read the BGZF block starting at a byte offset of the compressed file
+
+    Returns:
+        tuple[bytes, int]: the uncompressed data and the byte offset of the next block
+    """
+    f.seek(block_offset)
+    header = f.read(18)
+    if len(header) < 18:
+        return b"", block_offset
+    block_size = struct.unpack("<H", header[16:18])[0] + 1
+    cdata = f.read(block_size - 18 - 8)
+    return zlib.decompress(cdata, -15), block_offset + block_size
+
+
+def split_virtual_offset(virtual_offset: int) -> tuple[int, int]:
+    """Split a virtual offset into the block offset in the compressed file and the offset within the block"""
+    return virtual_offset >> 16, virtual_offset & 0xFFFF
+
+
+def iter_lines(f: BinaryIO, virtual_offset: int) -> Iterator[bytes]:
+    """Read the lines of a BGZF file from a virtual offset, decompressing only the blocks that are read"""
+    block_offset, within_offset = split_virtual_offset(virtual_offset)
+    rest = b""
+    while True:
+        data, block_offset = read_block(f, block_offset)
+        if not data:
+            if rest:
+                yield rest
+            return
+        lines = (rest + data[within_offset:]).split(b"\n")
+        within_offset = 0
+        rest = lines.pop()
+        yield from lines
+
+
+###########################################################
+# BGZF writer
+###########################################################
+
+
+class BgzfWriter:
+    """Write text as BGZF, which can be read by gzip, and indexed by `tabix` and `bcftools`.
+    Blocks are compressed on a thread pool (zlib releases the GIL) and written in order.
+
+    Args:
+        path_output (str | Path): the output path
+        level (int, optional): compression level. Defaults to 6.
+        threads (int | None, optional): number of compression threads. Defaults to the number of CPUs.
+
+    Example:
+        >>> from csvtag.bgzf import BgzfWriter
+        >>> with BgzfWriter("example.vcf.gz") as writer:
+        ...     writer.write("##fileformat=VCFv4.2\\n")
+    """
+
+    def __init__(self, path_output: str | Path, level: int = 6, threads: int | None = None):
+        self.path_output = Path(path_output)
+        self.level = level
+        self.threads = threads or os.cpu_count() or 1
+        self._file = open(self.path_output, "wb")
+        self._buffer = bytearray()
+        self._executor = ThreadPoolExecutor(max_workers=self.threads) if self.threads > 1 else None
+        self._pending: deque[Future] = deque()
+        # Offsets of the written blocks in the compressed file
+        self._block_offsets: list[int] = []
+
+    def _write_compressed(self, block: bytes) -> None:
+        self._block_offsets.append(self._file.tell())
+        self._file.write(block)
+
+    def _write_block(self, data: bytes) -> None:
+        if self._executor is None:
+            self._write_compressed(compress_block(data, self.level))
+            return
+        self._pending.append(self._executor.submit(compress_block, data, self.level))
+        while len(self._pending) > self.threads * 4:
+            self._write_compressed(self._pending.popleft().result())
+
+    def _drain(self) -> None:
+        while self._pending:
+            self._write_compressed(self._pending.popleft().result())
+
+    def write(self, text: str | bytes | bytearray) -> None:
+        self._buffer += text.encode() if isinstance(text, str) else text
+        while len(self._buffer) >= BLOCK_SIZE:
+            self._write_block(bytes(self._buffer[:BLOCK_SIZE]))
+            del self._buffer[:BLOCK_SIZE]
+
+    def tell(self) -> int:
+        """Virtual offset of the next byte to be written: (block offset << 16) | offset within the block
+
+        The block offset is known only after the preceding blocks are compressed, so this is a barrier that
+        waits for all blocks being compressed, and calling it per line serializes the compression threads.
+        To record many offsets while writing, count the uncompressed bytes and convert them with
+        `block_offsets` after `close`, as `writer.ResultWriter` does for its QNAME index.
+        """
+        self._drain()
+        return (self._file.tell() << 16) | len(self._buffer)
+
+    @property
+    def block_offsets(self) -> list[int]:
+        """Offsets of the written blocks in the compressed file. Every block but the last holds BLOCK_SIZE bytes,
+        so an uncompressed offset `u` is at the virtual offset
+        `(block_offsets[u // BLOCK_SIZE] << 16) | (u % BLOCK_SIZE)`.
+        Unlike `tell`, this does not wait for the blocks being compressed, so offsets can be recorded while
+        writing and converted after `close`.
+        """
+        return self._block_offsets
+
+    @property
+    def closed(self) -> bool:
+        return self._file.closed
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        if self._buffer:
+            self._write_block(bytes(self._buffer))
+            self._buffer.clear()
+        self._drain()
+        if self._executor is not None:
+            self._executor.shutdown()
+        self._file.write(EOF_BLOCK)
+        self._file.close()
+
+    def __enter__(self) -> BgzfWriter:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def open_output(path_output: str | Path, threads: int | None = None, binary: bool = False):
+    """Open a text (or bytes if `binary`) output, compressed as BGZF with `threads` if the path ends with `.gz`"""
+    if str(path_output).endswith(".gz"):
+        return BgzfWriter(path_output, threads=threads)
+    return open(path_output, "wb" if binary else "w")
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import os
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+###########################################################
+# Fingerprint of input files
+###########################################################
+
+
+def fingerprint(path: str | Path, n_samples: int = 16, block_size: int = 65_536) -> str:
+    """Fast fingerprint of a file from its size, mtime and hashes of blocks sampled across the file
+
+    Args:
+        path (str | Path): a path of a file
+        n_samples (int, optional): number of sampled blocks, including the first and the last. Defaults to 16.
+        block_size (int, optional): bytes per sampled block. Defaults to 65,536.
+
+    Returns:
+        str: a hex digest that changes when the file is modified
+    """
+    stat = os.stat(path)
+    digest = hashlib.blake2b(f"{stat.st_size}:{stat.st_mtime_ns}".encode(), digest_size=16)
+    with open(path, "rb") as f:
+        if stat.st_size <= n_samples * block_size:
+            digest.update(f.read())
+        else:
+            step = (stat.st_size - block_size) // (n_samples - 1)
+            for i in range(n_samples):
+                f.seek(i * step)
+                digest.update(f.read(block_size))
+    return digest.hexdigest()
+
+
+###########################################################
+# Result cache
+###########################################################
+
+
+class ResultCache:
+    """On-disk cache of results, keyed by the input files, the csvtag version and the parameters.
+    Results are stored as gzipped TSV files, and the least recently used ones are evicted
+    when the total size exceeds `max_bytes`.
+
+    Example:
+        >>> from csvtag import call
+        >>> results = list(call("example.sam", cache_dir="csvtag_cache"))  # computed and stored
+        >>> results = list(call("example.sam", cache_dir="csvtag_cache"))  # read from the cache
+    """
+
+    def __init__(self, cache_dir: str | Path, max_bytes: int = 1 << 30):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def key(self, *paths: str | Path | None, **params) -> str:
+        """Key of the results computed from the files with the parameters by the current csvtag version"""
+        import csvtag
+
+        digest = hashlib.blake2b(f"csvtag={csvtag.__version__}".encode(), digest_size=16)
+        for path in paths:
+            digest.update(b"\0" + (fingerprint(path) if path is not None else "").encode())
+        for name, value in sorted(params.items()):
+            digest.update(f"\0{name}={value!r}".encode())
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.tsv.gz"
+
+    def get(self, key: str) -> Iterator[dict[str, str | int]] | None:
+        """Return the cached results, or None if they are not cached"""
+        path = self._path(key)
+        if not path.exists():
+            return None
+        os.utime(path)  # mark as recently used
+        return self._read(path)
+
+    def _read(self, path: Path) -> Iterator[dict[str, str | int]]:
+        with gzip.open(path, "rt") as f:
+            columns = f.readline().rstrip("\n").split("\t")
+            for line in f:
+                result = dict(zip(columns, line.rstrip("\n").split("\t")))
+                result["POS"] = int(result["POS"])
+                yield result
+
+    @contextmanager
+    def writer(self, key: str) -> Iterator[Callable[[dict[str, str | int]], None]]:
+        """Write results to the cache. They are cached only when the block finishes without errors.
+
+        Example:
+            >>> with cache.writer(key) as write:
+            ...     for result in results:
+            ...         write(result)
+        """
+        path = self._path(key)
+        path_tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        columns = None
+        f = gzip.open(path_tmp, "wt", compresslevel=6)
+
+        def write(result: dict[str, str | int]) -> None:
+            nonlocal columns
+            if columns is None:
+                columns = list(result)
+                f.write("\t".join(columns) + "\n")
+            f.write("\t".join(str(result[column]) for column in columns) + "\n")
+
+        try:
+            yield write
+        except BaseException:
+            f.close()
+            path_tmp.unlink(missing_ok=True)
+            raise
+        if columns is None:
+            f.write("QNAME\tRNAME\tPOS\tCSVTAG\n")
+        f.close()
+        os.replace(path_tmp, path)
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove the least recently used results until the cache fits in `max_bytes`"""
+        entries = [(path.stat().st_mtime_ns, path.stat().st_size, path) for path in self.cache_dir.glob("*.tsv.gz")]
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+def open_cache(cache_dir: str | Path | ResultCache | None) -> ResultCache | None:
+    if cache_dir is None or isinstance(cache_dir, ResultCache):
+        return cache_dir
+    return ResultCache(cache_dir)
@@ -1,19 +1,26 @@
 from __future__ import annotations
 
-from collections.abc import Iterator
-from itertools import groupby
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from dataclasses import replace
+from itertools import groupby, islice
 from pathlib import Path
 
-import cstag
-
-from csvtag.overlap_remover import remove_overlapped_alignments
+from csvtag.cache import ResultCache, open_cache
+from csvtag.inversion_detector import convert_to_csvtag_batch, convert_to_csvtag_sweep
+from csvtag.overlap_remover import remove_overlapped_group
+from csvtag.reference import FastaReference, open_reference
 from csvtag.sam_handler import (
+    AlignmentFilter,
     calculate_alignment_length,
     extract_alignment,
     is_forward_strand,
+    read_records,
     read_sam,
 )
 
+# Number of QNAME groups whose inversions are detected in one vectorized batch
+GROUP_CHUNK_SIZE = 10_000
+
 
 def _is_second_strand_different(first_flag: int, second_flag: int, third_flag: int) -> bool:
     if is_forward_strand(first_flag) == is_forward_strand(third_flag) and is_forward_strand(
@@ -39,6 +46,7 @@ def _is_within_bases(
 
 def convert_to_csvtag(
     alignments: list[dict[str, str | int]],
+    base_num: int = 50,
 ) -> Iterator[dict[str, str | int]]:
     idx = 0
     visited = set()
@@ -68,7 +76,7 @@ def convert_to_csvtag(
 
         is_second_strand_different = _is_second_strand_different(first_flag, second_flag, third_flag)
 
-        is_within_bases = _is_within_bases(first_end, second_pos, second_end, third_pos, base_num=50)
+        is_within_bases = _is_within_bases(first_end, second_pos, second_end, third_pos, base_num=base_num)
 
         first_cstag: str = first_align["CSTAG"]
         second_cstag: str = second_align["CSTAG"]
@@ -116,6 +124,8 @@ def convert_to_csvtag(
 def _revcomp_cstag_of_reverse_strand(
     alignments: list[dict[str, str | int]],
 ) -> list[dict[str, str]]:
+    import cstag  # imported on first use since it takes a while to import
+
     for alignment in alignments:
         if not is_forward_strand(alignment["FLAG"]):
             alignment["CSTAG"] = cstag.revcomp(alignment["CSTAG"])
@@ -128,7 +138,65 @@ def _upper_cstag(alignments: list[dict[str, str | int]]) -> list[dict[str, str |
     return alignments
 
 
-def call(path_sam: str | Path) -> Iterator[dict[str, str | int]]:
+# A stage transforms the alignments (list[dict[str, str | int]]) of a (QNAME, RNAME) group, sorted by POS
+GroupStage = Callable[[list], list]
+
+DEFAULT_STAGES: tuple[GroupStage, ...] = (
+    # Remove resequenced fragments by sequencing error
+    remove_overlapped_group,
+    # Convert all cs tags to the plus strand
+    _revcomp_cstag_of_reverse_strand,
+    # Convert all CSV tags to uppercase (Note: they will no longer be standard cs tags)
+    _upper_cstag,
+)
+
+
+def group_alignments(
+    alignments: Iterable[dict[str, str | int]], stages: Sequence[GroupStage] = DEFAULT_STAGES
+) -> Iterator[list[dict[str, str | int]]]:
+    """Sort alignments once, group them by (QNAME, RNAME) and pass each group through the stages
+
+    Args:
+        alignments (Iterable[dict[str, str | int]]): dictionalized alignments from `extract_alignment`
+        stages (Sequence[GroupStage], optional): functions applied to each group in order.
+            Defaults to DEFAULT_STAGES (overlap removal, strand normalization and uppercase).
+
+    Yields:
+        Iterator[list[dict[str, str | int]]]: alignments of a (QNAME, RNAME) processed by the stages, sorted by POS
+    """
+    alignments = sorted(alignments, key=lambda x: (x["QNAME"], x["RNAME"], x["POS"]))
+    for _, alignments_grouped in groupby(alignments, key=lambda x: (x["QNAME"], x["RNAME"])):
+        alignments_grouped = list(alignments_grouped)
+        for stage in stages:
+            alignments_grouped = stage(alignments_grouped)
+        if alignments_grouped:
+            yield alignments_grouped
+
+
+def chunk_groups(
+    groups: Iterator[list[dict[str, str | int]]], chunk_size: int = GROUP_CHUNK_SIZE
+) -> Iterator[list[list[dict[str, str | int]]]]:
+    groups = iter(groups)
+    while True:
+        chunk = list(islice(groups, chunk_size))
+        if not chunk:
+            break
+        yield chunk
+
+
+def call(
+    path_sam: str | Path,
+    reference: str | Path | FastaReference | None = None,
+    short_form: bool = False,
+    quality: bool = False,
+    cache_dir: str | Path | ResultCache | None = None,
+    base_num: int = 50,
+    alignment_filter: AlignmentFilter | None = None,
+    fraction: float = 1.0,
+    seed: int = 0,
+    combine_distance: int | None = None,
+    strand: bool = False,
+) -> Iterator[dict[str, str | int]]:
     """
     Process SAM file and yield alignment information with CSV tags.
 
@@ -138,6 +206,28 @@ def call(path_sam: str | Path) -> Iterator[dict[str, str | int]]:
 
     Args:
         path_sam (str | Path): The path to the SAM file to be processed.
+        reference (str | Path | FastaReference | None, optional): The path to the reference FASTA file.
+            It is required only for short-form cs tags (`minimap2 --cs`), whose identical sequences (`:N`)
+            are expanded where the sequence is needed. Defaults to None.
+        short_form (bool, optional): Encode identical sequences of the output as their lengths (`:N`),
+            except for inversions and reverse-strand alignments, whose csv tags are in the read orientation
+            and cannot be restored from the forward reference. Defaults to False.
+        quality (bool, optional): Add QUAL of the query bases of each csv tag, trimmed of soft clips and
+            oriented in the same way as the csv tag. See `csvtag.quality` to map it onto the tokens. Defaults to False.
+        cache_dir (str | Path | ResultCache | None, optional): A directory to cache the results. The results are
+            reused while the SAM file, the reference, the parameters and the csvtag version are unchanged.
+            Defaults to None (no cache).
+        base_num (int, optional): Maximum distance (bp) between the neighboring alignments of an inversion.
+            Defaults to 50.
+        alignment_filter (AlignmentFilter | None, optional): Conditions (RNAME, region, MAPQ, secondary
+            alignments and QNAMEs) applied to the raw SAM records before any processing. Defaults to None.
+        fraction (float, optional): Process only this fraction of reads, chosen by a hash of QNAME at parse time.
+            The same reads are chosen for the same `seed` across runs. Defaults to 1.0 (all reads).
+        seed (int, optional): Seed of the QNAME hash for `fraction`. Defaults to 0.
+        combine_distance (int | None, optional): Combine the csv tags of each (QNAME, RNAME) that are within
+            this distance (bp) into one, as `csvtag.combine_neighboring_csv_tags`. Defaults to None (not combined).
+        strand (bool, optional): Add STRAND, the orientation of the read that inversions are inverted from.
+            Defaults to False.
 
     Yields:
         Iterator[dict[str, str | int]]: An iterator of dictionaries with the following keys:
@@ -145,6 +235,8 @@ def call(path_sam: str | Path) -> Iterator[dict[str, str | int]]:
             - "RNAME" (str): Reference sequence name.
             - "POS" (int): 1-based leftmost mapping position.
             - "CSVTAG" (str): Processed csv tag.
+            - "QUAL" (str): Base qualities of the csv tag, only if `quality` is True.
+            - "STRAND" (str): Orientation of the read ("+" or "-"), only if `strand` is True.
 
     Example:
         >>> for alignment in call_csvtag("example.sam"):
@@ -153,28 +245,171 @@ def call(path_sam: str | Path) -> Iterator[dict[str, str | int]]:
         {"QNAME": "read1", "RNAME": "chr1", "POS": 150, "CSVTAG": "=TTTTT"}
         ...
     """
-    alignments: Iterator[dict[str, str | int]] = extract_alignment(read_sam(path_sam))
-    alignments = remove_overlapped_alignments(alignments)
+    reference = open_reference(reference)
+    cache = open_cache(cache_dir)
+    if fraction < 1.0:
+        alignment_filter = replace(alignment_filter or AlignmentFilter(), fraction=fraction, seed=seed)
+    if cache is None:
+        yield from _call(
+            path_sam, reference, short_form, quality, base_num, alignment_filter, combine_distance, strand
+        )
+        return
+
+    path_reference = reference.path_fasta if reference is not None else None
+    key = cache.key(
+        path_sam,
+        path_reference,
+        base_num=base_num,
+        short_form=short_form,
+        quality=quality,
+        alignment_filter=alignment_filter.cache_key() if alignment_filter is not None else None,
+        combine_distance=combine_distance,
+        strand=strand,
+    )
+    cached = cache.get(key)
+    if cached is not None:
+        yield from cached
+        return
+    with cache.writer(key) as write:
+        for result in _call(
+            path_sam, reference, short_form, quality, base_num, alignment_filter, combine_distance, strand
+        ):
+            write(result)
+            yield result
+
+
+def _call(
+    path_sam: str | Path,
+    reference: FastaReference | None,
+    short_form: bool,
+    quality: bool,
+    base_num: int,
+    alignment_filter: AlignmentFilter | None,
+    combine_distance: int | None,
+    strand: bool,
+) -> Iterator[dict[str, str | int]]:
+    yield from _call_fields(
+        read_sam(path_sam), reference, short_form, quality, base_num, alignment_filter, combine_distance, strand
+    )
+
+
+def _call_fields(
+    sam: Iterable[list[str]],
+    reference: FastaReference | None,
+    short_form: bool,
+    quality: bool,
+    base_num: int,
+    alignment_filter: AlignmentFilter | None,
+    combine_distance: int | None,
+    strand: bool,
+) -> Iterator[dict[str, str | int]]:
+    alignments: Iterator[dict[str, str | int]] = extract_alignment(sam, alignment_filter)
+    for chunk in chunk_groups(group_alignments(alignments)):
+        yield from convert_to_csvtag_batch(
+            chunk,
+            base_num=base_num,
+            reference=reference,
+            short_form=short_form,
+            quality=quality,
+            combine_distance=combine_distance,
+            strand=strand,
+        )
+
+
+def call_records(
+    records: Iterable,
+    reference: str | Path | FastaReference | None = None,
+    short_form: bool = False,
+    quality: bool = False,
+    base_num: int = 50,
+    alignment_filter: AlignmentFilter | None = None,
+    fraction: float = 1.0,
+    seed: int = 0,
+    combine_distance: int | None = None,
+    strand: bool = False,
+) -> Iterator[dict[str, str | int]]:
+    """Same as `call` for SAM records held in memory, such as the output of an aligner in the same process,
+    a socket or an already opened (compressed) file, without writing them to a SAM file
 
-    alignments = list(alignments)
-    alignments.sort(key=lambda x: (x["QNAME"], x["RNAME"], x["POS"]))
-    for (qname, rname), alignments_grouped in groupby(alignments, key=lambda x: [x["QNAME"], x["RNAME"]]):
-        alignments_grouped = list(alignments_grouped)
+    Args:
+        records (Iterable): SAM lines (bytes or str), lists or tuples of the fields of SAM lines, or
+            pysam.AlignedSegment objects, which are converted without formatting them as SAM text.
+            See `sam_handler.read_records`.
+        reference, short_form, quality, base_num, alignment_filter, fraction, seed, combine_distance, strand:
+            the same as `call`.
 
-        # Convert all cs tags to the plus strand
-        alignments_grouped = _revcomp_cstag_of_reverse_strand(alignments_grouped)
+    Yields:
+        Iterator[dict[str, str | int]]: the same dictionaries as `call`
 
-        # Convert all CSV tags to uppercase (Note: they will no longer be standard cs tags)
-        alignments_grouped = _upper_cstag(alignments_grouped)
+    Example:
+        >>> import gzip
+        >>> from csvtag.caller import call_records
+        >>> with gzip.open("example.sam.gz", "rb") as f:
+        ...     for alignment in call_records(f):
+        ...         print(alignment)
+        {"QNAME": "read1", "RNAME": "chr1", "POS": 100, "CSVTAG": "=AAAAA"}
+        ...
+    """
+    reference = open_reference(reference)
+    if fraction < 1.0:
+        alignment_filter = replace(alignment_filter or AlignmentFilter(), fraction=fraction, seed=seed)
+    yield from _call_fields(
+        read_records(records), reference, short_form, quality, base_num, alignment_filter, combine_distance, strand
+    )
+
+
+def call_sweep(
+    path_sam: str | Path,
+    base_nums: Sequence[int],
+    reference: str | Path | FastaReference | None = None,
+    short_form: bool = False,
+    quality: bool = False,
+    alignment_filter: AlignmentFilter | None = None,
+    combine_distances: Sequence[int | None] | None = None,
+) -> Iterator[dict[str, str | int]]:
+    """Generate csv tags for each of several inversion distances (`base_num`) and combine distances
+    in a single pass
 
-        if len(alignments_grouped) <= 2:
-            for alignment in alignments_grouped:
-                yield {
-                    "QNAME": qname,
-                    "RNAME": rname,
-                    "POS": alignment["POS"],
-                    "CSVTAG": alignment["CSTAG"],
-                }
-            continue
+    The SAM file is parsed and grouped once, and the spans of the alignments of each chunk are
+    computed once and shared by all the distances.
 
-        yield from convert_to_csvtag(alignments_grouped)
+    Args:
+        path_sam (str | Path): The path to the SAM file to be processed.
+        base_nums (Sequence[int]): Maximum distances (bp) between the neighboring alignments of an inversion.
+        reference (str | Path | FastaReference | None, optional): the reference FASTA file for short-form cs tags.
+            Defaults to None.
+        short_form (bool, optional): encode identical sequences as their lengths (`:N`). Defaults to False.
+        quality (bool, optional): add QUAL of the query bases of each csv tag. Defaults to False.
+        alignment_filter (AlignmentFilter | None, optional): conditions applied to the raw SAM records.
+            Defaults to None.
+        combine_distances (Sequence[int | None] | None, optional): distances (bp) to combine the csv tags of each
+            (QNAME, RNAME) within, as `combine_distance` of `call`. None in it means not combined.
+            Defaults to None (not combined, without COMBINE_DISTANCE).
+
+    Yields:
+        Iterator[dict[str, str | int]]: the same dictionaries as `call`, with "BASE_NUM" (int), the distance used,
+            and "COMBINE_DISTANCE" (int | None) if `combine_distances` is given. The results of a chunk of reads
+            are yielded for each distance in the order of `base_nums`, and of `combine_distances` within it.
+
+    Example:
+        >>> from csvtag.caller import call_sweep
+        >>> for alignment in call_sweep("example.sam", [25, 50, 100]):
+        ...     print(alignment)
+        {"BASE_NUM": 25, "QNAME": "read1", "RNAME": "chr1", "POS": 100, "CSVTAG": "=AAAAA"}
+        ...
+    """
+    reference = open_reference(reference)
+    # The distances are iterated for every chunk, so iterators are consumed once here
+    base_nums = tuple(base_nums)
+    if combine_distances is not None:
+        combine_distances = tuple(combine_distances)
+    alignments: Iterator[dict[str, str | int]] = extract_alignment(read_sam(path_sam), alignment_filter)
+    for chunk in chunk_groups(group_alignments(alignments)):
+        yield from convert_to_csvtag_sweep(
+            chunk,
+            base_nums,
+            reference=reference,
+            short_form=short_form,
+            quality=quality,
+            combine_distances=combine_distances,
+        )
@@ -1,10 +1,10 @@
 from __future__ import annotations
 
-from collections.abc import Iterator
+from collections.abc import Iterable, Iterator
 
 from csvtag.microhomology_trimmer import trim_microhomology
 from csvtag.splitter import split_by_tag
-from csvtag.to_sequence import to_sequence
+from csvtag.utils import query_length
 
 ###########################################################
 # combine_splitted_csv_tag
@@ -65,11 +65,48 @@ def combine_splitted_tags(splitted_csv_tag: Iterator[str]) -> str:
 ###########################################################
 
 
-def _get_n_lengths(csv_tags: list[str], positions: list[int]) -> list[int]:
+class _CsvTagBuilder:
+    """Build a csv tag token by token in amortized O(1) per token.
+    Contiguous identical sequences (`=`) of the same case are merged ("=ANNN" + "=CC" -> "=ANNNCC"),
+    and the csv tag string is joined only once in `build`.
+    """
+
+    def __init__(self):
+        self._operators: list[str] = []
+        self._sequences: list[list[str]] = []
+
+    def append(self, token: str, merge: bool = True) -> None:
+        if (
+            merge
+            and token[0] == "="
+            and self._operators
+            and self._operators[-1] == "="
+            and self._sequences[-1][-1][-1].islower() == token[-1].islower()
+        ):
+            self._sequences[-1].append(token[1:])
+        else:
+            self._operators.append(token[0])
+            self._sequences.append([token[1:]])
+
+    def extend(self, tokens: Iterable[str]) -> None:
+        """Append the tokens of a csv tag, merging only at the boundary with the preceding tokens"""
+        for i, token in enumerate(tokens):
+            self.append(token, merge=i == 0)
+
+    def pad_n(self, n_length: int, is_inversion: bool = False) -> None:
+        if n_length > 0:
+            self.append("=" + ("n" if is_inversion else "N") * n_length)
+
+    def build(self) -> str:
+        return "".join(operator + "".join(sequence) for operator, sequence in zip(self._operators, self._sequences))
+
+
+def _get_n_lengths(csv_tags: list[str], positions: list[int], spans: list[int] | None = None) -> list[int]:
+    if spans is None:
+        spans = [query_length(tag) for tag in csv_tags]
     n_lengths = []
-    for curr_tag, _, curr_pos, next_pos in zip(csv_tags, csv_tags[1:], positions, positions[1:]):
-        n_length = next_pos - curr_pos - len(to_sequence(curr_tag))
-        n_lengths.append(n_length)
+    for curr_span, curr_pos, next_pos in zip(spans, positions, positions[1:]):
+        n_lengths.append(next_pos - curr_pos - curr_span)
     n_lengths.append(-1)
     return n_lengths
 
@@ -89,56 +126,48 @@ def _group_tags_by_distance(csv_tags: list[str], n_lengths: list[int], distance:
     return groups
 
 
-def _padding_n(csv_tag: str, n_length: int, side: str = "left") -> str:
-    csv_tag_split = list(split_by_tag(csv_tag))
-    is_inversion = csv_tag_split[0].islower()
-    n_character = "n" if is_inversion else "N"
-
-    if side == "left":
-        if csv_tag_split[0].startswith("="):
-            return "=" + (n_character * n_length) + csv_tag.lstrip("=")
-        else:
-            return "=" + (n_character * n_length) + csv_tag
-    else:
-        if csv_tag_split[-1].startswith("="):
-            return csv_tag + (n_character * n_length)
-        else:
-            return csv_tag + "=" + (n_character * n_length)
-
-
-def _remove_contiguous_equals(n_appended: list[str]) -> list[str]:
-    """Remove contengious "=" of second tag ("=ANNN=A" -> "=ANNNA")"""
-    for i, (curr_tag, next_tag) in enumerate(zip(n_appended, n_appended[1:])):
-        if curr_tag.startswith("=") and next_tag.startswith("="):
-            if (curr_tag.islower() and next_tag.islower()) or (curr_tag.isupper() and next_tag.isupper()):
-                n_appended[i + 1] = next_tag.lstrip("=")
-    return n_appended
-
-
 def _combine_group(csv_tags: list[str], n_lengths: list[int], distance: int) -> list[str]:
     idx = 0
-    tags_n_appended = []
+    tags_combined = []
     for group_csvtags in _group_tags_by_distance(csv_tags, n_lengths, distance):
         trimmed_csvtags = trim_microhomology(group_csvtags)
-        n_length = n_lengths[idx : idx + len(trimmed_csvtags) - 1] + [-1]
-        n_appended = []
-        for tag, n in zip(trimmed_csvtags, n_length):
-            if n != -1:
-                n_appended.append(_padding_n(tag, n, side="right"))
-            else:
-                n_appended.append(tag)
-
-        n_appended = _remove_contiguous_equals(n_appended)
-
-        tags_n_appended.append(("".join(n_appended)))
+        builder = _CsvTagBuilder()
+        n_length = 0
+        is_inversion = False
+        has_tag = False
+        for i, tag in enumerate(trimmed_csvtags):
+            # A csv tag consumed by microhomology trimming is dropped, and the gaps around it are merged
+            if tag:
+                tokens = list(split_by_tag(tag))
+                if has_tag:
+                    builder.pad_n(n_length, is_inversion=is_inversion)
+                builder.extend(tokens)
+                n_length = 0
+                is_inversion = tokens[0].islower()
+                has_tag = True
+            if has_tag and i < len(trimmed_csvtags) - 1:
+                n_length += n_lengths[idx + i]
+        tags_combined.append(builder.build())
 
         idx += len(trimmed_csvtags)
 
-    return tags_n_appended
+    return tags_combined
 
 
-def combine_neighboring_csv_tags(csv_tags: list[str], positions: list[int], distance: int = 50) -> list[str]:
+def combine_neighboring_csv_tags(
+    csv_tags: list[str], positions: list[int], distance: int = 50, spans: list[int] | None = None
+) -> list[str]:
     """
+    Args:
+        csv_tags (list[str]): csv tags of a read, sorted by position
+        positions (list[int]): 1-based leftmost mapping positions of the csv tags
+        distance (int, optional): maximum gap (bp) between the csv tags to combine. Defaults to 50.
+        spans (list[int] | None, optional): lengths of the csv tags used to compute the gaps, such as
+            the reference lengths of the alignments. Defaults to the query lengths of the csv tags.
+
+    Returns:
+        list[str]: combined csv tags
+
     Examples:
         >>> csv_tags = ["=AA", "=tt", "=CC"]
         >>> positions = [1, 5, 9]
@@ -153,6 +182,21 @@ def combine_neighboring_csv_tags(csv_tags: list[str], positions: list[int], dist
     if not csv_tags or not positions or len(csv_tags) != len(positions):
         raise ValueError("csv_tags and positions must be non-empty and of the same length.")
 
-    n_lengths = _get_n_lengths(csv_tags, positions)
+    n_lengths = _get_n_lengths(csv_tags, positions, spans)
 
     return _combine_group(csv_tags, n_lengths, distance)
+
+
+def combine_neighboring_alignments(
+    csv_tags: list[str], positions: list[int], distance: int = 50, spans: list[int] | None = None
+) -> list[tuple[int, str]]:
+    """Same as `combine_neighboring_csv_tags`, but also return the position of each combined csv tag
+
+    Examples:
+        >>> combine_neighboring_alignments(["=AA", "=tt", "=CC"], [1, 5, 100], 50)
+        [(1, '=AANN=tt'), (100, '=CC')]
+    """
+    combined = combine_neighboring_csv_tags(csv_tags, positions, distance, spans)
+    n_lengths = _get_n_lengths(csv_tags, positions, spans)
+    starts = [positions[0]] + [pos for pos, n_length in zip(positions[1:], n_lengths) if n_length > distance]
+    return list(zip(starts, combined))
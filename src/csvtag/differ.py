@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import hashlib
+import heapq
+import tempfile
+from collections import Counter
+from collections.abc import Iterable, Iterator
+from itertools import groupby
+from pathlib import Path
+
+from csvtag.bgzf import open_output
+
+# Number of distinct alleles counted in memory before they are spilled to a sorted run file
+RUN_SIZE = 1_000_000
+
+###########################################################
+# Count alleles in sorted order
+###########################################################
+
+
+def allele_key(result: dict[str, str | int]) -> tuple[str, int, int, str]:
+    """Sort key of an allele: (RNAME, POS, hash of the csv tag, csv tag).
+    The hash makes most comparisons of long csv tags at the same position cheap, and the csv tag breaks ties.
+    """
+    csv_tag = result["CSVTAG"]
+    digest = hashlib.blake2b(csv_tag.encode(), digest_size=8).digest()
+    return (result["RNAME"], int(result["POS"]), int.from_bytes(digest, "big"), csv_tag)
+
+
+def _write_run(counts: Counter, directory: str) -> Path:
+    with tempfile.NamedTemporaryFile("w", dir=directory, suffix=".tsv", delete=False) as f:
+        for (rname, pos, digest, csv_tag), count in sorted(counts.items()):
+            f.write(f"{rname}\t{pos}\t{digest}\t{csv_tag}\t{count}\n")
+    return Path(f.name)
+
+
+def _read_run(path: Path) -> Iterator[tuple[tuple[str, int, int, str], int]]:
+    with open(path) as f:
+        for line in f:
+            rname, pos, digest, csv_tag, count = line.rstrip("\n").split("\t")
+            yield (rname, int(pos), int(digest), csv_tag), int(count)
+
+
+def _sum_sorted(counts: Iterable[tuple[tuple, int]]) -> Iterator[tuple[tuple, int]]:
+    for key, group in groupby(counts, key=lambda x: x[0]):
+        yield key, sum(count for _, count in group)
+
+
+def _check_sorted(results: Iterable[dict[str, str | int]]) -> Iterator[tuple[tuple, int]]:
+    previous = None
+    for result in results:
+        key = allele_key(result)
+        if previous is not None and key < previous:
+            raise ValueError("The results are not sorted by `differ.allele_key`.")
+        previous = key
+        yield key, 1
+
+
+def count_alleles(
+    results: Iterable[dict[str, str | int]], presorted: bool = False, run_size: int = RUN_SIZE
+) -> Iterator[tuple[tuple[str, int, int, str], int]]:
+    """Count identical alleles (RNAME, POS, CSVTAG) in the order of `allele_key` with bounded memory
+
+    Unsorted results are counted in memory up to `run_size` distinct alleles at a time, and each batch is
+    written to a sorted temporary file. The files are merged and their counts are summed while streaming.
+
+    Args:
+        results (Iterable[dict[str, str | int]]): dictionaries with RNAME, POS and CSVTAG
+        presorted (bool, optional): the results are already sorted by `allele_key`, so they are counted
+            while streaming without temporary files. Defaults to False.
+        run_size (int, optional): maximum number of distinct alleles held in memory. Defaults to RUN_SIZE.
+
+    Yields:
+        Iterator[tuple[tuple[str, int, int, str], int]]: the key of each allele and its number of reads
+    """
+    if presorted:
+        yield from _sum_sorted(_check_sorted(results))
+        return
+
+    with tempfile.TemporaryDirectory(prefix="csvtag_diff_") as directory:
+        paths = []
+        counts: Counter = Counter()
+        for result in results:
+            counts[allele_key(result)] += 1
+            if len(counts) >= run_size:
+                paths.append(_write_run(counts, directory))
+                counts.clear()
+        if not paths:
+            yield from sorted(counts.items())
+            return
+        last_run = sorted(counts.items())
+        counts.clear()
+        runs = [_read_run(path) for path in paths] + [iter(last_run)]
+        yield from _sum_sorted(heapq.merge(*runs, key=lambda x: x[0]))
+
+
+###########################################################
+# Diff two samples
+###########################################################
+
+
+def diff_results(
+    results_a: Iterable[dict[str, str | int]],
+    results_b: Iterable[dict[str, str | int]],
+    presorted: bool = False,
+    min_difference: int = 0,
+    run_size: int = RUN_SIZE,
+) -> Iterator[dict[str, str | int]]:
+    """Compare the alleles of two samples (e.g. treated and control) by a streaming merge join
+
+    Args:
+        results_a (Iterable[dict[str, str | int]]): results of the first sample, such as the output of `caller.call`
+        results_b (Iterable[dict[str, str | int]]): results of the second sample
+        presorted (bool, optional): both results are already sorted by `allele_key`. Defaults to False.
+        min_difference (int, optional): report only the alleles whose counts differ by at least this number.
+            Use 1 to drop the alleles shared in the same numbers. Defaults to 0 (all alleles).
+        run_size (int, optional): maximum number of distinct alleles held in memory per sample.
+            Defaults to RUN_SIZE.
+
+    Yields:
+        Iterator[dict[str, str | int]]: dictionaries with RNAME, POS, CSVTAG, COUNT_A, COUNT_B and
+            DIFF (COUNT_B - COUNT_A), sorted by `allele_key`. An allele of only one sample has a count of 0
+            in the other.
+
+    Example:
+        >>> from csvtag import call
+        >>> from csvtag.differ import diff_results
+        >>> for allele in diff_results(call("control.sam"), call("treated.sam"), min_difference=1):
+        ...     print(allele)
+        {"RNAME": "chr1", "POS": 100, "CSVTAG": "=AA=tt=AA", "COUNT_A": 0, "COUNT_B": 12, "DIFF": 12}
+        ...
+    """
+    counts_a = count_alleles(results_a, presorted=presorted, run_size=run_size)
+    counts_b = count_alleles(results_b, presorted=presorted, run_size=run_size)
+    current_a = next(counts_a, None)
+    current_b = next(counts_b, None)
+    while current_a is not None or current_b is not None:
+        if current_b is None or (current_a is not None and current_a[0] < current_b[0]):
+            key, count_a, count_b = current_a[0], current_a[1], 0
+            current_a = next(counts_a, None)
+        elif current_a is None or current_b[0] < current_a[0]:
+            key, count_a, count_b = current_b[0], 0, current_b[1]
+            current_b = next(counts_b, None)
+        else:
+            key, count_a, count_b = current_a[0], current_a[1], current_b[1]
+            current_a = next(counts_a, None)
+            current_b = next(counts_b, None)
+        if abs(count_b - count_a) < min_difference:
+            continue
+        rname, pos, _, csv_tag = key
+        yield {
+            "RNAME": rname,
+            "POS": pos,
+            "CSVTAG": csv_tag,
+            "COUNT_A": count_a,
+            "COUNT_B": count_b,
+            "DIFF": count_b - count_a,
+        }
+
+
+def write_diff(alleles: Iterable[dict[str, str | int]], path_output: str | Path, threads: int | None = None) -> None:
+    """Write the output of `diff_results` as a tab-separated file, bgzipped if the path ends with `.gz`"""
+    columns = ("RNAME", "POS", "CSVTAG", "COUNT_A", "COUNT_B", "DIFF")
+    with open_output(path_output, threads=threads) as f:
+        f.write("\t".join(columns) + "\n")
+        for allele in alleles:
+            f.write("\t".join(str(allele[column]) for column in columns) + "\n")
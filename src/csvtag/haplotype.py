@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+from csvtag.caller import DEFAULT_STAGES, chunk_groups, group_alignments
+from csvtag.inversion_detector import convert_to_csvtag_batch
+from csvtag.reference import FastaReference, open_reference
+from csvtag.sam_handler import extract_alignment, read_sam
+
+###########################################################
+# Collapse identical QNAME groups
+###########################################################
+
+
+def _signature(group: list[dict[str, str | int]]) -> tuple:
+    """Everything of a (QNAME, RNAME) group that affects its csv tags, i.e. all but QNAME"""
+    return tuple((a["RNAME"], a["POS"], a["FLAG"], a["CIGAR"], a["CSTAG"]) for a in group)
+
+
+def collapse_groups(
+    groups: Iterable[list[dict[str, str | int]]],
+) -> tuple[list[list[dict[str, str | int]]], list[list[str]]]:
+    """Collapse (QNAME, RNAME) groups with the same alignments except for QNAME into haplotypes
+
+    Args:
+        groups (Iterable[list[dict[str, str | int]]]): alignments grouped by (QNAME, RNAME) and sorted by POS
+
+    Returns:
+        tuple[list[list[dict[str, str | int]]], list[list[str]]]: a representative group of each haplotype
+            and the QNAMEs of its members, in the order of first appearance
+    """
+    haplotype_ids: dict[tuple, int] = {}
+    representatives = []
+    members = []
+    for group in groups:
+        signature = _signature(group)
+        if signature not in haplotype_ids:
+            haplotype_ids[signature] = len(representatives)
+            representatives.append(group)
+            members.append([])
+        members[haplotype_ids[signature]].append(group[0]["QNAME"])
+    return representatives, members
+
+
+def _call_representatives(
+    representatives: list[list[dict[str, str | int]]],
+    reference: FastaReference | None = None,
+    short_form: bool = False,
+) -> list[list[dict[str, str | int]]]:
+    """Call csv tags of each representative group once, keeping the results per group"""
+    groups = []
+    for group in representatives:
+        group = [dict(alignment) for alignment in group]
+        for stage in DEFAULT_STAGES:
+            group = stage(group)
+        groups.append(group)
+
+    results = []
+    for chunk in chunk_groups(groups):
+        calls = iter(convert_to_csvtag_batch(chunk, reference=reference, short_form=short_form))
+        results.extend([next(calls) for _ in group] for group in chunk)
+    return results
+
+
+def call_collapsed(
+    path_sam: str | Path,
+    reference: str | Path | FastaReference | None = None,
+    short_form: bool = False,
+) -> Iterator[dict[str, str | int]]:
+    """Same as `caller.call`, but call each haplotype once and copy the results to its member QNAMEs
+
+    The work scales with the number of distinct haplotypes instead of the number of reads,
+    which is much faster for amplicon data where most reads are identical.
+
+    Args:
+        path_sam (str | Path): The path to the SAM file to be processed.
+        reference (str | Path | FastaReference | None, optional): the reference FASTA file for short-form cs tags.
+            Defaults to None.
+        short_form (bool, optional): encode identical sequences as their lengths (`:N`). Defaults to False.
+
+    Yields:
+        Iterator[dict[str, str | int]]: the same dictionaries as `caller.call`, in the same order
+    """
+    reference = open_reference(reference)
+    groups = group_alignments(extract_alignment(read_sam(path_sam)), stages=())
+    representatives, members = collapse_groups(groups)
+    results = _call_representatives(representatives, reference=reference, short_form=short_form)
+
+    # Restore the (QNAME, RNAME) order of `caller.call`
+    order = sorted((qname, representatives[i][0]["RNAME"], i) for i, qnames in enumerate(members) for qname in qnames)
+    for qname, _, i in order:
+        for result in results[i]:
+            yield {**result, "QNAME": qname}
+
+
+def call_haplotypes(
+    path_sam: str | Path,
+    reference: str | Path | FastaReference | None = None,
+    short_form: bool = False,
+) -> Iterator[dict[str, str | int]]:
+    """Call csv tags of each haplotype once and report the number of reads supporting it
+
+    Args:
+        path_sam (str | Path): The path to the SAM file to be processed.
+        reference (str | Path | FastaReference | None, optional): the reference FASTA file for short-form cs tags.
+            Defaults to None.
+        short_form (bool, optional): encode identical sequences as their lengths (`:N`). Defaults to False.
+
+    Yields:
+        Iterator[dict[str, str | int]]: An iterator of dictionaries, the most frequent haplotypes first,
+            with the following keys:
+            - "HAPLOTYPE" (int): Haplotype identifier shared by the alignments of a haplotype.
+            - "COUNT" (int): Number of reads of the haplotype.
+            - "RNAME" (str): Reference sequence name.
+            - "POS" (int): 1-based leftmost mapping position.
+            - "CSVTAG" (str): Processed csv tag.
+
+    Example:
+        >>> from csvtag.haplotype import call_haplotypes
+        >>> for haplotype in call_haplotypes("example.sam"):
+        ...     print(haplotype)
+        {'HAPLOTYPE': 0, 'COUNT': 980, 'RNAME': 'chr1', 'POS': 100, 'CSVTAG': '=AAAAA'}
+        {'HAPLOTYPE': 1, 'COUNT': 20, 'RNAME': 'chr1', 'POS': 100, 'CSVTAG': '=AA*AG=AA'}
+    """
+    reference = open_reference(reference)
+    groups = group_alignments(extract_alignment(read_sam(path_sam)), stages=())
+    representatives, members = collapse_groups(groups)
+    results = _call_representatives(representatives, reference=reference, short_form=short_form)
+
+    order = sorted(range(len(results)), key=lambda i: len(members[i]), reverse=True)
+    for haplotype_id, i in enumerate(order):
+        for result in results[i]:
+            yield {
+                "HAPLOTYPE": haplotype_id,
+                "COUNT": len(members[i]),
+                "RNAME": result["RNAME"],
+                "POS": result["POS"],
+                "CSVTAG": result["CSVTAG"],
+            }
@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+from collections.abc import Iterator, Sequence
+from typing import TYPE_CHECKING
+
+from csvtag.combiner import combine_neighboring_alignments
+from csvtag.quality import orient_quality
+from csvtag.reference import FastaReference, expand_short_form
+from csvtag.sam_handler import calculate_alignment_length, is_forward_strand
+from csvtag.short_form import to_short_form
+
+if TYPE_CHECKING:
+    import numpy as np
+
+###########################################################
+# Detect inversions across QNAME groups
+###########################################################
+
+
+def detect_inversions(
+    flags: np.ndarray,
+    positions: np.ndarray,
+    ends: np.ndarray,
+    group_ids: np.ndarray,
+    base_num: int = 50,
+) -> np.ndarray:
+    """Detect inverted alignments of many QNAME groups at once
+
+    The alignments must be sorted by group and then by POS, as in `caller.call`.
+    A triplet (first, second, third) within the same group is an inversion when only the second
+    is on a different strand and the gaps between them are within `base_num` bases.
+    Triplets are selected greedily from left to right in the same way as `caller.convert_to_csvtag`:
+    once a triplet is selected, the triplet starting at its second alignment is skipped.
+
+    Args:
+        flags (np.ndarray): SAM FLAGs
+        positions (np.ndarray): 1-based leftmost mapping positions
+        ends (np.ndarray): positions plus the reference lengths of the alignments
+        group_ids (np.ndarray): identifiers of the QNAME groups
+        base_num (int, optional): maximum distance between neighboring alignments. Defaults to 50.
+
+    Returns:
+        np.ndarray: boolean mask of the inverted alignments
+    """
+    import numpy as np
+
+    n_alignments = len(flags)
+    is_inverted = np.zeros(n_alignments, dtype=bool)
+    if n_alignments < 3:
+        return is_inverted
+
+    is_reverse = (flags & 0x10) != 0
+
+    # Sorted groups are contiguous, so the first and third sharing a group means all three share it
+    is_same_group = group_ids[:-2] == group_ids[2:]
+    is_second_strand_different = (is_reverse[:-2] == is_reverse[2:]) & (is_reverse[:-2] != is_reverse[1:-1])
+    is_within_bases = (positions[1:-1] - ends[:-2] <= base_num) & (positions[2:] - ends[1:-1] <= base_num)
+    is_candidate = is_same_group & is_second_strand_different & is_within_bases
+
+    # Within a run of consecutive candidates, the greedy scan selects every other triplet
+    idx = np.arange(len(is_candidate))
+    is_run_start = is_candidate & ~np.concatenate(([False], is_candidate[:-1]))
+    run_start = np.maximum.accumulate(np.where(is_run_start, idx, 0))
+    is_selected = is_candidate & ((idx - run_start) % 2 == 0)
+
+    is_inverted[np.flatnonzero(is_selected) + 1] = True
+    return is_inverted
+
+
+def _alignment_arrays(
+    groups: list[list[dict[str, str | int]]],
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """FLAGs, positions, ends and group identifiers of the alignments of QNAME groups"""
+    import numpy as np
+
+    alignments = [alignment for group in groups for alignment in group]
+    n_alignments = len(alignments)
+    flags = np.fromiter((a["FLAG"] for a in alignments), dtype=np.int64, count=n_alignments)
+    positions = np.fromiter((a["POS"] for a in alignments), dtype=np.int64, count=n_alignments)
+    lengths = np.fromiter(
+        (calculate_alignment_length(a["CIGAR"]) for a in alignments), dtype=np.int64, count=n_alignments
+    )
+    group_ids = np.repeat(np.arange(len(groups)), [len(group) for group in groups])
+    return flags, positions, positions + lengths, group_ids
+
+
+def _to_results(
+    groups: list[list[dict[str, str | int]]],
+    is_inverted: np.ndarray,
+    reference: FastaReference | None = None,
+    short_form: bool = False,
+    quality: bool = False,
+    long_form: bool = False,
+    strand: bool = False,
+) -> Iterator[dict[str, str | int]]:
+    alignments = (alignment for group in groups for alignment in group)
+    for alignment, inverted in zip(alignments, is_inverted.tolist()):
+        csv_tag = alignment["CSTAG"]
+        is_forward = is_forward_strand(alignment["FLAG"])
+        # The csv tags of reverse-strand alignments are in the read orientation, so their identical sequences
+        # cannot be restored from the forward reference and are kept in the long form, as are inversions
+        if (inverted or not is_forward or long_form) and reference is not None:
+            csv_tag = expand_short_form(csv_tag, alignment["RNAME"], alignment["POS"], reference, not is_forward)
+        elif inverted and ":" in csv_tag:
+            # `:N` has no bases to lowercase, so the inversion would be lost
+            raise ValueError("reference is required for short-form cs tags of inverted alignments.")
+        if inverted:
+            csv_tag = csv_tag.lower()
+        if short_form and is_forward:
+            csv_tag = to_short_form(csv_tag)
+        result = {
+            "QNAME": alignment["QNAME"],
+            "RNAME": alignment["RNAME"],
+            "POS": alignment["POS"],
+            "CSVTAG": csv_tag,
+        }
+        if quality:
+            result["QUAL"] = orient_quality(alignment["QUAL"], alignment["CIGAR"], alignment["FLAG"])
+        if strand:
+            # An inverted alignment is on the opposite strand of the read
+            result["STRAND"] = "+" if is_forward != inverted else "-"
+        yield result
+
+
+def convert_to_csvtag_batch(
+    groups: list[list[dict[str, str | int]]],
+    base_num: int = 50,
+    reference: FastaReference | None = None,
+    short_form: bool = False,
+    quality: bool = False,
+    combine_distance: int | None = None,
+    strand: bool = False,
+) -> Iterator[dict[str, str | int]]:
+    """Vectorized version of `caller.convert_to_csvtag` over many QNAME groups
+
+    Args:
+        groups (list[list[dict[str, str | int]]]): alignments grouped by (QNAME, RNAME) and sorted by POS
+        base_num (int, optional): maximum distance between neighboring alignments. Defaults to 50.
+        reference (FastaReference | None, optional): the reference genome to expand short-form (`:N`) cs tags
+            of inverted alignments, which need their sequence to be lowercased, and of reverse-strand alignments,
+            which are in the read orientation. Defaults to None.
+        short_form (bool, optional): encode identical sequences as their lengths (`:N`). Defaults to False.
+        quality (bool, optional): add QUAL of the query bases of the csv tag. Defaults to False.
+        combine_distance (int | None, optional): combine the csv tags of each group that are within this distance
+            by `combiner.combine_neighboring_csv_tags`. Short-form cs tags are expanded with `reference` first,
+            since trimming microhomologies needs their sequences. Defaults to None (not combined).
+        strand (bool, optional): add STRAND, the orientation of the read ("+" or "-") that the csv tag
+            is inverted from. Defaults to False.
+
+    Yields:
+        Iterator[dict[str, str | int]]: dictionaries with QNAME, RNAME, POS and CSVTAG (and QUAL and STRAND)
+    """
+    if not any(groups):
+        return
+    flags, positions, ends, group_ids = _alignment_arrays(groups)
+    is_inverted = detect_inversions(flags, positions, ends, group_ids, base_num=base_num)
+    if combine_distance is None:
+        yield from _to_results(
+            groups, is_inverted, reference=reference, short_form=short_form, quality=quality, strand=strand
+        )
+        return
+
+    if quality:
+        raise ValueError("QUAL is not available for combined csv tags.")
+    # Combine csv tags in the long form, since trimming microhomologies needs their sequences,
+    # reusing the reference spans of the alignments for the gaps
+    results = list(_to_results(groups, is_inverted, reference=reference, long_form=True, strand=strand))
+    yield from _combine_results(
+        groups, results, _combine_arrays(flags, positions, ends, is_inverted), short_form, combine_distance, strand
+    )
+
+
+def _combine_arrays(
+    flags: np.ndarray, positions: np.ndarray, ends: np.ndarray, is_inverted: np.ndarray
+) -> tuple[list[int], list[bool]]:
+    """Reference spans of the alignments, and whether each alignment is forward or inverted"""
+    return (ends - positions).tolist(), (((flags & 0x10) == 0) | is_inverted).tolist()
+
+
+def _combine_results(
+    groups: list[list[dict[str, str | int]]],
+    results: list[dict[str, str | int]],
+    arrays: tuple[list[int], list[bool]],
+    short_form: bool,
+    combine_distance: int,
+    strand: bool,
+) -> Iterator[dict[str, str | int]]:
+    """Combine the long-form results of the alignments of each group"""
+    spans, is_forward_or_inverted = arrays
+    idx = 0
+    for group in groups:
+        if not group:
+            continue
+        results_group = results[idx : idx + len(group)]
+        csv_tags = [result["CSVTAG"] for result in results_group]
+        if any(":" in csv_tag for csv_tag in csv_tags):
+            raise ValueError("reference is required to combine short-form cs tags.")
+        # As in `_to_results`, csv tags including reverse-strand alignments are kept in the long form
+        is_shortened = short_form and all(is_forward_or_inverted[idx : idx + len(group)])
+        combined = combine_neighboring_alignments(
+            csv_tags,
+            [result["POS"] for result in results_group],
+            combine_distance,
+            spans[idx : idx + len(group)],
+        )
+        idx += len(group)
+        for pos, csv_tag in combined:
+            result = {
+                "QNAME": results_group[0]["QNAME"],
+                "RNAME": results_group[0]["RNAME"],
+                "POS": pos,
+                "CSVTAG": to_short_form(csv_tag) if is_shortened else csv_tag,
+            }
+            if strand:
+                result["STRAND"] = results_group[0]["STRAND"]
+            yield result
+
+
+def convert_to_csvtag_sweep(
+    groups: list[list[dict[str, str | int]]],
+    base_nums: Sequence[int],
+    reference: FastaReference | None = None,
+    short_form: bool = False,
+    quality: bool = False,
+    combine_distances: Sequence[int | None] | None = None,
+) -> Iterator[dict[str, str | int]]:
+    """Same as `convert_to_csvtag_batch` for each of several `base_num` (and `combine_distance`),
+    sharing the spans of the alignments
+
+    Yields:
+        Iterator[dict[str, str | int]]: dictionaries with BASE_NUM, QNAME, RNAME, POS and CSVTAG (and QUAL),
+            for each `base_num` in order. With `combine_distances`, also COMBINE_DISTANCE, for each
+            `combine_distance` in order within each `base_num`.
+    """
+    if not any(groups):
+        return
+    arrays = _alignment_arrays(groups)
+    flags, positions, ends, _ = arrays
+    for base_num in base_nums:
+        is_inverted = detect_inversions(*arrays, base_num=base_num)
+        if combine_distances is None:
+            for result in _to_results(
+                groups, is_inverted, reference=reference, short_form=short_form, quality=quality
+            ):
+                yield {"BASE_NUM": base_num, **result}
+            continue
+
+        # The long-form results and the spans are shared by all the combine distances
+        results_long = None
+        for combine_distance in combine_distances:
+            if combine_distance is None:
+                results = _to_results(groups, is_inverted, reference=reference, short_form=short_form, quality=quality)
+            else:
+                if quality:
+                    raise ValueError("QUAL is not available for combined csv tags.")
+                if results_long is None:
+                    results_long = list(_to_results(groups, is_inverted, reference=reference, long_form=True))
+                    combine_arrays = _combine_arrays(flags, positions, ends, is_inverted)
+                results = _combine_results(groups, results_long, combine_arrays, short_form, combine_distance, False)
+            for result in results:
+                yield {"BASE_NUM": base_num, "COMBINE_DISTANCE": combine_distance, **result}
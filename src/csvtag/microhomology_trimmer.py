@@ -1,7 +1,9 @@
 from __future__ import annotations
 
 from csvtag.splitter import split_by_nucleotide as split
+from csvtag.splitter import split_by_tag
 from csvtag.to_sequence import to_sequence
+from csvtag.utils import token_reference_length
 
 
 def _get_length_of_microhomology(curr_sequence: str, next_sequence: str) -> int:
@@ -19,6 +21,33 @@ def _get_length_of_microhomology(curr_sequence: str, next_sequence: str) -> int:
 ###########################################################
 
 
+def _trim_leading_nucleotides(csv_tag: str, n_nucleotides: int) -> str:
+    """Remove the first `n_nucleotides` elements of `split_by_nucleotide` from a csv tag.
+    Only the leading tokens that are trimmed are split by nucleotide, and the rest is kept as it is.
+    """
+    from csvtag.combiner import combine_splitted_tags
+
+    if "~" in csv_tag or ":" in csv_tag:
+        return combine_splitted_tags(list(split(csv_tag))[n_nucleotides:])
+    if n_nucleotides == 0:
+        return csv_tag
+
+    tokens = list(split_by_tag(csv_tag))
+    idx = 0
+    count = 0
+    while idx < len(tokens) and (count < n_nucleotides or tokens[idx - 1][0] == "+"):
+        # Each reference base is an element of `split_by_nucleotide`, and insertions are attached to the next
+        count += token_reference_length(tokens[idx])
+        idx += 1
+
+    prefix = "".join(tokens[:idx])
+    rest = "".join(tokens[idx:])
+    splitted_prefix = list(split(prefix))[n_nucleotides:]
+    if not splitted_prefix:
+        return rest
+    return combine_splitted_tags(iter(splitted_prefix)) + rest
+
+
 def trim_microhomology(csv_tags: list[str]) -> list[str]:
     """Trim microhomology from csv tags
 
@@ -26,8 +55,6 @@ def trim_microhomology(csv_tags: list[str]) -> list[str]:
     trim_microhomology(csv_tags)
     ["=AAATTT", "=CCC"]
     """
-    from csvtag.combiner import combine_splitted_tags
-
     csv_tags_trimmed = [csv_tags[0]]
     visited = {0}
     for i in range(len(csv_tags) - 1):
@@ -38,8 +65,7 @@ def trim_microhomology(csv_tags: list[str]) -> list[str]:
             to_sequence(curr_csvtag.upper()), to_sequence(next_csvtag.upper())
         )
 
-        csvtag_trimmed = list(split(next_csvtag))[len_microhomology:]
-        next_csvtag = combine_splitted_tags(csvtag_trimmed)
+        next_csvtag = _trim_leading_nucleotides(next_csvtag, len_microhomology)
 
         if i not in visited:
             csv_tags_trimmed.append(curr_csvtag)
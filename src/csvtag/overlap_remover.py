@@ -47,7 +47,7 @@ def _remove_duplicates(
     list_of_dicts: list[dict[str, str | int]],
 ) -> list[dict[str, str | int]]:
     """
-    Remove duplicate dictionaries from a list of dictionaries.
+    Remove duplicate dictionaries from a list of dictionaries, preserving the order.
 
     Args:
         list_of_dicts (list[dict[str, Any]]): A list of dictionaries.
@@ -55,8 +55,41 @@ def _remove_duplicates(
     Returns:
         list[dict[str, Any]]: A list of dictionaries with duplicates removed.
     """
-    unique_dicts = list({tuple(sorted(d.items())) for d in list_of_dicts})
-    return [dict(t) for t in unique_dicts]
+    return list({tuple(sorted(d.items())): d for d in list_of_dicts}.values())
+
+
+def remove_overlapped_group(alignments: list[dict[str, str | int]]) -> list[dict[str, str | int]]:
+    """Remove non-microhomologic overlapped reads of a (QNAME, RNAME) group.
+    See `remove_overlapped_alignments` for details.
+
+    Args:
+        alignments (list[dict[str, str | int]]): disctionalized alignments of a (QNAME, RNAME), sorted by POS
+
+    Returns:
+        list[dict[str, str | int]]: disctionalized alignments without overlaped reads, sorted by POS
+    """
+    if len(alignments) == 1:
+        return alignments
+
+    for i, (current_alignment, next_alignment) in enumerate(zip(alignments, alignments[1:])):
+        alignments_overlapped = OverlappedAlignment(
+            curr_cigar=current_alignment["CIGAR"],
+            next_cigar=next_alignment["CIGAR"],
+            curr_cstag=current_alignment["CSTAG"],
+            next_cstag=next_alignment["CSTAG"],
+            curr_pos=current_alignment["POS"],
+            next_pos=next_alignment["POS"],
+        )
+
+        if _is_overlapped(alignments_overlapped):
+            curr_length = calculate_alignment_length(alignments_overlapped.curr_cigar)
+            next_length = calculate_alignment_length(alignments_overlapped.next_cigar)
+            if curr_length >= next_length:
+                alignments[i + 1] = current_alignment
+            else:
+                alignments[i] = next_alignment
+
+    return _remove_duplicates(alignments)
 
 
 def remove_overlapped_alignments(
@@ -81,27 +114,4 @@ def remove_overlapped_alignments(
 
     alignments.sort(key=lambda x: [x["QNAME"], x["RNAME"], x["POS"]])
     for _, alignments in groupby(alignments, lambda x: [x["QNAME"], x["RNAME"]]):
-        alignments = list(alignments)
-        if len(alignments) == 1:
-            yield from (alignment for alignment in alignments)
-            continue
-
-        for i, (current_alignment, next_alignment) in enumerate(zip(alignments, alignments[1:])):
-            alignments_overlapped = OverlappedAlignment(
-                curr_cigar=current_alignment["CIGAR"],
-                next_cigar=next_alignment["CIGAR"],
-                curr_cstag=current_alignment["CSTAG"],
-                next_cstag=next_alignment["CSTAG"],
-                curr_pos=current_alignment["POS"],
-                next_pos=next_alignment["POS"],
-            )
-
-            if _is_overlapped(alignments_overlapped):
-                curr_length = calculate_alignment_length(alignments_overlapped.curr_cigar)
-                next_length = calculate_alignment_length(alignments_overlapped.next_cigar)
-                if curr_length >= next_length:
-                    alignments[i + 1] = current_alignment
-                else:
-                    alignments[i] = next_alignment
-
-        yield from (alignment for alignment in _remove_duplicates(alignments))
+        yield from remove_overlapped_group(list(alignments))
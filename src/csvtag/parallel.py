@@ -0,0 +1,340 @@
+from __future__ import annotations
+
+import os
+import re
+import shutil
+from collections import deque
+from collections.abc import Callable, Iterator, Sequence
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+
+from csvtag.caller import chunk_groups, group_alignments
+from csvtag.inversion_detector import convert_to_csvtag_batch
+from csvtag.reference import FastaReference, open_reference
+from csvtag.sam_handler import AlignmentFilter, extract_alignment, read_sam_range, split_sam_by_qname
+from csvtag.writer import ResultWriter, format_row
+
+# Approximate size of a SAM file parsed by each task of `call_many`
+CHUNK_BYTES = 1 << 26
+
+# A lowercase base marks an inversion, also within csv tags combined with the flanking alignments
+_INVERTED_BASE = re.compile(r"[acgtn]")
+
+# Shared memory is a file system on Linux, checked for free space before results are written into it
+SHM_DIR = "/dev/shm"
+
+###########################################################
+# Shared-memory transport of result rows
+###########################################################
+
+
+@dataclass
+class _SharedRows:
+    """Rows of a result file written by a worker into a shared-memory segment of the same size"""
+
+    name: str
+    size: int
+
+
+def _has_shared_memory(size: int) -> bool:
+    if not os.path.isdir(SHM_DIR):
+        return True
+    # Writing into a full /dev/shm (64 MiB by default in Docker) kills the process by SIGBUS,
+    # so leave room for the other tasks in flight
+    return shutil.disk_usage(SHM_DIR).free > 4 * size
+
+
+def _to_shared_rows(results: list[dict[str, str | int]]) -> _SharedRows | list[dict[str, str | int]]:
+    """Format results as rows of a result file in a new shared-memory segment sized to them.
+    The results are returned as they are (to be pickled) if they are empty or not ASCII,
+    or if there is not enough shared memory.
+    """
+    text = "".join(map(format_row, results))
+    data = text.encode()
+    if not data or len(data) != len(text) or not _has_shared_memory(len(data)):
+        return results
+    shm = SharedMemory(create=True, size=len(data))
+    shm.buf[: len(data)] = data
+    shm.close()
+    return _SharedRows(shm.name, len(data))
+
+
+def _write_shared_rows(rows: _SharedRows, writer: ResultWriter) -> None:
+    """Write rows from shared memory to a result file without building dictionaries, and free the memory"""
+    shm = SharedMemory(name=rows.name)
+    try:
+        with shm.buf[: rows.size] as buf:
+            writer.write_rows(str(buf, "ascii"))
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+###########################################################
+# Worker
+###########################################################
+
+
+def _convert_range(
+    path_sam: str | Path,
+    start: int,
+    end: int,
+    reference: FastaReference | None = None,
+    short_form: bool = False,
+    quality: bool = False,
+    base_num: int = 50,
+    alignment_filter: AlignmentFilter | None = None,
+    combine_distance: int | None = None,
+) -> tuple[int, list[dict[str, str | int]]]:
+    """Return the number of QNAME groups in a byte range of a SAM file and their results"""
+    alignments = extract_alignment(read_sam_range(path_sam, start, end), alignment_filter)
+    reads = 0
+    results = []
+    for chunk in chunk_groups(group_alignments(alignments)):
+        reads += len(chunk)
+        results.extend(
+            convert_to_csvtag_batch(
+                chunk,
+                base_num=base_num,
+                reference=reference,
+                short_form=short_form,
+                quality=quality,
+                combine_distance=combine_distance,
+            )
+        )
+    return reads, results
+
+
+def _call_range(
+    path_sam: str | Path,
+    start: int,
+    end: int,
+    reference: FastaReference | None = None,
+    short_form: bool = False,
+    quality: bool = False,
+    base_num: int = 50,
+    alignment_filter: AlignmentFilter | None = None,
+    combine_distance: int | None = None,
+) -> list[dict[str, str | int]]:
+    _, results = _convert_range(
+        path_sam, start, end, reference, short_form, quality, base_num, alignment_filter, combine_distance
+    )
+    return results
+
+
+def _call_range_with_counts(
+    path_sam: str | Path,
+    start: int,
+    end: int,
+    reference: FastaReference | None = None,
+    short_form: bool = False,
+    quality: bool = False,
+    base_num: int = 50,
+    alignment_filter: AlignmentFilter | None = None,
+    combine_distance: int | None = None,
+    shared_memory: bool = False,
+) -> tuple[dict[str, int], _SharedRows | list[dict[str, str | int]]]:
+    reads, results = _convert_range(
+        path_sam, start, end, reference, short_form, quality, base_num, alignment_filter, combine_distance
+    )
+    counts = {
+        "reads": reads,
+        "alignments": len(results),
+        "inversions": sum(1 for result in results if _INVERTED_BASE.search(result["CSVTAG"])),
+    }
+    return counts, _to_shared_rows(results) if shared_memory else results
+
+
+###########################################################
+# Call csv tags of many SAM files
+###########################################################
+
+
+def _open_sink(sink: str | Path | Callable) -> ResultWriter | Callable:
+    """Return a ResultWriter for an output path, or the function receiving each result"""
+    if callable(sink):
+        return sink
+    return ResultWriter(sink)
+
+
+def call_many(
+    paths_sam: Sequence[str | Path],
+    sinks: Sequence[str | Path | Callable],
+    workers: int | None = None,
+    chunk_bytes: int = CHUNK_BYTES,
+    reference: str | Path | FastaReference | None = None,
+    short_form: bool = False,
+    quality: bool = False,
+    base_num: int = 50,
+    alignment_filter: AlignmentFilter | None = None,
+    combine_distance: int | None = None,
+    shared_memory: bool = True,
+) -> dict[str, dict[str, int]]:
+    """Generate csv tags of many SAM files with one shared worker pool
+
+    All files are split into byte ranges that do not split QNAME groups, and the ranges of every file are
+    scheduled on the same pool, the largest files first. Each worker parses and calls its own range directly
+    from the memory-mapped file, as in `call_parallel`, so the main process only writes the results.
+    The results are streamed to the sink of each file in the order of the byte ranges, and sorted as in
+    `caller.call` within each range. The alignments of a QNAME must be contiguous in the SAM files.
+
+    Args:
+        paths_sam (Sequence[str | Path]): paths of the SAM files
+        sinks (Sequence[str | Path | Callable]): an output path or a function receiving each result, per SAM file
+        workers (int | None, optional): number of worker processes. Defaults to the number of CPUs.
+        chunk_bytes (int, optional): approximate size (bytes) of the SAM file per task. Defaults to 64 MiB.
+        reference (str | Path | FastaReference | None, optional): the reference FASTA file for short-form cs tags.
+            Defaults to None.
+        short_form (bool, optional): encode identical sequences as their lengths (`:N`). Defaults to False.
+        quality (bool, optional): add QUAL of the query bases of each csv tag. Defaults to False.
+        base_num (int, optional): maximum distance (bp) between the neighboring alignments of an inversion.
+            Defaults to 50.
+        alignment_filter (AlignmentFilter | None, optional): conditions applied to the raw SAM records.
+            Defaults to None.
+        combine_distance (int | None, optional): combine the csv tags of each (QNAME, RNAME) within this distance
+            (bp) in the workers. Defaults to None (not combined).
+        shared_memory (bool, optional): for output paths, the workers format the rows of the result file and
+            send them back through a shared-memory segment sized to them, which the main process copies to the
+            file without unpickling dictionaries. Results are pickled when there is not enough shared memory.
+            Defaults to True.
+
+    Returns:
+        dict[str, dict[str, int]]: number of reads, alignments and inverted alignments per SAM file
+
+    Example:
+        >>> from csvtag.parallel import call_many
+        >>> stats = call_many(["sample1.sam", "sample2.sam"], ["sample1.tsv", "sample2.tsv"])
+        >>> stats["sample1.sam"]
+        {'reads': 1000, 'alignments': 1200, 'inversions': 10}
+    """
+    if len(paths_sam) != len(sinks):
+        raise ValueError("paths_sam and sinks must be of the same length.")
+
+    workers = workers or os.cpu_count() or 1
+    reference = open_reference(reference)
+    max_pending = workers * 4
+    if shared_memory and os.name == "posix":
+        # Start the resource tracker before the workers are forked, so that they share it. Otherwise each worker
+        # starts its own tracker, which warns about the segments unlinked by the main process and unlinks the
+        # segments not read yet when the worker exits.
+        resource_tracker.ensure_running()
+
+    order = sorted(range(len(paths_sam)), key=lambda i: os.path.getsize(paths_sam[i]), reverse=True)
+    stats = {str(path_sam): {"reads": 0, "alignments": 0, "inversions": 0} for path_sam in paths_sam}
+    opened = [_open_sink(sink) for sink in sinks]
+
+    # Futures are consumed in submission order, which keeps the results of each file in order
+    pending: deque[tuple[int, Future]] = deque()
+
+    def consume_oldest() -> None:
+        i, future = pending.popleft()
+        counts, results = future.result()
+        for key, count in counts.items():
+            stats[str(paths_sam[i])][key] += count
+        if isinstance(results, _SharedRows):
+            _write_shared_rows(results, opened[i])
+            return
+        for result in results:
+            opened[i](result)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for i in order:
+                is_shared = shared_memory and isinstance(opened[i], ResultWriter)
+                n_chunks = max(1, -(-os.path.getsize(paths_sam[i]) // chunk_bytes))
+                for start, end in split_sam_by_qname(paths_sam[i], n_chunks):
+                    future = executor.submit(
+                        _call_range_with_counts,
+                        paths_sam[i],
+                        start,
+                        end,
+                        reference,
+                        short_form,
+                        quality,
+                        base_num,
+                        alignment_filter,
+                        combine_distance,
+                        is_shared,
+                    )
+                    pending.append((i, future))
+                    while len(pending) > max_pending:
+                        consume_oldest()
+            while pending:
+                consume_oldest()
+    finally:
+        # Free the shared memory of the tasks not consumed because of an error
+        for _, future in pending:
+            if not future.cancel() and future.exception() is None and isinstance(future.result()[1], _SharedRows):
+                SharedMemory(name=future.result()[1].name).unlink()
+        for sink, writer in zip(sinks, opened):
+            if not callable(sink):
+                writer.close()
+
+    return stats
+
+
+###########################################################
+# Call csv tags of a large SAM file
+###########################################################
+
+
+def call_parallel(
+    path_sam: str | Path,
+    workers: int | None = None,
+    n_chunks: int | None = None,
+    reference: str | Path | FastaReference | None = None,
+    short_form: bool = False,
+    quality: bool = False,
+    base_num: int = 50,
+    alignment_filter: AlignmentFilter | None = None,
+    combine_distance: int | None = None,
+) -> Iterator[dict[str, str | int]]:
+    """Generate csv tags of a large SAM file by parsing byte ranges of it in parallel
+
+    The SAM file is memory-mapped and split into byte ranges that do not split QNAME groups,
+    and each worker parses and calls its own range directly from the mapped file.
+    The alignments of a QNAME must be contiguous in the SAM file, as in the output of minimap2.
+
+    Args:
+        path_sam (str | Path): The path to the SAM file to be processed.
+        workers (int | None, optional): number of worker processes. Defaults to the number of CPUs.
+        n_chunks (int | None, optional): number of byte ranges. Defaults to four times the number of workers.
+        reference (str | Path | FastaReference | None, optional): the reference FASTA file for short-form cs tags.
+            Defaults to None.
+        short_form (bool, optional): encode identical sequences as their lengths (`:N`). Defaults to False.
+        quality (bool, optional): add QUAL of the query bases of each csv tag. Defaults to False.
+        base_num (int, optional): maximum distance (bp) between the neighboring alignments of an inversion.
+            Defaults to 50.
+        alignment_filter (AlignmentFilter | None, optional): conditions applied to the raw SAM records.
+            Defaults to None.
+        combine_distance (int | None, optional): combine the csv tags of each (QNAME, RNAME) within this distance
+            (bp) in the workers. Defaults to None (not combined).
+
+    Yields:
+        Iterator[dict[str, str | int]]: the same dictionaries as `caller.call`, in the order of the byte ranges
+    """
+    workers = workers or os.cpu_count() or 1
+    reference = open_reference(reference)
+    ranges = split_sam_by_qname(path_sam, n_chunks or workers * 4)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                _call_range,
+                path_sam,
+                start,
+                end,
+                reference,
+                short_form,
+                quality,
+                base_num,
+                alignment_filter,
+                combine_distance,
+            )
+            for start, end in ranges
+        ]
+        for future in futures:
+            yield from future.result()
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from csvtag.sam_handler import is_forward_strand, trim_softclip
+from csvtag.splitter import split_by_tag
+from csvtag.utils import token_query_length
+
+if TYPE_CHECKING:
+    import numpy as np
+
+###########################################################
+# Orient QUAL to csv tags
+###########################################################
+
+
+def orient_quality(qual: str, cigar: str, flag: int) -> str:
+    """Trim soft-clipped bases from QUAL and reverse it for the reverse strand,
+    in the same way as the cs tag is converted into the csv tag by `caller.call`
+
+    Args:
+        qual (str): QUAL of a SAM alignment, or "*" if it is not available
+        cigar (str): CIGAR of the alignment
+        flag (int): FLAG of the alignment
+
+    Returns:
+        str: QUAL corresponding to the query bases of the csv tag, or "*" if it is not available
+    """
+    if qual == "*":
+        return qual
+    qual = trim_softclip(qual, cigar)
+    return qual if is_forward_strand(flag) else qual[::-1]
+
+
+###########################################################
+# Base quality per token
+###########################################################
+
+
+@dataclass
+class TokenQuality:
+    """Phred base qualities of the tokens of a csv tag.
+    The qualities of `tokens[i]` are `phred[offsets[i] : offsets[i + 1]]`.
+    """
+
+    tokens: list[str]
+    phred: np.ndarray
+    offsets: np.ndarray
+
+    def of(self, i: int) -> np.ndarray:
+        return self.phred[self.offsets[i] : self.offsets[i + 1]]
+
+    def mean(self) -> np.ndarray:
+        """Mean quality of each token, or NaN for tokens without query bases (deletions and introns)"""
+        import numpy as np
+
+        lengths = np.diff(self.offsets)
+        # Pad a zero so that tokens at the end of the query are valid indices of reduceat
+        sums = np.add.reduceat(np.append(self.phred, 0).astype(np.int64), self.offsets[:-1])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(lengths > 0, sums / lengths, np.nan)
+
+
+def attach_quality(csv_tag: str, qual: str) -> TokenQuality:
+    """Map QUAL oriented by `orient_quality` onto the tokens of a csv tag
+
+    Args:
+        csv_tag (str): a csv tag
+        qual (str): QUAL of the query bases of the csv tag (Phred+33)
+
+    Returns:
+        TokenQuality: the tokens, Phred qualities as a uint8 array and the offsets of each token
+
+    Example:
+        >>> from csvtag.quality import attach_quality
+        >>> token_quality = attach_quality("=AA*AG+TT-C=A", "IIA+5I")
+        >>> token_quality.tokens
+        ['=AA', '*AG', '+TT', '-C', '=A']
+        >>> token_quality.mean().tolist()
+        [40.0, 32.0, 15.0, nan, 40.0]
+    """
+    import numpy as np  # imported on first use since it takes a while to import
+
+    if qual == "*":
+        raise ValueError("QUAL is not available.")
+    tokens = list(split_by_tag(csv_tag))
+    offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+    np.cumsum([token_query_length(tag) for tag in tokens], out=offsets[1:])
+    if offsets[-1] != len(qual):
+        raise ValueError(f"The length of QUAL ({len(qual)}) does not match the csv tag ({offsets[-1]}).")
+    phred = np.frombuffer(qual.encode(), dtype=np.uint8) - 33
+    return TokenQuality(tokens, phred, offsets)
+
+
+###########################################################
+# Quality of variants and inversions
+###########################################################
+
+
+def variant_qualities(csv_tag: str, qual: str) -> list[tuple[str, float]]:
+    """Mean quality of each substitution and insertion of a csv tag
+
+    Example:
+        >>> from csvtag.quality import variant_qualities
+        >>> variant_qualities("=AA*AG+TT-C=A", "IIA+5I")
+        [('*AG', 32.0), ('+TT', 15.0)]
+    """
+    token_quality = attach_quality(csv_tag, qual)
+    means = token_quality.mean().tolist()
+    return [(tag, mean) for tag, mean in zip(token_quality.tokens, means) if tag[0] in "*+"]
+
+
+def inversion_qualities(csv_tag: str, qual: str) -> list[tuple[str, float]]:
+    """Mean quality of each inverted segment of a csv tag, or NaN for a segment without query bases
+
+    Example:
+        >>> from csvtag.quality import inversion_qualities
+        >>> inversion_qualities("=AA=aa*ag=AA", "II555II")
+        [('=aa*ag', 20.0)]
+    """
+    import numpy as np
+
+    token_quality = attach_quality(csv_tag, qual)
+    qualities = []
+    segment: list[int] = []
+    for i, tag in enumerate(token_quality.tokens + ["="]):
+        if tag[-1].islower():
+            segment.append(i)
+            continue
+        if segment:
+            phred = token_quality.phred[token_quality.offsets[segment[0]] : token_quality.offsets[segment[-1] + 1]]
+            mean = float(phred.mean()) if len(phred) else np.nan
+            qualities.append(("".join(token_quality.tokens[j] for j in segment), mean))
+            segment = []
+    return qualities
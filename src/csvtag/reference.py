@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import mmap
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+from csvtag.revcomp import revcomp
+from csvtag.splitter import split_by_tag
+from csvtag.utils import token_reference_length
+
+###########################################################
+# Indexed FASTA reader
+###########################################################
+
+
+@dataclass
+class FaiEntry:
+    length: int
+    offset: int
+    line_bases: int
+    line_width: int
+
+
+def read_fai(path_fai: str | Path) -> dict[str, FaiEntry]:
+    """Read a FASTA index (.fai) generated by `samtools faidx`"""
+    fai = {}
+    with open(path_fai) as f:
+        for line in f:
+            name, length, offset, line_bases, line_width = line.rstrip("\n").split("\t")[:5]
+            fai[name] = FaiEntry(int(length), int(offset), int(line_bases), int(line_width))
+    return fai
+
+
+def index_fasta(path_fasta: str | Path) -> dict[str, FaiEntry]:
+    """Build the same index as `samtools faidx` for a FASTA file without a .fai file"""
+    fai = {}
+    name = None
+    offset = 0
+    with open(path_fasta, "rb") as f:
+        for line in f:
+            if line.startswith(b">"):
+                name = line[1:].split()[0].decode()
+                fai[name] = FaiEntry(0, offset + len(line), 0, 0)
+            elif name is not None:
+                entry = fai[name]
+                if entry.line_bases == 0:
+                    entry.line_bases = len(line.rstrip(b"\r\n"))
+                    entry.line_width = len(line)
+                entry.length += len(line.rstrip(b"\r\n"))
+            offset += len(line)
+    return fai
+
+
+class FastaReference:
+    """Random access to a FASTA file through its .fai index and a memory map.
+    Fetched sequences are cached by fixed-size chunks in an LRU cache.
+
+    Example:
+        >>> from csvtag.reference import FastaReference
+        >>> reference = FastaReference("reference.fa")
+        >>> reference.fetch("chr1", 0, 10)
+        'ACGTACGTAC'
+    """
+
+    def __init__(self, path_fasta: str | Path, chunk_size: int = 65_536, cache_size: int = 256):
+        self.path_fasta = Path(path_fasta)
+        self.chunk_size = chunk_size
+        self.cache_size = cache_size
+        path_fai = Path(f"{self.path_fasta}.fai")
+        self.fai = read_fai(path_fai) if path_fai.exists() else index_fasta(self.path_fasta)
+        self._open()
+
+    def _open(self) -> None:
+        with open(self.path_fasta, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._fetch_chunk = lru_cache(maxsize=self.cache_size)(self._read_chunk)
+
+    def __getstate__(self) -> dict:
+        # A memory map cannot be pickled, so worker processes map the file again
+        return {
+            "path_fasta": self.path_fasta,
+            "chunk_size": self.chunk_size,
+            "cache_size": self.cache_size,
+            "fai": self.fai,
+        }
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._open()
+
+    def _byte_offset(self, entry: FaiEntry, position: int) -> int:
+        return entry.offset + (position // entry.line_bases) * entry.line_width + position % entry.line_bases
+
+    def _read_chunk(self, rname: str, idx_chunk: int) -> str:
+        entry = self.fai[rname]
+        start = idx_chunk * self.chunk_size
+        end = min(start + self.chunk_size, entry.length)
+        if start >= end:
+            return ""
+        chunk = self._mm[self._byte_offset(entry, start) : self._byte_offset(entry, end - 1) + 1]
+        return chunk.replace(b"\n", b"").replace(b"\r", b"").decode().upper()
+
+    def fetch(self, rname: str, start: int, end: int) -> str:
+        """Fetch the reference sequence of [start, end) in 0-based coordinates
+
+        Raises:
+            KeyError: if `rname` is not in the reference
+            ValueError: if the range is out of the sequence of `rname` (e.g. alignments to another reference build)
+        """
+        if rname not in self.fai:
+            raise KeyError(f"{rname} is not found in {self.path_fasta}")
+        sequence = []
+        for idx_chunk in range(max(start, 0) // self.chunk_size, (end - 1) // self.chunk_size + 1):
+            chunk_start = idx_chunk * self.chunk_size
+            chunk = self._fetch_chunk(rname, idx_chunk)
+            sequence.append(chunk[max(start - chunk_start, 0) : end - chunk_start])
+        result = "".join(sequence)
+        if start < 0 or len(result) != end - start:
+            raise ValueError(
+                f"{rname}:{start}-{end} is out of the range of {rname} (length {self.fai[rname].length}) "
+                f"in {self.path_fasta}"
+            )
+        return result
+
+
+def open_reference(reference: str | Path | FastaReference | None) -> FastaReference | None:
+    if reference is None or isinstance(reference, FastaReference):
+        return reference
+    return FastaReference(reference)
+
+
+###########################################################
+# Expand short-form csv tag
+###########################################################
+
+
+def expand_short_form(csv_tag: str, rname: str, pos: int, reference: FastaReference, is_reverse: bool = False) -> str:
+    """Expand identical sequence lengths (`:N`) of a csv tag into the long form (`=ACGT...`)
+
+    Args:
+        csv_tag (str): a csv tag, possibly with short-form identical sequences
+        rname (str): reference sequence name
+        pos (int): 1-based leftmost mapping position
+        reference (FastaReference): the reference genome
+        is_reverse (bool, optional): whether the csv tag is reverse complemented from the reference. Defaults to False.
+
+    Returns:
+        str: a csv tag in the long form
+
+    Example:
+        >>> from csvtag.reference import FastaReference, expand_short_form
+        >>> reference = FastaReference("reference.fa")  # chr1: ACGTACGTAC...
+        >>> expand_short_form(":4*AG:2", "chr1", 1, reference)
+        '=ACGT*AG=CG'
+    """
+    if ":" not in csv_tag:
+        return csv_tag
+    if is_reverse:
+        return revcomp(expand_short_form(revcomp(csv_tag), rname, pos, reference))
+
+    csv_tag_expanded = []
+    offset = pos - 1
+    for tag in split_by_tag(csv_tag):
+        length = token_reference_length(tag)
+        if tag[0] == ":":
+            tag = "=" + reference.fetch(rname, offset, offset + length)
+        csv_tag_expanded.append(tag)
+        offset += length
+    return "".join(csv_tag_expanded)
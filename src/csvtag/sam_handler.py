@@ -1,7 +1,11 @@
 from __future__ import annotations
 
+import hashlib
+import mmap
 import re
-from collections.abc import Iterator
+import sys
+from collections.abc import Collection, Iterable, Iterator
+from dataclasses import dataclass, field
 from pathlib import Path
 
 ###########################################################
@@ -15,6 +19,103 @@ def read_sam(path_of_sam: str | Path) -> Iterator[list[str]]:
             yield line.strip().split("\t")
 
 
+def _record_to_alignment(record) -> dict[str, str | int] | None:
+    """Build the alignment of `extract_alignment` from the attributes of a pysam.AlignedSegment,
+    or return None if the record is unmapped or has no sequence
+    """
+    if record.is_unmapped or record.reference_name is None or record.query_sequence is None:
+        return None
+    qualities = record.query_qualities
+    return dict(
+        QNAME=record.query_name.replace(",", "_"),
+        FLAG=record.flag,
+        RNAME=record.reference_name,
+        POS=record.reference_start + 1,
+        MAPQ=record.mapping_quality,
+        CIGAR=record.cigarstring,
+        SEQ=record.query_sequence,
+        QUAL="".join(chr(quality + 33) for quality in qualities) if qualities is not None else "*",
+        CSTAG=record.get_tag("cs"),
+    )
+
+
+def read_records(records: Iterable) -> Iterator[list[str] | dict[str, str | int]]:
+    """Split SAM records held in memory into fields, in the same way as `read_sam`
+
+    Args:
+        records (Iterable): SAM lines (bytes or str), lists or tuples of the fields of SAM lines, or
+            pysam.AlignedSegment objects (or objects with the same `query_name`, `flag`, `reference_name`,
+            `reference_start`, `mapping_quality`, `cigarstring`, `query_sequence`, `query_qualities`,
+            `is_unmapped` and `get_tag` attributes). Kinds can be mixed.
+
+    Yields:
+        Iterator[list[str] | dict[str, str | int]]: the fields of each record, or the alignment of
+            `extract_alignment` built directly from the attributes of a record object.
+            Unmapped record objects are skipped.
+    """
+    for record in records:
+        if isinstance(record, (bytes, bytearray, memoryview)):
+            record = bytes(record).decode()
+        if isinstance(record, str):
+            yield record.strip().split("\t")
+        elif hasattr(record, "query_name"):
+            alignment = _record_to_alignment(record)
+            if alignment is not None:
+                yield alignment
+        else:
+            yield [str(field) for field in record]
+
+
+def _qname_at(mm: mmap.mmap, offset: int) -> bytes:
+    return mm[offset : mm.find(b"\t", offset)]
+
+
+def split_sam_by_qname(path_of_sam: str | Path, n_chunks: int) -> list[tuple[int, int]]:
+    """Split a SAM file into byte ranges aligned to line boundaries without splitting QNAME groups.
+    The alignments of a QNAME must be contiguous, as in the output of minimap2.
+
+    Args:
+        path_of_sam (str | Path): a path of a SAM file
+        n_chunks (int): number of byte ranges to aim for
+
+    Returns:
+        list[tuple[int, int]]: (start, end) byte offsets of each range
+    """
+    with open(path_of_sam, "rb") as f:
+        size = f.seek(0, 2)
+        if size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            boundaries = [0]
+            for i in range(1, n_chunks):
+                offset = max(size * i // n_chunks, boundaries[-1])
+                if offset > 0:
+                    offset = mm.find(b"\n", offset - 1) + 1 or size
+                # Move forward while the line continues the QNAME group of the previous line
+                while 0 < offset < size:
+                    prev_start = mm.rfind(b"\n", 0, offset - 1) + 1
+                    if mm[prev_start : prev_start + 1] == b"@" or _qname_at(mm, prev_start) != _qname_at(mm, offset):
+                        break
+                    offset = mm.find(b"\n", offset) + 1 or size
+                if offset > boundaries[-1]:
+                    boundaries.append(offset)
+            if boundaries[-1] < size:
+                boundaries.append(size)
+    return list(zip(boundaries, boundaries[1:]))
+
+
+def read_sam_range(path_of_sam: str | Path, start: int, end: int) -> Iterator[list[str]]:
+    """Read the lines of a SAM file between byte offsets through a memory map"""
+    with open(path_of_sam, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        offset = start
+        while offset < end:
+            line_end = mm.find(b"\n", offset, end)
+            if line_end == -1:
+                line_end = end
+            yield mm[offset:line_end].decode().strip().split("\t")
+            offset = line_end + 1
+
+
 def is_forward_strand(flag: int) -> bool:
     return (flag & 0x10) == 0
 
@@ -66,18 +167,147 @@ def extract_sqheaders(sam: Iterator[list[str]]) -> dict[str, int]:
     return sn_ln_output
 
 
-def extract_alignment(sam: list[list[str]]) -> Iterator[dict[str, str | int]]:
+def _parse_region(region: str) -> tuple[str, int, int]:
+    """Parse a region of "chr", "chr:pos" (from pos to the end) or "chr:start-end" (1-based, inclusive),
+    as in samtools. Commas in the positions are ignored.
+    """
+    message = f"Invalid region: {region!r}. Specify 'chr', 'chr:pos' or 'chr:start-end'."
+    if ":" not in region:
+        if not region:
+            raise ValueError(message)
+        return region, 1, sys.maxsize
+    chrom, _, span = region.rpartition(":")
+    match = re.fullmatch(r"([0-9][0-9,]*)(?:-([0-9][0-9,]*)?)?", span)
+    if not chrom or match is None:
+        raise ValueError(message)
+    start = int(match.group(1).replace(",", ""))
+    end = int(match.group(2).replace(",", "")) if match.group(2) else sys.maxsize
+    if start < 1 or start > end:
+        raise ValueError(f"Invalid region: {region!r}. The start must be between 1 and the end.")
+    return chrom, start, end
+
+
+@dataclass
+class AlignmentFilter:
+    """Conditions on the raw fields of SAM records, evaluated before the records are dictionalized
+
+    Args:
+        rname (str | None, optional): keep alignments on this reference sequence. Defaults to None.
+        region (str | None, optional): keep alignments overlapping a region of "chr", "chr:pos" (from pos to
+            the end) or "chr:start-end" (1-based, inclusive). Defaults to None.
+        min_mapq (int, optional): keep alignments with MAPQ of at least this value. Defaults to 0.
+        exclude_secondary (bool, optional): drop secondary alignments (FLAG 0x100).
+            Supplementary alignments are kept since they are needed to detect inversions. Defaults to False.
+        qnames (Collection[str] | None, optional): keep alignments of these QNAMEs. Defaults to None.
+        fraction (float, optional): keep the reads whose QNAME hash falls under this fraction.
+            All the alignments of a read are kept or dropped together, and the same reads are kept
+            for the same `seed` regardless of the run or the number of workers. Defaults to 1.0.
+        seed (int, optional): seed of the QNAME hash for `fraction`. Defaults to 0.
+
+    `rname`, `region`, `min_mapq` and `exclude_secondary` filter the alignments one by one, not the reads.
+    So they can drop one alignment of a read and keep the others, e.g. the low-MAPQ or out-of-region middle
+    alignment of an inversion, whose remaining alignments are then called without the inversion.
+
+    Example:
+        >>> from csvtag import call
+        >>> from csvtag.sam_handler import AlignmentFilter
+        >>> results = call("example.sam", alignment_filter=AlignmentFilter(region="chr1:100-200", min_mapq=20))
+    """
+
+    rname: str | None = None
+    region: str | None = None
+    min_mapq: int = 0
+    exclude_secondary: bool = False
+    qnames: Collection[str] | None = None
+    fraction: float = 1.0
+    seed: int = 0
+    _region: tuple[str, int, int] | None = field(default=None, init=False, repr=False)
+    _threshold: int = field(default=1 << 64, init=False, repr=False)
+    _salt: bytes = field(default=b"", init=False, repr=False)
+
+    def __post_init__(self):
+        if self.region is not None:
+            self._region = _parse_region(self.region)
+        if self.qnames is not None:
+            self.qnames = frozenset(qname.replace(",", "_") for qname in self.qnames)
+        if not 0.0 <= self.fraction <= 1.0:
+            raise ValueError("fraction must be between 0 and 1.")
+        self._threshold = int(self.fraction * (1 << 64))
+        self._salt = self.seed.to_bytes(16, "little", signed=True)
+
+    def __call__(self, fields: list[str]) -> bool:
+        """Whether to keep a mapped SAM record split into fields"""
+        return self._keep(fields[0], fields[1], fields[2], fields[3], fields[4], fields[5])
+
+    def keep_alignment(self, alignment: dict[str, str | int]) -> bool:
+        """Whether to keep an alignment of `extract_alignment`"""
+        return self._keep(
+            alignment["QNAME"],
+            alignment["FLAG"],
+            alignment["RNAME"],
+            alignment["POS"],
+            alignment["MAPQ"],
+            alignment["CIGAR"],
+        )
+
+    def _keep(self, qname: str, flag: str | int, rname: str, pos: str | int, mapq: str | int, cigar: str) -> bool:
+        # Numeric fields are converted only if they are checked
+        if self._threshold < 1 << 64 and not self._is_sampled(qname):
+            return False
+        if self.rname is not None and rname != self.rname:
+            return False
+        if self.min_mapq and int(mapq) < self.min_mapq:
+            return False
+        if self.exclude_secondary and int(flag) & 0x100:
+            return False
+        if self._region is not None:
+            chrom, start, end = self._region
+            pos = int(pos)
+            if rname != chrom or pos > end or pos + calculate_alignment_length(cigar) - 1 < start:
+                return False
+        if self.qnames is not None:
+            qname = qname if "," not in qname else qname.replace(",", "_")
+            if qname not in self.qnames:
+                return False
+        return True
+
+    def _is_sampled(self, qname: str) -> bool:
+        digest = hashlib.blake2b(qname.replace(",", "_").encode(), digest_size=8, salt=self._salt).digest()
+        return int.from_bytes(digest, "little") < self._threshold
+
+    def cache_key(self) -> str:
+        """A string identifying the conditions, for `cache.ResultCache.key`"""
+        qnames = None
+        if self.qnames is not None:
+            qnames = hashlib.blake2b("\n".join(sorted(self.qnames)).encode(), digest_size=16).hexdigest()
+        return (
+            f"{self.rname}|{self.region}|{self.min_mapq}|{self.exclude_secondary}|{qnames}|{self.fraction}|{self.seed}"
+        )
+
+
+def extract_alignment(
+    sam: Iterable[list[str] | dict[str, str | int]], alignment_filter: AlignmentFilter | None = None
+) -> Iterator[dict[str, str | int]]:
     """Extract mapped alignments from SAM
 
     Args:
-        sam (list[list[str]]): a list of lists of SAM format including cs tag
+        sam (Iterable[list[str] | dict[str, str | int]]): lists of SAM fields including cs tag,
+            or alignments already built by `read_records`, which are only filtered
+        alignment_filter (AlignmentFilter | None, optional): conditions on the raw fields to keep an alignment.
+            Defaults to None.
 
     Returns:
         Iterator[dict[str, str | int]]: a dictionary containing QNAME, FLAG, RNAME, POS, CIGAR, SEQ, QUAL, CSTAG
     """
     for alignment in sam:
+        if isinstance(alignment, dict):
+            if alignment_filter is None or alignment_filter.keep_alignment(alignment):
+                yield alignment
+            continue
         if alignment[0].startswith("@") or alignment[2] == "*" or alignment[9] == "*":
             continue
+        if alignment_filter is not None and not alignment_filter(alignment):
+            continue
         idx_cstag = next((i for i, a in enumerate(alignment) if a.startswith("cs:Z:")), None)
         yield dict(
             QNAME=alignment[0].replace(",", "_"),
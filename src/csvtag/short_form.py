@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import re
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+from csvtag.reference import FastaReference, expand_short_form, open_reference
+from csvtag.writer import ResultWriter, read_results
+
+###########################################################
+# Convert between the long and short forms
+###########################################################
+
+
+def _shorten_identical_sequence(sequence: str) -> str:
+    # N is not an identical base (e.g. gaps filled by combining), so it stays in the long form
+    return "".join(f":{len(run)}" if run[0] != "N" else f"={run}" for run in re.findall(r"N+|[ACGT]+", sequence))
+
+
+def to_short_form(csv_tag: str) -> str:
+    """Encode identical sequences of a csv tag as their lengths (`:N`)
+
+    Inverted (lowercase) identical sequences are kept in the long form to preserve the inversion.
+
+    Args:
+        csv_tag (str): a csv tag in the long form
+
+    Returns:
+        str: a csv tag in the short form
+
+    Example:
+        >>> from csvtag.short_form import to_short_form
+        >>> to_short_form("=ACGT*AG=CC=aa*ag=aa=TTNNNTT")
+        ':4*AG:2=aa*ag=aa:2=NNN:2'
+    """
+    return re.sub(r"=([ACGTN]+)", lambda match: _shorten_identical_sequence(match.group(1)), csv_tag)
+
+
+def to_long_form(csv_tag: str, rname: str, pos: int, reference: FastaReference) -> str:
+    """Restore identical sequences (`:N`) of a csv tag from the reference
+
+    Args:
+        csv_tag (str): a csv tag in the short form
+        rname (str): reference sequence name
+        pos (int): 1-based leftmost mapping position
+        reference (FastaReference): the reference genome
+
+    Returns:
+        str: a csv tag in the long form
+    """
+    return expand_short_form(csv_tag, rname, pos, reference)
+
+
+###########################################################
+# Convert results
+###########################################################
+
+
+def convert_results(
+    results: Iterable[dict[str, str | int]],
+    short_form: bool = True,
+    reference: str | Path | FastaReference | None = None,
+) -> Iterator[dict[str, str | int]]:
+    """Convert csv tags of results into the short form, or back into the long form with a reference
+
+    Results do not record the strand, and the csv tags of reverse-strand alignments are in the read orientation.
+    So a csv tag is shortened only if it is restored exactly from the forward reference, and kept in the
+    long form otherwise, in the same way as `caller.call(short_form=True)`.
+
+    Args:
+        results (Iterable[dict[str, str | int]]): dictionaries with QNAME, RNAME, POS and CSVTAG
+        short_form (bool, optional): convert into the short form if True, or into the long form if False.
+            Defaults to True.
+        reference (str | Path | FastaReference | None): the reference FASTA file
+
+    Yields:
+        Iterator[dict[str, str | int]]: dictionaries with the converted CSVTAG
+    """
+    reference = open_reference(reference)
+    if reference is None:
+        raise ValueError("reference is required to convert csv tags between the long and short forms.")
+
+    for result in results:
+        if short_form:
+            csv_tag = to_short_form(result["CSVTAG"])
+            if to_long_form(csv_tag, result["RNAME"], result["POS"], reference) != result["CSVTAG"]:
+                csv_tag = result["CSVTAG"]
+        else:
+            csv_tag = to_long_form(result["CSVTAG"], result["RNAME"], result["POS"], reference)
+        yield {**result, "CSVTAG": csv_tag}
+
+
+def convert_result_file(
+    path_input: str | Path,
+    path_output: str | Path,
+    short_form: bool = True,
+    reference: str | Path | FastaReference | None = None,
+) -> None:
+    """Stream a result file written by `writer.write_results` into another form
+
+    Example:
+        >>> from csvtag.short_form import convert_result_file
+        >>> convert_result_file("results.tsv", "results_short.tsv", reference="ref.fa")
+        >>> convert_result_file("results_short.tsv", "results_long.tsv", short_form=False, reference="ref.fa")
+    """
+    with ResultWriter(path_output) as writer:
+        writer.write_all(convert_results(read_results(path_input), short_form=short_form, reference=reference))
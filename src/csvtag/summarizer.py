@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import re
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+from csvtag.splitter import split_by_tag
+from csvtag.utils import reference_length, token_reference_length
+
+COLUMNS = ("RNAME", "POS", "DEPTH", "INVERSION", "A", "C", "G", "T", "INSERTION", "DELETION")
+
+_BASE_INDEX = {"A": 0, "C": 1, "G": 2, "T": 3}
+
+###########################################################
+# Per-locus counters
+###########################################################
+
+
+class LocusCounter:
+    """Array-backed counters of a reference sequence, grown to the largest position seen.
+    Depth, inversions and deletions are accumulated as difference arrays, so that a token
+    updates two elements regardless of its length.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        import numpy as np  # imported on first use since it takes a while to import
+
+        self.depth = np.zeros(capacity + 1, dtype=np.int64)
+        self.inversion = np.zeros(capacity + 1, dtype=np.int64)
+        self.deletion = np.zeros(capacity + 1, dtype=np.int64)
+        self.insertion = np.zeros(capacity + 1, dtype=np.int64)
+        self.substitution = np.zeros((capacity + 1, 4), dtype=np.int64)
+
+    def _reserve(self, end: int) -> None:
+        capacity = len(self.insertion) - 1
+        if end <= capacity:
+            return
+        import numpy as np
+
+        size = max(end, capacity * 2) + 1
+        for name in ("depth", "inversion", "deletion", "insertion", "substitution"):
+            array = getattr(self, name)
+            grown = np.zeros((size,) + array.shape[1:], dtype=array.dtype)
+            grown[: len(array)] = array
+            setattr(self, name, grown)
+
+    def add(self, csv_tag: str, pos: int) -> None:
+        """Count the tokens of a csv tag aligned at a 1-based position"""
+        offset = pos - 1
+        self._reserve(offset + reference_length(csv_tag) + 1)
+        depth, inversion, deletion = self.depth, self.inversion, self.deletion
+
+        for tag in split_by_tag(csv_tag):
+            operand = tag[0]
+            length = token_reference_length(tag)
+            if operand == "=":
+                # N is not an observed base (e.g. gaps filled by combining), so it is not counted as depth
+                for run in re.finditer(r"[^Nn]+", tag[1:]):
+                    depth[offset + run.start()] += 1
+                    depth[offset + run.end()] -= 1
+            elif operand in ":*-":
+                depth[offset] += 1
+                depth[offset + length] -= 1
+                if operand == "*" and tag[2].upper() in _BASE_INDEX:
+                    self.substitution[offset, _BASE_INDEX[tag[2].upper()]] += 1
+                elif operand == "-":
+                    deletion[offset] += 1
+                    deletion[offset + length] -= 1
+            elif operand == "+":
+                # An insertion is counted at the position right after it
+                self.insertion[offset] += 1
+
+            if length and tag[-1].islower():
+                inversion[offset] += 1
+                inversion[offset + length] -= 1
+            offset += length
+
+    def rows(self, rname: str) -> Iterator[dict[str, str | int]]:
+        """Yield counts of positions with any observation, in 1-based coordinates"""
+        import numpy as np
+
+        depth = np.cumsum(self.depth)
+        inversion = np.cumsum(self.inversion)
+        deletion = np.cumsum(self.deletion)
+        observed = (depth > 0) | (self.insertion > 0)
+        for i in np.flatnonzero(observed).tolist():
+            a, c, g, t = self.substitution[i].tolist()
+            yield {
+                "RNAME": rname,
+                "POS": i + 1,
+                "DEPTH": int(depth[i]),
+                "INVERSION": int(inversion[i]),
+                "A": a,
+                "C": c,
+                "G": g,
+                "T": t,
+                "INSERTION": int(self.insertion[i]),
+                "DELETION": int(deletion[i]),
+            }
+
+
+###########################################################
+# Summarize results
+###########################################################
+
+
+def summarize(results: Iterable[dict[str, str | int]]) -> Iterator[dict[str, str | int]]:
+    """Aggregate csv tags into per-position counts of each reference sequence
+
+    Results are consumed one by one and only the counters are kept, so the memory usage
+    depends on the length of the reference sequences rather than the number of reads.
+
+    Args:
+        results (Iterable[dict[str, str | int]]): dictionaries with RNAME, POS and CSVTAG, such as the output of `call`
+
+    Yields:
+        Iterator[dict[str, str | int]]: a row per observed position, in the order of RNAME appearance, with the keys:
+            - "RNAME" (str): Reference sequence name.
+            - "POS" (int): 1-based position.
+            - "DEPTH" (int): number of alignments covering the position, including deletions.
+            - "INVERSION" (int): number of inverted alignments covering the position.
+            - "A", "C", "G", "T" (int): number of substitutions into each base.
+            - "INSERTION" (int): number of insertions just before the position.
+            - "DELETION" (int): number of deletions of the position.
+
+    Example:
+        >>> from csvtag import call
+        >>> from csvtag.summarizer import summarize
+        >>> for row in summarize(call("example.sam")):
+        ...     print(row)
+        {'RNAME': 'chr1', 'POS': 100, 'DEPTH': 12, 'INVERSION': 3, 'A': 0, 'C': 0, 'G': 2, 'T': 0, ...}
+    """
+    counters: dict[str, LocusCounter] = {}
+    for result in results:
+        rname = result["RNAME"]
+        if rname not in counters:
+            counters[rname] = LocusCounter()
+        counters[rname].add(result["CSVTAG"], int(result["POS"]))
+
+    for rname, counter in counters.items():
+        yield from counter.rows(rname)
+
+
+def write_summary(results: Iterable[dict[str, str | int]], path_output: str | Path) -> None:
+    """Write the output of `summarize` as a tab-separated table with a header line
+
+    Example:
+        >>> from csvtag import call
+        >>> from csvtag.summarizer import write_summary
+        >>> write_summary(call("example.sam"), "summary.tsv")
+    """
+    with open(path_output, "w") as f:
+        f.write("\t".join(COLUMNS) + "\n")
+        for row in summarize(results):
+            f.write("\t".join(str(row[column]) for column in COLUMNS) + "\n")
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+from csvtag.bgzf import open_output
+from csvtag.splitter import split_by_tag
+from csvtag.utils import token_reference_length
+
+###########################################################
+# Extract inverted segments
+###########################################################
+
+
+def iter_inversion_intervals(csv_tag: str, pos: int) -> Iterator[tuple[int, int]]:
+    """Reference intervals of the inverted (lowercase) segments of a csv tag
+
+    Args:
+        csv_tag (str): a csv tag
+        pos (int): 1-based leftmost mapping position
+
+    Yields:
+        Iterator[tuple[int, int]]: 0-based, half-open (start, end) of each inverted segment, as in BED
+
+    Example:
+        >>> from csvtag.to_bed import iter_inversion_intervals
+        >>> list(iter_inversion_intervals("=AA=aa*ag-a=AA=cc", 10))
+        [(11, 15), (17, 19)]
+    """
+    offset = pos - 1
+    start = None
+    for tag in split_by_tag(csv_tag):
+        if tag[-1].islower():
+            if start is None:
+                start = offset
+        elif start is not None:
+            yield (start, offset)
+            start = None
+        offset += token_reference_length(tag)
+    if start is not None:
+        yield (start, offset)
+
+
+_OPPOSITE_STRAND = {"+": "-", "-": "+"}
+
+
+def iter_bed_records(results: Iterable[dict[str, str | int]]) -> Iterator[dict[str, str | int]]:
+    """Convert the inverted segments of csv tags into BED records
+
+    Args:
+        results (Iterable[dict[str, str | int]]): dictionaries with QNAME, RNAME, POS and CSVTAG,
+            and optionally STRAND, the orientation of the read (`caller.call(strand=True)`)
+
+    Yields:
+        Iterator[dict[str, str | int]]: dictionaries with CHROM, START, END, NAME (QNAME), SCORE and STRAND.
+            STRAND is the opposite of the orientation of the read, since the segments are inverted from it,
+            or "." if the results do not have STRAND.
+    """
+    for result in results:
+        csv_tag = result["CSVTAG"]
+        if csv_tag == csv_tag.upper():
+            continue
+        strand = _OPPOSITE_STRAND.get(result.get("STRAND"), ".")
+        for start, end in iter_inversion_intervals(csv_tag, int(result["POS"])):
+            yield {
+                "CHROM": result["RNAME"],
+                "START": start,
+                "END": end,
+                "NAME": result["QNAME"],
+                "SCORE": 0,
+                "STRAND": strand,
+            }
+
+
+def _bed_key(record: dict[str, str | int]) -> tuple[str, int, int]:
+    return (record["CHROM"], record["START"], record["END"])
+
+
+def _check_sorted(records: Iterable[dict[str, str | int]]) -> Iterator[dict[str, str | int]]:
+    previous = None
+    for record in records:
+        key = _bed_key(record)
+        if previous is not None and key < previous:
+            raise ValueError("The BED records are not sorted by CHROM, START and END.")
+        previous = key
+        yield record
+
+
+def merge_bed_records(
+    records: Iterable[dict[str, str | int]], presorted: bool = False
+) -> Iterator[dict[str, str | int]]:
+    """Merge overlapping BED records across reads with a sweep over the records sorted by position
+
+    Args:
+        records (Iterable[dict[str, str | int]]): BED records such as the output of `iter_bed_records`
+        presorted (bool, optional): the records are already sorted by CHROM, START and END, so they are merged
+            while streaming. Otherwise all the records are held in memory to be sorted. Defaults to False.
+
+    Yields:
+        Iterator[dict[str, str | int]]: merged BED records, whose NAME is the number of merged records.
+            STRAND is "." if the merged records have different strands.
+    """
+    records = _check_sorted(records) if presorted else sorted(records, key=_bed_key)
+    merged = None
+    for record in records:
+        if merged is not None and record["CHROM"] == merged["CHROM"] and record["START"] < merged["END"]:
+            merged["END"] = max(merged["END"], record["END"])
+            merged["NAME"] += 1
+            if record["STRAND"] != merged["STRAND"]:
+                merged["STRAND"] = "."
+            continue
+        if merged is not None:
+            yield merged
+        merged = {**record, "NAME": 1}
+    if merged is not None:
+        yield merged
+
+
+###########################################################
+# Write BED
+###########################################################
+
+
+def to_bed(
+    results: Iterable[dict[str, str | int]], path_output: str | Path, merge: bool = False, threads: int | None = None
+) -> None:
+    """Write the inverted segments of csv tags as BED6, bgzipped if the path ends with `.gz`
+
+    Args:
+        results (Iterable[dict[str, str | int]]): dictionaries with QNAME, RNAME, POS and CSVTAG
+        path_output (str | Path): the output path (e.g. `inversions.bed`)
+        merge (bool, optional): merge overlapping segments across reads and report their number as NAME.
+            The segments are sorted in memory before merging. Defaults to False.
+        threads (int | None, optional): number of compression threads for `.gz`. Defaults to the number of CPUs.
+
+    Example:
+        >>> from csvtag import call
+        >>> from csvtag.to_bed import to_bed
+        >>> to_bed(call("example.sam", strand=True), "inversions.bed")
+    """
+    records = iter_bed_records(results)
+    if merge:
+        records = merge_bed_records(records)
+    with open_output(path_output, threads=threads) as f:
+        for r in records:
+            f.write(f"{r['CHROM']}\t{r['START']}\t{r['END']}\t{r['NAME']}\t{r['SCORE']}\t{r['STRAND']}\n")
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import re
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+from csvtag.bgzf import open_output
+from csvtag.reference import FastaReference, open_reference
+from csvtag.short_form import to_long_form
+
+###########################################################
+# Reconstruct query sequences
+###########################################################
+
+# Everything of a csv tag that is not a query base: operators, deletions, introns and the reference bases
+# of substitutions
+_NON_QUERY = re.compile(r"\-[ACGTNacgtn]+|\~[ACGTNacgtn]{2}[0-9]+[ACGTNacgtn]{2}|\*[ACGTNacgtn](?=[ACGTNacgtn])|[=+*]")
+
+
+def query_sequence(csv_tag: str, keep_case: bool = True) -> str:
+    """Same as `to_sequence.to_sequence`, but removes the non-query parts with a single regular expression
+    instead of building a list of tokens
+
+    Args:
+        csv_tag (str): a csv tag in the long form
+        keep_case (bool, optional): keep inverted bases in lowercase. Defaults to True.
+
+    Returns:
+        str: the query sequence, including the `N` filling the gaps of combined csv tags
+
+    Raises:
+        ValueError: if the csv tag has short-form identical sequences (`:N`), whose bases are not written
+
+    Example:
+        >>> from csvtag.to_fasta import query_sequence
+        >>> query_sequence("=AA=aa*ga=A-CC+G=AAA")
+        'AAaaaAGAAA'
+        >>> query_sequence("=AA=aa*ga=A-CC+G=AAA", keep_case=False)
+        'AAAAAAGAAA'
+    """
+    if ":" in csv_tag:
+        raise ValueError("Short-form csv tags must be restored by `short_form.to_long_form` first.")
+    sequence = _NON_QUERY.sub("", csv_tag)
+    return sequence if keep_case else sequence.upper()
+
+
+###########################################################
+# FASTA records
+###########################################################
+
+
+def _result_sequence(result: dict[str, str | int], keep_case: bool, reference: FastaReference | None) -> str:
+    csv_tag = result["CSVTAG"]
+    if reference is not None and ":" in csv_tag:
+        csv_tag = to_long_form(csv_tag, result["RNAME"], result["POS"], reference)
+    return query_sequence(csv_tag, keep_case)
+
+
+def iter_fasta_records(
+    results: Iterable[dict[str, str | int]],
+    keep_case: bool = True,
+    dedup: bool = False,
+    reference: FastaReference | None = None,
+) -> Iterator[tuple[str, str]]:
+    """Convert csv tags into FASTA records of their query sequences
+
+    Args:
+        results (Iterable[dict[str, str | int]]): dictionaries with QNAME, RNAME, POS and CSVTAG
+        keep_case (bool, optional): keep inverted bases in lowercase. Defaults to True.
+        dedup (bool, optional): output each distinct sequence once, the most frequent first, named after
+            the first read and its number of reads (`read1 count=10`). Defaults to False.
+        reference (FastaReference | None, optional): the reference genome to restore short-form csv tags.
+            Defaults to None.
+
+    Yields:
+        Iterator[tuple[str, str]]: the header (without `>`) and the sequence of each record.
+            Without `dedup`, the header is `QNAME RNAME:POS`. Results without query bases are skipped.
+    """
+    if not dedup:
+        for result in results:
+            sequence = _result_sequence(result, keep_case, reference)
+            if sequence:
+                yield f"{result['QNAME']} {result['RNAME']}:{result['POS']}", sequence
+        return
+
+    # sequence -> [QNAME of the first read, number of reads]; dicts keep the order of first appearance
+    alleles: dict[str, list] = {}
+    for result in results:
+        sequence = _result_sequence(result, keep_case, reference)
+        if not sequence:
+            continue
+        if sequence in alleles:
+            alleles[sequence][1] += 1
+        else:
+            alleles[sequence] = [result["QNAME"], 1]
+    for sequence, (qname, count) in sorted(alleles.items(), key=lambda x: -x[1][1]):
+        yield f"{qname} count={count}", sequence
+
+
+###########################################################
+# Write FASTA
+###########################################################
+
+
+def to_fasta(
+    results: Iterable[dict[str, str | int]],
+    path_output: str | Path,
+    keep_case: bool = True,
+    dedup: bool = False,
+    block_size: int = 1 << 22,
+    threads: int | None = None,
+    reference: str | Path | FastaReference | None = None,
+) -> None:
+    """Write the query sequences of csv tags as FASTA, bgzipped if the path ends with `.gz`
+
+    Records are accumulated in one byte buffer and written in blocks of `block_size` bytes.
+
+    Args:
+        results (Iterable[dict[str, str | int]]): dictionaries with QNAME, RNAME, POS and CSVTAG
+        path_output (str | Path): the output path (e.g. `alleles.fa`)
+        keep_case (bool, optional): keep inverted bases in lowercase. Defaults to True.
+        dedup (bool, optional): output each distinct sequence once with its number of reads. Defaults to False.
+        block_size (int, optional): bytes buffered before each write. Defaults to 4 MiB.
+        threads (int | None, optional): number of compression threads for `.gz`. Defaults to the number of CPUs.
+        reference (str | Path | FastaReference | None, optional): the reference FASTA file, required for
+            short-form csv tags. Defaults to None.
+
+    Example:
+        >>> from csvtag import call
+        >>> from csvtag.to_fasta import to_fasta
+        >>> to_fasta(call("example.sam"), "alleles.fa", dedup=True)
+    """
+    reference = open_reference(reference)
+    buffer = bytearray()
+    with open_output(path_output, threads=threads, binary=True) as f:
+        records = iter_fasta_records(results, keep_case=keep_case, dedup=dedup, reference=reference)
+        for header, sequence in records:
+            buffer += f">{header}\n{sequence}\n".encode()
+            if len(buffer) >= block_size:
+                f.write(buffer)
+                buffer.clear()
+        f.write(buffer)
@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import re
+from collections.abc import Iterable, Iterator, Sized
+from dataclasses import dataclass
+from itertools import groupby
+from typing import TYPE_CHECKING
+
+from csvtag.splitter import split_by_tag
+from csvtag.utils import token_reference_length
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Codes of the matrix. INVERTED is a flag added to the code of an inverted position (e.g. MATCH | INVERTED)
+NONE = 0
+MATCH = 1
+SUBSTITUTION = 2
+DELETION = 3
+UNKNOWN = 4
+INVERTED = 8
+
+_CODES = {"=": MATCH, ":": MATCH, "*": SUBSTITUTION, "-": DELETION}
+
+
+@dataclass
+class ReadMatrix:
+    """Categorical codes of reads (rows) by reference positions (columns).
+    `insertions` holds the length of the insertion just before each position, if requested.
+    """
+
+    qnames: list[str]
+    codes: np.ndarray
+    insertions: np.ndarray | None = None
+
+
+###########################################################
+# Fill a row from the tokens of csv tags
+###########################################################
+
+
+def _fill_row(codes: np.ndarray, insertions: np.ndarray | None, csv_tag: str, pos: int, start: int, end: int) -> bool:
+    """Fill the codes of a csv tag aligned at `pos` within the 1-based region [start, end].
+    Returns whether the csv tag overlaps the region.
+    """
+    offset = pos - start  # column of the next token
+    width = end - start + 1
+    if offset >= width:
+        return False
+    for tag in split_by_tag(csv_tag):
+        if offset >= width:
+            break
+        length = token_reference_length(tag)
+        if tag[0] == "+":
+            if insertions is not None and 0 <= offset:
+                insertions[offset] += len(tag) - 1
+            continue
+
+        code = _CODES.get(tag[0], NONE)
+        if tag[-1].islower():
+            code |= INVERTED
+        if code != NONE and offset + length > 0:
+            codes[max(offset, 0) : offset + length] = code
+            if tag[0] == "=" and "N" in tag.upper():
+                for run in re.finditer(r"[Nn]+", tag[1:]):
+                    codes[max(offset + run.start(), 0) : max(offset + run.end(), 0)] = UNKNOWN | (code & INVERTED)
+        offset += length
+    return offset > 0
+
+
+###########################################################
+# Export a matrix
+###########################################################
+
+
+def iter_matrices(
+    results: Iterable[dict[str, str | int]],
+    rname: str,
+    start: int,
+    end: int,
+    chunk_size: int = 10_000,
+    insertions: bool = False,
+) -> Iterator[ReadMatrix]:
+    """Convert csv tags within a region into int8 matrices of reads by positions, chunk by chunk
+
+    The alignments of a QNAME must be contiguous, as in the output of `caller.call`, and are filled into one row.
+    Reads without any alignment overlapping the region have no row.
+    Each position has one of the codes NONE, MATCH, SUBSTITUTION, DELETION and UNKNOWN (`N`),
+    with the INVERTED flag added for inverted alignments.
+
+    Args:
+        results (Iterable[dict[str, str | int]]): dictionaries with QNAME, RNAME, POS and CSVTAG
+        rname (str): reference sequence name of the region
+        start (int): 1-based start position of the region
+        end (int): 1-based end position of the region (inclusive)
+        chunk_size (int, optional): maximum number of reads per matrix. Defaults to 10,000.
+        insertions (bool, optional): also report insertion lengths before each position. Defaults to False.
+
+    Yields:
+        Iterator[ReadMatrix]: QNAMEs and a matrix of `chunk_size` reads at most
+
+    Example:
+        >>> from csvtag import call
+        >>> from csvtag.to_matrix import iter_matrices
+        >>> for matrix in iter_matrices(call("example.sam"), "chr1", 100, 200):
+        ...     print(matrix.codes.shape)
+        (10000, 101)
+    """
+    import numpy as np  # imported on first use since it takes a while to import
+
+    width = end - start + 1
+    results = (result for result in results if result["RNAME"] == rname)
+    reads = groupby(results, key=lambda x: x["QNAME"])
+
+    while True:
+        qnames = []
+        codes = np.zeros((chunk_size, width), dtype=np.int8)
+        lengths = np.zeros((chunk_size, width), dtype=np.int32) if insertions else None
+        for qname, alignments in reads:
+            row = len(qnames)
+            is_overlapped = False
+            for alignment in alignments:
+                is_overlapped |= _fill_row(
+                    codes[row], lengths[row] if insertions else None, alignment["CSVTAG"], alignment["POS"], start, end
+                )
+            # Alignments outside the region fill nothing, so the row is reused by the next read
+            if not is_overlapped:
+                continue
+            qnames.append(qname)
+            if len(qnames) == chunk_size:
+                break
+        if not qnames:
+            return
+        n_reads = len(qnames)
+        yield ReadMatrix(qnames, codes[:n_reads], lengths[:n_reads] if insertions else None)
+        if n_reads < chunk_size:
+            return
+
+
+def to_matrix(
+    results: Iterable[dict[str, str | int]], rname: str, start: int, end: int, insertions: bool = False
+) -> ReadMatrix:
+    """Convert csv tags within a region into one int8 matrix of reads by positions.
+    See `iter_matrices` for details.
+
+    Example:
+        >>> from csvtag.to_matrix import to_matrix
+        >>> results = [{"QNAME": "read1", "RNAME": "chr1", "POS": 2, "CSVTAG": "=A*AG=aa"}]
+        >>> to_matrix(results, "chr1", 1, 5).codes
+        array([[0, 1, 2, 9, 9]], dtype=int8)
+    """
+    import numpy as np
+
+    chunk_size = max(len(results), 1) if isinstance(results, Sized) else 10_000
+    matrices = list(iter_matrices(results, rname, start, end, chunk_size=chunk_size, insertions=insertions))
+    if len(matrices) == 1:
+        return matrices[0]
+    if not matrices:
+        width = end - start + 1
+        return ReadMatrix(
+            [], np.zeros((0, width), dtype=np.int8), np.zeros((0, width), dtype=np.int32) if insertions else None
+        )
+    return ReadMatrix(
+        [qname for matrix in matrices for qname in matrix.qnames],
+        np.concatenate([matrix.codes for matrix in matrices]),
+        np.concatenate([matrix.insertions for matrix in matrices]) if insertions else None,
+    )
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import heapq
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+from csvtag.bgzf import open_output
+from csvtag.reference import FastaReference, open_reference
+from csvtag.splitter import split_by_inversion, split_by_tag
+from csvtag.utils import reference_length, token_reference_length
+
+VCF_HEADER = (
+    "##fileformat=VCFv4.2\n"
+    "##source=csvtag\n"
+    '##INFO=<ID=SUPPORT,Number=1,Type=Integer,Description="Number of alignments supporting the variant">\n'
+    '##INFO=<ID=SVTYPE,Number=1,Type=String,Description="Type of structural variant">\n'
+    '##INFO=<ID=SVLEN,Number=1,Type=Integer,Description="Length of structural variant">\n'
+    '##INFO=<ID=END,Number=1,Type=Integer,Description="End position of structural variant">\n'
+    '##ALT=<ID=INV,Description="Inversion">\n'
+)
+
+###########################################################
+# Extract variants from a csv tag
+###########################################################
+
+
+def _last_reference_base(tag: str) -> str:
+    """The last reference base of a token, or N if it is not written in the token"""
+    if tag[0] in "=-":
+        return tag[-1].upper()
+    if tag[0] == "*":
+        return tag[1].upper()
+    return "N"
+
+
+def iter_variants(
+    csv_tag: str, pos: int, rname: str | None = None, reference: FastaReference | None = None
+) -> Iterator[tuple[int, str, str, int]]:
+    """Extract variants of a csv tag in the VCF representation
+
+    Indels and inversions are anchored to the preceding reference base, which is taken from
+    the reference if given, otherwise from the preceding token (or N if it is unknown).
+
+    Args:
+        csv_tag (str): a csv tag
+        pos (int): 1-based leftmost mapping position
+        rname (str | None, optional): reference sequence name, required with the reference. Defaults to None.
+        reference (FastaReference | None, optional): the reference genome for anchor bases. Defaults to None.
+
+    Yields:
+        Iterator[tuple[int, str, str, int]]: (POS, REF, ALT, END) of each variant, sorted by POS
+
+    Example:
+        >>> from csvtag.to_vcf import iter_variants
+        >>> list(iter_variants("=AC*AG=T-GG=A+TT=aa", 10))
+        [(12, 'A', 'G', 12), (13, 'TGG', 'T', 15), (16, 'A', 'ATT', 16), (16, 'A', '<INV>', 18)]
+    """
+    offset = pos - 1  # 0-based position of the next token
+    previous_base = "N"
+    for segment in split_by_inversion(csv_tag):
+        if segment[-1].islower():
+            length = reference_length(segment)
+            anchor = _anchor_base(previous_base, offset, rname, reference)
+            yield (offset, anchor, "<INV>", offset + length)
+            previous_base = _last_reference_base(segment)
+            offset += length
+            continue
+
+        for tag in split_by_tag(segment):
+            operand = tag[0]
+            if operand == "*":
+                yield (offset + 1, tag[1].upper(), tag[2].upper(), offset + 1)
+            elif operand == "-":
+                anchor = _anchor_base(previous_base, offset, rname, reference)
+                yield (offset, anchor + tag[1:], anchor, offset + len(tag) - 1)
+            elif operand == "+":
+                anchor = _anchor_base(previous_base, offset, rname, reference)
+                yield (offset, anchor, anchor + tag[1:], offset)
+            if operand != "+":
+                previous_base = _last_reference_base(tag)
+            offset += token_reference_length(tag)
+
+
+def _anchor_base(previous_base: str, offset: int, rname: str | None, reference: FastaReference | None) -> str:
+    if reference is not None and offset > 0:
+        return reference.fetch(rname, offset - 1, offset)
+    return previous_base
+
+
+###########################################################
+# Merge variants across alignments
+###########################################################
+
+
+def merge_variants(
+    results: Iterable[dict[str, str | int]], reference: FastaReference | None = None
+) -> Iterator[dict[str, str | int]]:
+    """Count identical variants across alignments sorted by RNAME and POS
+
+    Variants are kept in a heap until no later alignment can reach their position,
+    so the memory usage is bounded by the variants within the current window.
+
+    Args:
+        results (Iterable[dict[str, str | int]]): dictionaries with RNAME, POS and CSVTAG, sorted by RNAME and POS
+        reference (FastaReference | None, optional): the reference genome for anchor bases. Defaults to None.
+
+    Yields:
+        Iterator[dict[str, str | int]]: dictionaries with CHROM, POS, REF, ALT, END and SUPPORT, sorted by POS
+    """
+    heap: list[tuple[int, str, str, int]] = []
+    support: dict[tuple[int, str, str, int], int] = {}
+    finished_rnames = set()
+    current_rname = None
+    current_pos = 0
+
+    def flush(until: int | None = None) -> Iterator[dict[str, str | int]]:
+        while heap and (until is None or heap[0][0] < until):
+            variant = heapq.heappop(heap)
+            pos, ref, alt, end = variant
+            yield {
+                "CHROM": current_rname,
+                "POS": pos,
+                "REF": ref,
+                "ALT": alt,
+                "END": end,
+                "SUPPORT": support.pop(variant),
+            }
+
+    for result in results:
+        rname, pos = result["RNAME"], int(result["POS"])
+        if rname != current_rname:
+            yield from flush()
+            finished_rnames.add(current_rname)
+            if rname in finished_rnames:
+                raise ValueError("results must be sorted by RNAME and POS.")
+            current_rname, current_pos = rname, 0
+        if pos < current_pos:
+            raise ValueError("results must be sorted by RNAME and POS.")
+        current_pos = pos
+
+        # Variants of this and later alignments start at the anchor base (POS - 1) or later
+        yield from flush(until=pos - 1)
+        for variant in iter_variants(result["CSVTAG"], pos, rname, reference):
+            if variant not in support:
+                support[variant] = 0
+                heapq.heappush(heap, variant)
+            support[variant] += 1
+
+    yield from flush()
+
+
+###########################################################
+# Write VCF
+###########################################################
+
+
+def _format_record(variant: dict[str, str | int]) -> str:
+    info = f"SUPPORT={variant['SUPPORT']}"
+    if variant["ALT"] == "<INV>":
+        info = f"SVTYPE=INV;SVLEN={variant['END'] - variant['POS']};END={variant['END']};{info}"
+    return f"{variant['CHROM']}\t{variant['POS']}\t.\t{variant['REF']}\t{variant['ALT']}\t.\t.\t{info}\n"
+
+
+def to_vcf(
+    results: Iterable[dict[str, str | int]],
+    path_output: str | Path,
+    reference: str | Path | FastaReference | None = None,
+    threads: int | None = None,
+) -> None:
+    """Write the variants of csv tags as a sites-only VCF, bgzipped if the path ends with `.gz`
+
+    Substitutions and indels are reported as small variants, and inverted segments as symbolic `<INV>`
+    records. Identical variants across alignments are merged and their number is reported as `SUPPORT`.
+
+    Args:
+        results (Iterable[dict[str, str | int]]): dictionaries with RNAME, POS and CSVTAG, sorted by RNAME and POS
+        path_output (str | Path): the output path (e.g. `example.vcf.gz`)
+        reference (str | Path | FastaReference | None, optional): the reference FASTA file for anchor bases
+            and contig lines. Defaults to None.
+        threads (int | None, optional): number of compression threads for `.gz`. Defaults to the number of CPUs.
+
+    Example:
+        >>> from csvtag import call, to_vcf
+        >>> results = sorted(call("example.sam"), key=lambda x: (x["RNAME"], x["POS"]))
+        >>> to_vcf(results, "example.vcf.gz", reference="reference.fa")
+    """
+    reference = open_reference(reference)
+    with open_output(path_output, threads=threads) as f:
+        f.write(VCF_HEADER)
+        if reference is not None:
+            for name, entry in reference.fai.items():
+                f.write(f"##contig=<ID={name},length={entry.length}>\n")
+        f.write("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n")
+        for variant in merge_variants(results, reference=reference):
+            f.write(_format_record(variant))
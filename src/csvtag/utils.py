@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+from csvtag.splitter import split_by_tag
+
+###########################################################
+# Lengths of a token of csv tags
+###########################################################
+
+
+def token_reference_length(tag: str) -> int:
+    """Number of reference bases of a token of csv tags (e.g. `=ACGT`, `:4`, `*ag`, `-aa` or `~GT10AG`)"""
+    if tag[0] == ":":
+        return int(tag[1:])
+    if tag[0] in "=-":
+        return len(tag) - 1
+    if tag[0] == "*":
+        return 1
+    if tag[0] == "~":
+        return int(tag[3:-2])
+    return 0
+
+
+def token_query_length(tag: str) -> int:
+    """Number of query bases of a token of csv tags (e.g. `=ACGT`, `:4`, `*ag` or `+tt`)"""
+    if tag[0] in "=+":
+        return len(tag) - 1
+    if tag[0] == ":":
+        return int(tag[1:])
+    if tag[0] == "*":
+        return 1
+    return 0
+
+
+###########################################################
+# Lengths of a csv tag
+###########################################################
+
+
+def reference_length(csv_tag: str) -> int:
+    """Number of reference bases covered by a csv tag
+
+    Example:
+        >>> from csvtag.utils import reference_length
+        >>> reference_length("=AC*ag-ttt+GG:3")
+        9
+    """
+    return sum(token_reference_length(tag) for tag in split_by_tag(csv_tag))
+
+
+def query_length(csv_tag: str) -> int:
+    """Number of query bases of a csv tag
+
+    Example:
+        >>> from csvtag.utils import query_length
+        >>> query_length("=AC*ag-ttt+GG:3")
+        8
+    """
+    return sum(token_query_length(tag) for tag in split_by_tag(csv_tag))
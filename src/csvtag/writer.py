@@ -0,0 +1,235 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import mmap
+import struct
+from array import array
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from csvtag.bgzf import BLOCK_SIZE, BgzfWriter, iter_lines, open_output
+
+if TYPE_CHECKING:
+    import numpy as np
+
+COLUMNS = ("QNAME", "RNAME", "POS", "CSVTAG")
+
+# Header of a QNAME index: magic and number of entries
+_INDEX_HEADER = struct.Struct("<8sQ")
+_INDEX_MAGIC = b"CSVQIDX\x01"
+
+###########################################################
+# Write and read csv tag results
+###########################################################
+
+
+def qname_hash(qname: str) -> int:
+    """64-bit hash of a QNAME used as the key of a QNAME index"""
+    return int.from_bytes(hashlib.blake2b(qname.encode(), digest_size=8).digest(), "little")
+
+
+def index_path(path_results: str | Path) -> Path:
+    """Path of the QNAME index of a result file (`results.tsv.gz` -> `results.tsv.gz.qidx`)"""
+    return Path(f"{path_results}.qidx")
+
+
+def format_row(result: dict[str, str | int]) -> str:
+    """A row of a result file with a trailing newline"""
+    return f"{result['QNAME']}\t{result['RNAME']}\t{result['POS']}\t{result['CSVTAG']}\n"
+
+
+class ResultWriter:
+    """Write the results of `caller.call` as a tab-separated file with a header line.
+    The file is compressed as BGZF on `threads` threads if the path ends with `.gz`.
+    With `index`, a QNAME index (`<path_output>.qidx`) is written on close for `QnameIndex`.
+
+    Example:
+        >>> from csvtag.writer import ResultWriter
+        >>> with ResultWriter("example.tsv") as writer:
+        ...     writer.write({"QNAME": "read1", "RNAME": "chr1", "POS": 100, "CSVTAG": "=AAAAA"})
+    """
+
+    def __init__(self, path_output: str | Path, threads: int | None = None, index: bool = False):
+        self.path_output = Path(path_output)
+        self.index = index
+        self._file = open_output(self.path_output, threads=threads)
+        # Uncompressed offset of the next row. SAM fields are ASCII, so characters are bytes.
+        self._offset = 0
+        self._last_qname = None
+        self._hashes = array("Q")
+        self._offsets = array("Q")
+        self._write_line("\t".join(COLUMNS) + "\n")
+
+    def _write_line(self, line: str) -> None:
+        self._file.write(line)
+        self._offset += len(line)
+
+    def _write_row(self, qname: str, line: str) -> None:
+        # Rows of a QNAME are contiguous in the output of `caller.call`, so only the first row is indexed
+        if self.index and qname != self._last_qname:
+            self._last_qname = qname
+            self._hashes.append(qname_hash(qname))
+            self._offsets.append(self._offset)
+        self._write_line(line)
+
+    def write(self, result: dict[str, str | int]) -> None:
+        self._write_row(result["QNAME"], format_row(result))
+
+    def write_rows(self, rows: str) -> None:
+        """Write rows already formatted by `format_row`, such as those sent by worker processes"""
+        if not self.index:
+            self._write_line(rows)
+            return
+        for line in rows.splitlines(keepends=True):
+            self._write_row(line[: line.index("\t")], line)
+
+    def write_all(self, results: Iterable[dict[str, str | int]]) -> None:
+        for result in results:
+            self.write(result)
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        self._file.close()
+        if self.index:
+            self._write_index()
+
+    def _write_index(self) -> None:
+        import numpy as np  # imported on first use since it takes a while to import
+
+        hashes = np.frombuffer(self._hashes, dtype=np.uint64)
+        offsets = np.frombuffer(self._offsets, dtype=np.uint64)
+        if isinstance(self._file, BgzfWriter):
+            block_offsets = np.array(self._file.block_offsets, dtype=np.uint64)
+            offsets = (block_offsets[offsets // BLOCK_SIZE] << np.uint64(16)) | (offsets % BLOCK_SIZE)
+        # A stable sort keeps the rows of a hash in the order of the file
+        order = np.argsort(hashes, kind="stable")
+        with open(index_path(self.path_output), "wb") as f:
+            f.write(_INDEX_HEADER.pack(_INDEX_MAGIC, len(hashes)))
+            f.write(hashes[order].astype("<u8").tobytes())
+            f.write(offsets[order].astype("<u8").tobytes())
+
+    def __call__(self, result: dict[str, str | int]) -> None:
+        self.write(result)
+
+    def __enter__(self) -> ResultWriter:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def write_results(
+    results: Iterable[dict[str, str | int]], path_output: str | Path, threads: int | None = None, index: bool = False
+) -> None:
+    """Write the results of `caller.call` to a tab-separated file
+
+    Args:
+        results (Iterable[dict[str, str | int]]): dictionaries with QNAME, RNAME, POS and CSVTAG
+        path_output (str | Path): the output path, compressed as BGZF if it ends with `.gz`
+        threads (int | None, optional): number of compression threads. Defaults to the number of CPUs.
+        index (bool, optional): also write a QNAME index (`<path_output>.qidx`) for `QnameIndex`.
+            Defaults to False.
+    """
+    with ResultWriter(path_output, threads=threads, index=index) as writer:
+        writer.write_all(results)
+
+
+def read_results(path_input: str | Path) -> Iterator[dict[str, str | int]]:
+    """Read results written by `write_results`
+
+    Args:
+        path_input (str | Path): a tab-separated file with QNAME, RNAME, POS and CSVTAG columns, optionally gzipped
+
+    Yields:
+        Iterator[dict[str, str | int]]: dictionaries with QNAME, RNAME, POS and CSVTAG
+    """
+    with gzip.open(path_input, "rt") if str(path_input).endswith(".gz") else open(path_input) as f:
+        next(f, None)  # header
+        for line in f:
+            yield _parse_row(line)
+
+
+def _parse_row(line: str) -> dict[str, str | int]:
+    qname, rname, pos, csv_tag = line.rstrip("\n").split("\t")
+    return {"QNAME": qname, "RNAME": rname, "POS": int(pos), "CSVTAG": csv_tag}
+
+
+###########################################################
+# Look up rows by QNAME
+###########################################################
+
+
+class QnameIndex:
+    """Random access to the rows of a result file by QNAME through the index written by `ResultWriter`.
+    The index is memory-mapped and searched by binary search, so a lookup takes O(log n) without
+    loading the index or the result file.
+
+    Example:
+        >>> from csvtag.writer import QnameIndex, write_results
+        >>> write_results(call("example.sam"), "results.tsv.gz", index=True)
+        >>> with QnameIndex("results.tsv.gz") as index:
+        ...     index.get("read1")
+        [{"QNAME": "read1", "RNAME": "chr1", "POS": 100, "CSVTAG": "=AAAAA"}, ...]
+    """
+
+    def __init__(self, path_results: str | Path):
+        import numpy as np
+
+        self.path_results = Path(path_results)
+        self._is_bgzf = str(path_results).endswith(".gz")
+        with open(index_path(path_results), "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n_entries = _INDEX_HEADER.unpack_from(self._mmap)
+        if magic != _INDEX_MAGIC:
+            raise ValueError(f"{index_path(path_results)} is not a QNAME index.")
+        self._hashes: np.ndarray = np.frombuffer(self._mmap, "<u8", n_entries, _INDEX_HEADER.size)
+        self._offsets: np.ndarray = np.frombuffer(self._mmap, "<u8", n_entries, _INDEX_HEADER.size + 8 * n_entries)
+        self._file = open(self.path_results, "rb")
+
+    def offsets(self, qname: str) -> list[int]:
+        """Offsets (virtual offsets for BGZF) of the first row of each run of rows that may be of the QNAME"""
+        key = self._hashes.dtype.type(qname_hash(qname))
+        start = int(self._hashes.searchsorted(key, "left"))
+        end = int(self._hashes.searchsorted(key, "right"))
+        return self._offsets[start:end].tolist()
+
+    def _iter_lines(self, offset: int) -> Iterator[bytes]:
+        if self._is_bgzf:
+            yield from iter_lines(self._file, offset)
+            return
+        self._file.seek(offset)
+        # Not `yield from self._file`, which would close the file when the lookup stops early
+        for line in self._file:
+            yield line
+
+    def get(self, qname: str) -> list[dict[str, str | int]]:
+        """All rows of a QNAME in the order of the file, or an empty list if there is none"""
+        prefix = f"{qname}\t".encode()
+        rows = []
+        for offset in self.offsets(qname):
+            for line in self._iter_lines(offset):
+                # Different QNAMEs with the same hash are skipped here
+                if not line.startswith(prefix):
+                    break
+                rows.append(_parse_row(line.decode()))
+        return rows
+
+    def __contains__(self, qname: str) -> bool:
+        return bool(self.get(qname))
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        self._file.close()
+        # Release the views of the arrays before closing the memory map
+        del self._hashes, self._offsets
+        self._mmap.close()
+
+    def __enter__(self) -> QnameIndex:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import gzip
+
+import pytest
+from csvtag.bgzf import BLOCK_SIZE, EOF_BLOCK, BgzfWriter, iter_lines, read_block, split_virtual_offset
+
+
+def _lines(n: int) -> list[str]:
+    return [f"read{i}\tchr1\t{i}\t=ACGT*AG=TTT{'A' * (i % 50)}\n" for i in range(n)]
+
+
+@pytest.mark.parametrize("threads", [1, 4])
+def test_bgzf_writer(tmp_path, threads):
+    path_output = tmp_path / "example.tsv.gz"
+    lines = _lines(20_000)
+    with BgzfWriter(path_output, threads=threads) as writer:
+        for line in lines:
+            writer.write(line)
+
+    assert path_output.read_bytes().endswith(EOF_BLOCK)
+    with gzip.open(path_output, "rt") as f:
+        assert f.readlines() == lines
+
+
+def test_bgzf_writer_threads_are_deterministic(tmp_path):
+    lines = "".join(_lines(20_000))
+    for threads in [1, 4]:
+        with BgzfWriter(tmp_path / f"{threads}.gz", threads=threads) as writer:
+            writer.write(lines)
+    assert (tmp_path / "1.gz").read_bytes() == (tmp_path / "4.gz").read_bytes()
+
+
+def test_virtual_offsets(tmp_path):
+    path_output = tmp_path / "example.tsv.gz"
+    lines = _lines(10_000)
+    offsets = []
+    with BgzfWriter(path_output, threads=4) as writer:
+        for line in lines:
+            offsets.append(writer.tell())
+            writer.write(line)
+
+    assert len({split_virtual_offset(offset)[0] for offset in offsets}) > 1
+    with open(path_output, "rb") as f:
+        for i in [0, 1, 4_999, 9_999]:
+            block_offset, within_block = split_virtual_offset(offsets[i])
+            data, next_block_offset = read_block(f, block_offset)
+            if within_block + len(lines[i]) > len(data):
+                data += read_block(f, next_block_offset)[0]
+            assert len(data) <= 2 * BLOCK_SIZE
+            assert data[within_block : within_block + len(lines[i])].decode() == lines[i]
+
+
+def test_iter_lines(tmp_path):
+    path_output = tmp_path / "example.tsv.gz"
+    lines = _lines(20_000)
+    virtual_offsets = {}
+    with BgzfWriter(path_output, threads=2) as writer:
+        for i, line in enumerate(lines):
+            if i in (0, 7_777, 19_999):
+                virtual_offsets[i] = writer.tell()
+            writer.write(line)
+    with open(path_output, "rb") as f:
+        for i, virtual_offset in virtual_offsets.items():
+            result = [line.decode() + "\n" for line in iter_lines(f, virtual_offset)]
+            expected = lines[i:]
+            assert result == expected, f"Expected {expected[:3]}, but got {result[:3]}"
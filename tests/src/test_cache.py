@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import pytest
+from csvtag.cache import ResultCache, fingerprint
+from csvtag.caller import call
+
+
+def test_fingerprint(tmp_path):
+    path = tmp_path / "example.sam"
+    path.write_bytes(os.urandom(1_000_000))
+    before = fingerprint(path, n_samples=4, block_size=1024)
+    assert before == fingerprint(path, n_samples=4, block_size=1024)
+
+    with open(path, "r+b") as f:
+        f.write(b"modified")
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert before != fingerprint(path, n_samples=4, block_size=1024)
+
+
+def test_key(tmp_path):
+    path = tmp_path / "example.sam"
+    path.write_text("read1")
+    cache = ResultCache(tmp_path / "cache")
+    assert cache.key(path, short_form=False) == cache.key(path, short_form=False)
+    assert cache.key(path, short_form=False) != cache.key(path, short_form=True)
+
+
+@pytest.mark.parametrize("quality", [False, True])
+def test_call_with_cache(tmp_path, quality):
+    path_sam = Path("tests/data/three_alignments_witn_inv.sam")
+    expected = list(call(path_sam, quality=quality))
+
+    result = list(call(path_sam, quality=quality, cache_dir=tmp_path))
+    assert result == expected, f"Expected {expected}, but got {result}"
+    assert len(list(tmp_path.glob("*.tsv.gz"))) == 1
+
+    result = list(call(path_sam, quality=quality, cache_dir=tmp_path))
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_unfinished_results_are_not_cached(tmp_path):
+    results = call(Path("tests/data/three_alignments_witn_inv.sam"), cache_dir=tmp_path)
+    next(results)
+    results.close()
+    assert list(tmp_path.glob("*.tsv.gz*")) == []
+
+
+def test_evict(tmp_path):
+    cache = ResultCache(tmp_path)
+    for i, key in enumerate(["a", "b", "c"]):
+        with cache.writer(key) as write:
+            write({"QNAME": "read1", "RNAME": "chr1", "POS": 1, "CSVTAG": "=A"})
+        os.utime(tmp_path / f"{key}.tsv.gz", ns=(i, i))
+    list(cache.get("a"))  # "a" is now the most recently used
+
+    cache.max_bytes = sum(path.stat().st_size for path in tmp_path.glob("*.tsv.gz")) - 1
+    cache.evict()
+    result = sorted(path.name for path in tmp_path.glob("*.tsv.gz"))
+    expected = ["a.tsv.gz", "c.tsv.gz"]
+    assert result == expected, f"Expected {expected}, but got {result}"
@@ -3,7 +3,17 @@ from __future__ import annotations
 from pathlib import Path
 
 import pytest
-from csvtag.caller import _is_second_strand_different, _is_within_bases, call
+from csvtag import caller
+from csvtag.caller import (
+    _is_second_strand_different,
+    _is_within_bases,
+    call,
+    call_records,
+    call_sweep,
+    chunk_groups,
+    group_alignments,
+)
+from csvtag.sam_handler import AlignmentFilter
 
 
 @pytest.mark.parametrize(
@@ -105,3 +115,123 @@ def test_call_inversion_sr_simulated():
     result.sort(key=lambda x: [x["QNAME"], x["RNAME"], x["POS"]])
     expected.sort(key=lambda x: [x["QNAME"], x["RNAME"], x["POS"]])
     assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_group_alignments_with_custom_stages():
+    alignments = [
+        {"QNAME": "read2", "RNAME": "ref", "FLAG": 0, "POS": 1, "CIGAR": "5M", "CSTAG": "=AAAAA"},
+        {"QNAME": "read1", "RNAME": "ref", "FLAG": 0, "POS": 11, "CIGAR": "5M", "CSTAG": "=ccccc"},
+        {"QNAME": "read1", "RNAME": "ref", "FLAG": 0, "POS": 1, "CIGAR": "10M", "CSTAG": "=GGGGGGGGGG"},
+        {"QNAME": "read1", "RNAME": "ref", "FLAG": 0, "POS": 3, "CIGAR": "3M", "CSTAG": "=GGG"},
+    ]
+    groups = list(group_alignments(iter(alignments)))
+    result = [[(a["QNAME"], a["POS"], a["CSTAG"]) for a in group] for group in groups]
+    expected = [[("read1", 1, "=GGGGGGGGGG"), ("read1", 11, "=CCCCC")], [("read2", 1, "=AAAAA")]]
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+    groups = list(group_alignments(iter(alignments), stages=[lambda group: group[:1]]))
+    result = [[(a["QNAME"], a["POS"]) for a in group] for group in groups]
+    expected = [[("read1", 1)], [("read2", 1)]]
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+@pytest.mark.parametrize(
+    "base_num, expected",
+    [
+        (0, [False, False, False]),
+        (10, [False, False, False]),
+        (50, [False, True, False]),
+    ],
+)
+def test_call_base_num(base_num, expected):
+    path_sam = Path("tests/data/inversion_map_ont.sam")
+    result = [alignment["CSVTAG"].islower() for alignment in call(path_sam, base_num=base_num)]
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_call_sweep():
+    path_sam = Path("tests/data/inversion_map_ont.sam")
+    base_nums = [0, 50, 100]
+    result = list(call_sweep(path_sam, base_nums))
+    expected = [{"BASE_NUM": b, **alignment} for b in base_nums for alignment in call(path_sam, base_num=b)]
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_call_sweep_of_combine_distances():
+    path_sam = Path("tests/data/three_alignments_witn_inv.sam")
+    base_nums = [0, 50]
+    combine_distances = [None, 3, 50]
+    result = list(call_sweep(path_sam, base_nums, combine_distances=combine_distances))
+    expected = [
+        {"BASE_NUM": b, "COMBINE_DISTANCE": d, **alignment}
+        for b in base_nums
+        for d in combine_distances
+        for alignment in call(path_sam, base_num=b, combine_distance=d)
+    ]
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_call_sweep_of_iterators(monkeypatch):
+    path_sam = Path("tests/data/four_alignments.sam")
+    # One read per chunk, so that the distances are iterated for every chunk
+    monkeypatch.setattr(caller, "chunk_groups", lambda groups: chunk_groups(groups, 1))
+    result = list(call_sweep(path_sam, iter([0, 50]), combine_distances=iter([None, 50])))
+    expected = list(call_sweep(path_sam, [0, 50], combine_distances=[None, 50]))
+    assert {alignment["QNAME"] for alignment in result} == {alignment["QNAME"] for alignment in call(path_sam)}
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_call_with_alignment_filter():
+    path_sam = Path("tests/data/inversion_splice_simulated.sam")
+    result = list(call(path_sam, alignment_filter=AlignmentFilter(exclude_secondary=True)))
+    expected = [alignment for alignment in call(path_sam) if alignment["POS"] != 1]
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_call_with_combine_distance():
+    path_sam = Path("tests/data/three_alignments_witn_inv.sam")
+    result = list(call(path_sam, combine_distance=50))
+    expected = [{"QNAME": "read1", "RNAME": "ref", "POS": 1, "CSVTAG": "=AAAAANNNNN*ag=aannnnn=GGGGG"}]
+    assert result == expected, f"Expected {expected}, but got {result}"
+    result = list(call(path_sam, combine_distance=3))
+    expected = list(call(path_sam))
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_call_with_combine_distance_of_short_form(tmp_path):
+    path_fasta = tmp_path / "reference.fa"
+    path_fasta.write_text(">ref\nAAAAACCCCCTTTTTCCCCCGGGGG\n")
+    lines = Path("tests/data/three_alignments_witn_inv.sam").read_text().splitlines()
+    short_cstags = ["cs:Z::5", "cs:Z::2*tc:2", "cs:Z::5"]
+    path_sam = tmp_path / "short_form.sam"
+    path_sam.write_text(
+        "\n".join([lines[0]] + [line.rsplit("\t", 1)[0] + "\t" + cs for line, cs in zip(lines[1:], short_cstags)])
+    )
+    path_sam_long = Path("tests/data/three_alignments_witn_inv.sam")
+    for short_form in [False, True]:
+        result = list(call(path_sam, reference=path_fasta, short_form=short_form, combine_distance=50))
+        expected = list(call(path_sam_long, short_form=short_form, combine_distance=50))
+        assert result == expected, f"Expected {expected}, but got {result}"
+    with pytest.raises(ValueError):
+        list(call(path_sam, combine_distance=50))
+
+
+def test_call_of_short_form_inversion(tmp_path):
+    path_fasta = tmp_path / "reference.fa"
+    path_fasta.write_text(">ref\nAAAAACCCCCTTTTTCCCCCGGGGG\n")
+    lines = Path("tests/data/three_alignments_witn_inv.sam").read_text().splitlines()
+    path_sam = tmp_path / "short_form.sam"
+    path_sam.write_text("\n".join([lines[0]] + [line.rsplit("\t", 1)[0] + "\tcs:Z::5" for line in lines[1:]]))
+    result = [alignment["CSVTAG"] for alignment in call(path_sam, reference=path_fasta)]
+    expected = [":5", "=aaaaa", ":5"]
+    assert result == expected, f"Expected {expected}, but got {result}"
+    with pytest.raises(ValueError, match="reference"):
+        list(call(path_sam))
+
+
+def test_call_records():
+    path_sam = Path("tests/data/inversion_sr_simulated.sam")
+    expected = list(call(path_sam))
+    with open(path_sam, "rb") as f:
+        result = list(call_records(f))
+    assert result == expected, f"Expected {expected}, but got {result}"
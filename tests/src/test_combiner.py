@@ -2,13 +2,14 @@ from __future__ import annotations
 
 import pytest
 from csvtag.combiner import (
+    _CsvTagBuilder,
     _get_n_lengths,
     _group_tags_by_distance,
-    _padding_n,
-    _remove_contiguous_equals,
+    combine_neighboring_alignments,
     combine_neighboring_csv_tags,
     combine_splitted_tags,
 )
+from csvtag.splitter import split_by_tag
 
 
 @pytest.mark.parametrize(
@@ -66,24 +67,39 @@ def test_group_tags_by_distance(csv_tags, n_lengths, distance, expected):
         ("=A*TC", 2, "right", "=A*TC=NN"),
         ("=aa", 4, "left", "=nnnnaa"),  # inversion
         ("=aa", 4, "right", "=aannnn"),  # inversion
+        ("=A*TC", 0, "right", "=A*TC"),
+        ("=A*TC", -3, "left", "=A*TC"),
     ],
 )
-def test_padding_n(csv_tag, n_length, side, expected):
-    result = _padding_n(csv_tag, n_length, side)
+def test_csv_tag_builder_pad_n(csv_tag, n_length, side, expected):
+    builder = _CsvTagBuilder()
+    tokens = list(split_by_tag(csv_tag))
+    if side == "right":
+        builder.extend(tokens)
+    builder.pad_n(n_length, is_inversion=tokens[0].islower())
+    if side == "left":
+        builder.extend(tokens)
+    result = builder.build()
     assert result == expected, f"Expected {expected}, but got {result}"
 
 
 @pytest.mark.parametrize(
-    "input_data, expected",
+    "tokens, expected",
     [
-        (["=ANNN", "=BBBB"], ["=ANNN", "BBBB"]),
-        (["=aaaa", "=bbbb"], ["=aaaa", "bbbb"]),
-        (["=AAAA", "=aaaa"], ["=AAAA", "=aaaa"]),
-        (["=aaaa", "=AAAA"], ["=aaaa", "=AAAA"]),
+        (["=ANNN", "=CCCC"], "=ANNNCCCC"),
+        (["=aaaa", "=cccc"], "=aaaacccc"),
+        (["=AAAA", "=aaaa"], "=AAAA=aaaa"),
+        (["=aaaa", "=AAAA"], "=aaaa=AAAA"),
+        (["=AN", "=CN", "=GG"], "=ANCNGG"),
+        (["=AA", "*AG", "=CC", "-T", "=GG"], "=AA*AG=CC-T=GG"),
+        (["*AG", "*CT"], "*AG*CT"),
     ],
 )
-def test_remove_contiguous_equals(input_data, expected):
-    result = _remove_contiguous_equals(input_data)
+def test_csv_tag_builder_merges_contiguous_equals(tokens, expected):
+    builder = _CsvTagBuilder()
+    for token in tokens:
+        builder.append(token)
+    result = builder.build()
     assert result == expected, f"Expected {expected}, but got {result}"
 
 
@@ -112,3 +128,32 @@ def test_remove_contiguous_equals(input_data, expected):
 def test_combine_neighboring_csv_tags(csv_tags, positions, distance, expected):
     result = list(combine_neighboring_csv_tags(csv_tags, positions, distance))
     assert result == expected, f"Expected {expected}, but got {result}"
+
+
+@pytest.mark.parametrize(
+    "csv_tags, positions, spans, expected",
+    [
+        (["=A", "=C"], [1, 5], None, [(1, f'=A{"N"*3}C')]),
+        # Reference spans include deleted bases, which are not part of the query
+        (["=A-gg", "=C"], [1, 10], [3, 1], [(1, f'=A-gg={"N"*6}C')]),
+        (["=A", "=C", "=T"], [1, 5, 100], None, [(1, f'=A{"N"*3}C'), (100, "=T")]),
+    ],
+)
+def test_combine_neighboring_alignments(csv_tags, positions, spans, expected):
+    result = combine_neighboring_alignments(csv_tags, positions, 50, spans)
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+@pytest.mark.parametrize(
+    "csv_tags, positions, expected",
+    [
+        # The second csv tag is consumed by the microhomology with the first
+        (["=ACGT", "=GT", "=TTTT"], [1, 10, 20], ["=ACGT" + "N" * 13 + "TTT"]),
+        (["=AAGT", "=gt", "=CCCC"], [1, 10, 20], ["=AAGT" + "N" * 13 + "CCCC"]),
+        # No N padding is left at the end when the last csv tag is consumed
+        (["=ACGT", "=GT"], [1, 10], ["=ACGT"]),
+    ],
+)
+def test_combine_neighboring_csv_tags_consumed_by_microhomology(csv_tags, positions, expected):
+    result = combine_neighboring_csv_tags(csv_tags, positions, 50)
+    assert result == expected, f"Expected {expected}, but got {result}"
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+from collections import Counter
+
+import pytest
+from csvtag.differ import allele_key, count_alleles, diff_results, write_diff
+
+
+def _results(csv_tags: list[str], pos: int = 1) -> list[dict[str, str | int]]:
+    return [{"QNAME": f"read{i}", "RNAME": "chr1", "POS": pos, "CSVTAG": t} for i, t in enumerate(csv_tags)]
+
+
+@pytest.mark.parametrize("run_size", [1, 2, 1000])
+def test_count_alleles(run_size):
+    results = _results(["=AA", "=AC", "=AA", "=tt", "=AA", "=AC"]) + _results(["=AA"], pos=5)
+    result = [(key[3], key[1], count) for key, count in count_alleles(results, run_size=run_size)]
+    keys = sorted({allele_key(r) for r in results})
+    counter = Counter(allele_key(r) for r in results)
+    expected = [(key[3], key[1], counter[key]) for key in keys]
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_count_alleles_presorted():
+    results = sorted(_results(["=AA", "=AC", "=AA"]), key=allele_key)
+    result = [(key[3], count) for key, count in count_alleles(results, presorted=True)]
+    expected = sorted([("=AA", 2), ("=AC", 1)], key=lambda x: allele_key({"RNAME": "chr1", "POS": 1, "CSVTAG": x[0]}))
+    assert result == expected, f"Expected {expected}, but got {result}"
+    with pytest.raises(ValueError):
+        list(count_alleles(reversed(results), presorted=True))
+
+
+def test_diff_results():
+    results_a = _results(["=AA", "=AA", "=AC", "=tt"])
+    results_b = _results(["=AA", "=AC", "=GG", "=GG", "=tt"])
+    result = {r["CSVTAG"]: (r["COUNT_A"], r["COUNT_B"], r["DIFF"]) for r in diff_results(results_a, results_b)}
+    expected = {"=AA": (2, 1, -1), "=AC": (1, 1, 0), "=GG": (0, 2, 2), "=tt": (1, 1, 0)}
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+    result = {r["CSVTAG"] for r in diff_results(results_a, results_b, min_difference=1, run_size=1)}
+    expected = {"=AA", "=GG"}
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_write_diff(tmp_path):
+    path_output = tmp_path / "diff.tsv"
+    write_diff(diff_results(_results(["=AA"]), _results(["=AC"])), path_output)
+    result = sorted(path_output.read_text().splitlines()[1:])
+    expected = ["chr1\t1\t=AA\t1\t0\t-1", "chr1\t1\t=AC\t0\t1\t1"]
+    assert result == expected, f"Expected {expected}, but got {result}"
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+from csvtag.caller import call
+from csvtag.haplotype import call_collapsed, call_haplotypes, collapse_groups
+
+
+def _write_duplicated_sam(path_sam: Path, path_output: Path, qnames: list[str]) -> None:
+    """Copy the alignments of a SAM file under each QNAME"""
+    lines = [line for line in path_sam.read_text().splitlines() if line]
+    headers = [line for line in lines if line.startswith("@")]
+    alignments = [line.split("\t") for line in lines if not line.startswith("@")]
+    duplicated = ["\t".join([qname + "_" + fields[0]] + fields[1:]) for qname in qnames for fields in alignments]
+    path_output.write_text("\n".join(headers + duplicated) + "\n")
+
+
+def test_collapse_groups():
+    groups = [
+        [{"QNAME": "read1", "RNAME": "chr1", "POS": 1, "FLAG": 0, "CIGAR": "5M", "CSTAG": "=AAAAA"}],
+        [{"QNAME": "read2", "RNAME": "chr1", "POS": 1, "FLAG": 0, "CIGAR": "5M", "CSTAG": "=AACAA"}],
+        [{"QNAME": "read3", "RNAME": "chr1", "POS": 1, "FLAG": 0, "CIGAR": "5M", "CSTAG": "=AAAAA"}],
+    ]
+    representatives, members = collapse_groups(groups)
+    assert representatives == [groups[0], groups[1]]
+    assert members == [["read1", "read3"], ["read2"]]
+
+
+@pytest.mark.parametrize(
+    "path_sam",
+    [
+        Path("tests/data/four_alignments.sam"),
+        Path("tests/data/three_alignments_witn_inv.sam"),
+        Path("tests/data/inversion_sr_simulated.sam"),
+    ],
+)
+def test_call_collapsed(tmp_path, path_sam):
+    path_duplicated = tmp_path / "duplicated.sam"
+    _write_duplicated_sam(path_sam, path_duplicated, ["b", "a", "c"])
+    result = list(call_collapsed(path_duplicated))
+    expected = list(call(path_duplicated))
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_call_haplotypes(tmp_path):
+    path_duplicated = tmp_path / "duplicated.sam"
+    _write_duplicated_sam(Path("tests/data/three_alignments_witn_inv.sam"), path_duplicated, ["a", "b", "c"])
+    result = list(call_haplotypes(path_duplicated))
+    expected = [
+        {
+            "HAPLOTYPE": 0,
+            "COUNT": 3,
+            "RNAME": alignment["RNAME"],
+            "POS": alignment["POS"],
+            "CSVTAG": alignment["CSVTAG"],
+        }
+        for alignment in call(Path("tests/data/three_alignments_witn_inv.sam"))
+    ]
+    assert result == expected, f"Expected {expected}, but got {result}"
@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+import csvtag
+
+
+def _run_python(code: str) -> subprocess.CompletedProcess:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(["src", os.environ.get("PYTHONPATH", "")]))
+    return subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, env=env)
+
+
+@pytest.mark.parametrize("name", csvtag.__all__)
+def test_public_api(name):
+    assert callable(getattr(csvtag, name))
+
+
+def test_unknown_attribute():
+    with pytest.raises(AttributeError):
+        csvtag.unknown_function  # noqa: B018
+
+
+def test_import_does_not_load_heavy_dependencies():
+    code = "import sys, csvtag; csvtag.call; csvtag.to_sequence('=AA'); print(sorted(sys.modules))"
+    process = _run_python(code)
+    assert process.returncode == 0, process.stderr
+    modules = process.stdout
+    assert "'cstag'" not in modules
+    assert "'numpy'" not in modules
+
+
+def test_import_time():
+    # Cumulative import time of `csvtag` in microseconds, reported by `python -X importtime`
+    process = _run_python("import csvtag")
+    cumulative = [int(m.group(1)) for m in re.finditer(r"\|\s*(\d+) \|\s*csvtag$", process.stderr, re.MULTILINE)]
+    assert cumulative and cumulative[0] < 50_000, process.stderr
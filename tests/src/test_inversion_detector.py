@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import random
+
+import numpy as np
+import pytest
+from csvtag.caller import convert_to_csvtag
+from csvtag.inversion_detector import convert_to_csvtag_batch, detect_inversions
+
+
+@pytest.mark.parametrize(
+    "flags, positions, ends, group_ids, expected",
+    [
+        ([0, 16, 0], [1, 11, 21], [6, 16, 26], [0, 0, 0], [False, True, False]),
+        ([0, 0, 0], [1, 11, 21], [6, 16, 26], [0, 0, 0], [False, False, False]),
+        ([0, 16, 0], [1, 100, 200], [6, 105, 205], [0, 0, 0], [False, False, False]),
+        ([0, 16, 0], [1, 11, 21], [6, 16, 26], [0, 0, 1], [False, False, False]),  # across groups
+        ([0, 16, 0, 16, 0], [1, 11, 21, 31, 41], [6, 16, 26, 36, 46], [0] * 5, [False, True, False, True, False]),
+        ([0, 16], [1, 11], [6, 16], [0, 0], [False, False]),
+    ],
+)
+def test_detect_inversions(flags, positions, ends, group_ids, expected):
+    result = detect_inversions(np.array(flags), np.array(positions), np.array(ends), np.array(group_ids)).tolist()
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def _simulate_group(qname: str, rng: random.Random) -> list[dict[str, str | int]]:
+    alignments = []
+    pos = 1
+    for _ in range(rng.randint(1, 8)):
+        pos += rng.randint(0, 80)
+        alignments.append(
+            {"QNAME": qname, "RNAME": "ref", "FLAG": rng.choice([0, 16]), "POS": pos, "CIGAR": "5M", "CSTAG": "=ACGTA"}
+        )
+        pos += 5
+    return alignments
+
+
+def test_convert_to_csvtag_batch_is_same_as_loop():
+    rng = random.Random(1)
+    groups = [_simulate_group(f"read{i}", rng) for i in range(500)]
+    expected = [alignment for group in groups for alignment in convert_to_csvtag(group)]
+    result = list(convert_to_csvtag_batch(groups))
+    assert result == expected
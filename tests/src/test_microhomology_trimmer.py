@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import pytest
 
-from csvtag.microhomology_trimmer import _get_length_of_microhomology, trim_microhomology
+from csvtag.microhomology_trimmer import _get_length_of_microhomology, _trim_leading_nucleotides, trim_microhomology
 
 # @pytest.mark.parametrize(
 #     "curr_sequence, next_sequence, curr_qual, next_qual, expected",
@@ -93,3 +93,22 @@ def test_get_length_of_microhomology(curr_sequence, next_sequence, expected):
 def test_trim_microhomology(csv_tags, expected):
     result = trim_microhomology(csv_tags)
     assert result == expected, f"Expected {expected}, but got {result}"
+
+
+@pytest.mark.parametrize(
+    "csv_tag, n_nucleotides, expected",
+    [
+        ("=AAATTT", 0, "=AAATTT"),
+        ("=AAATTT", 3, "=TTT"),
+        ("=AA*AG=CC", 3, "=CC"),
+        ("=AA*AG=CC", 1, "=A*AG=CC"),
+        ("=AA+T=CC", 2, "+T=CC"),
+        ("=AA+T=CC", 3, "=C"),
+        ("=A-GG=CC", 2, "-G=CC"),
+        ("=aa*ga=tt", 1, "=a*ga=tt"),
+        ("=A~GT5AG=CC", 2, "=NNNNCC"),
+    ],
+)
+def test_trim_leading_nucleotides(csv_tag, n_nucleotides, expected):
+    result = _trim_leading_nucleotides(csv_tag, n_nucleotides)
+    assert result == expected, f"Expected {expected}, but got {result}"
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from csvtag.caller import call
+from csvtag.parallel import _SharedRows, _to_shared_rows, _write_shared_rows, call_many, call_parallel
+from csvtag.sam_handler import AlignmentFilter
+from csvtag.writer import ResultWriter, read_results
+
+
+def test_call_many(tmp_path):
+    paths_sam = [
+        Path("tests/data/four_alignments.sam"),
+        Path("tests/data/one_alignment.sam"),
+        Path("tests/data/inversion_sr_simulated.sam"),
+    ]
+    results = [[] for _ in paths_sam]
+    sinks = [results[0].append, tmp_path / "one_alignment.tsv", results[2].append]
+
+    stats = call_many(paths_sam, sinks, workers=2)
+
+    assert results[0] == list(call(paths_sam[0]))
+    assert list(read_results(tmp_path / "one_alignment.tsv")) == list(call(paths_sam[1]))
+    assert results[2] == list(call(paths_sam[2]))
+    assert stats[str(paths_sam[0])] == {"reads": 2, "alignments": 8, "inversions": 2}
+    assert stats[str(paths_sam[1])] == {"reads": 1, "alignments": 1, "inversions": 0}
+
+
+def test_call_parallel():
+    path_sam = Path("tests/data/four_alignments.sam")
+    result = list(call_parallel(path_sam, workers=2, n_chunks=3))
+    expected = list(call(path_sam))
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_call_parallel_with_combine_distance():
+    path_sam = Path("tests/data/four_alignments.sam")
+    result = list(call_parallel(path_sam, workers=2, n_chunks=3, combine_distance=50))
+    expected = list(call(path_sam, combine_distance=50))
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_call_parallel_with_fraction(tmp_path):
+    path_sam = tmp_path / "many_reads.sam"
+    lines = Path("tests/data/four_alignments.sam").read_text().splitlines()
+    alignments = [line.split("\t") for line in lines if line and not line.startswith("@")]
+    path_sam.write_text(
+        "\n".join("\t".join([f"{fields[0]}_{i}"] + fields[1:]) for i in range(100) for fields in alignments) + "\n"
+    )
+    expected = list(call(path_sam, fraction=0.3, seed=7))
+    assert 0 < len({alignment["QNAME"] for alignment in expected}) < 200
+    for workers in [1, 2]:
+        alignment_filter = AlignmentFilter(fraction=0.3, seed=7)
+        result = list(call_parallel(path_sam, workers=workers, n_chunks=4, alignment_filter=alignment_filter))
+        # Each byte range is sorted by QNAME separately
+        result.sort(key=lambda x: (x["QNAME"], x["RNAME"], x["POS"]))
+        assert result == expected, f"Expected {expected}, but got {result}"
+
+
+@pytest.mark.parametrize("index", [False, True])
+def test_write_shared_rows(tmp_path, index):
+    path_sam = Path("tests/data/inversion_sr_simulated.sam")
+    expected = list(call(path_sam))
+    rows = _to_shared_rows(expected)
+    assert isinstance(rows, _SharedRows)
+    with ResultWriter(tmp_path / "result.tsv", index=index) as writer:
+        _write_shared_rows(rows, writer)
+    with ResultWriter(tmp_path / "expected.tsv", index=index) as writer:
+        writer.write_all(expected)
+    for suffix in [".tsv"] + [".tsv.qidx"] * index:
+        result = (tmp_path / f"result{suffix}").read_bytes()
+        assert result == (tmp_path / f"expected{suffix}").read_bytes(), f"Mismatch of {suffix}"
+
+
+def test_to_shared_rows_of_empty_results():
+    assert _to_shared_rows([]) == []
+
+
+@pytest.mark.parametrize("shared_memory", [False, True])
+def test_call_many_to_paths(tmp_path, shared_memory):
+    paths_sam = [Path("tests/data/four_alignments.sam"), Path("tests/data/inversion_sr_simulated.sam")]
+    sinks = [tmp_path / f"{path_sam.stem}.tsv" for path_sam in paths_sam]
+    stats = call_many(paths_sam, sinks, workers=2, chunk_bytes=200, shared_memory=shared_memory)
+    assert stats[str(paths_sam[0])] == {"reads": 2, "alignments": 8, "inversions": 2}
+    for path_sam, sink in zip(paths_sam, sinks):
+        # Each byte range is sorted by QNAME separately
+        result = sorted(read_results(sink), key=lambda x: (x["QNAME"], x["RNAME"], x["POS"]))
+        expected = list(call(path_sam))
+        assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_call_many_without_resource_tracker_warnings(tmp_path):
+    code = (
+        "from csvtag.parallel import call_many;"
+        "call_many(['tests/data/inversion_sr_simulated.sam', 'tests/data/four_alignments.sam'],"
+        f"[{str(tmp_path / 'a.tsv')!r}, {str(tmp_path / 'b.tsv')!r}], workers=2, chunk_bytes=2000)"
+    )
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(["src", os.environ.get("PYTHONPATH", "")]))
+    result = subprocess.run([sys.executable, "-W", "error", "-c", code], capture_output=True, text=True, env=env)
+    assert result.returncode == 0, result.stderr
+    assert result.stderr == "", result.stderr
+
+
+@pytest.mark.parametrize("combine_distance", [None, 50])
+def test_call_many_stats_of_inversion(tmp_path, combine_distance):
+    path_sam = Path("tests/data/three_alignments_witn_inv.sam")
+    stats = call_many([path_sam], [tmp_path / "result.tsv"], workers=1, combine_distance=combine_distance)
+    alignments = 3 if combine_distance is None else 1
+    expected = {"reads": 1, "alignments": alignments, "inversions": 1}
+    result = stats[str(path_sam)]
+    assert result == expected, f"Expected {expected}, but got {result}"
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import math
+from pathlib import Path
+
+import pytest
+from csvtag.caller import call
+from csvtag.quality import attach_quality, inversion_qualities, orient_quality, variant_qualities
+
+
+@pytest.mark.parametrize(
+    "qual, cigar, flag, expected",
+    [
+        ("ABCDE", "5M", 0, "ABCDE"),
+        ("ABCDE", "5M", 16, "EDCBA"),
+        ("ABCDE", "1S3M1S", 0, "BCD"),
+        ("ABCDE", "2S3M", 16, "EDC"),
+        ("*", "5M", 0, "*"),
+    ],
+)
+def test_orient_quality(qual, cigar, flag, expected):
+    result = orient_quality(qual, cigar, flag)
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_attach_quality():
+    token_quality = attach_quality("=AA*AG+TT-C=A", "IIA+5I")
+    assert token_quality.tokens == ["=AA", "*AG", "+TT", "-C", "=A"]
+    assert token_quality.offsets.tolist() == [0, 2, 3, 5, 5, 6]
+    assert token_quality.of(2).tolist() == [10, 20]
+    means = token_quality.mean().tolist()
+    assert means[:3] == [40.0, 32.0, 15.0] and math.isnan(means[3]) and means[4] == 40.0
+
+
+def test_attach_quality_length_mismatch():
+    with pytest.raises(ValueError):
+        attach_quality("=AAA", "II")
+
+
+def test_variant_qualities():
+    result = variant_qualities("=AA*AG+TT-C=A", "IIA+5I")
+    expected = [("*AG", 32.0), ("+TT", 15.0)]
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_inversion_qualities():
+    result = inversion_qualities("=AA=aa*ag=AA=cc", "II555II++")
+    expected = [("=aa*ag", 20.0), ("=cc", 10.0)]
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+@pytest.mark.parametrize(
+    "path_sam",
+    [
+        Path("tests/data/three_alignments_witn_inv.sam"),
+        Path("tests/data/inversion_map_ont.sam"),
+    ],
+)
+def test_call_quality(path_sam):
+    for result in call(path_sam, quality=True):
+        token_quality = attach_quality(result["CSVTAG"], result["QUAL"])
+        assert token_quality.offsets[-1] == len(result["QUAL"])
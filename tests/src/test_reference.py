@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import pickle
+
+import pytest
+from csvtag.caller import call
+from csvtag.reference import FastaReference, expand_short_form, index_fasta, read_fai
+
+SEQUENCE = "AAAAACCCCCTTTTTCCCCCGGGGG"
+
+
+@pytest.fixture
+def path_fasta(tmp_path):
+    path_fasta = tmp_path / "reference.fa"
+    lines = [SEQUENCE[i : i + 7] for i in range(0, len(SEQUENCE), 7)]
+    path_fasta.write_text(">chr0\nACGT\n>ref description\n" + "\n".join(lines) + "\n")
+    return path_fasta
+
+
+def test_index_fasta_is_same_as_fai(path_fasta, tmp_path):
+    path_fai = tmp_path / "reference.fa.fai"
+    path_fai.write_text("chr0\t4\t6\t4\t5\nref\t25\t28\t7\t8\n")
+    assert index_fasta(path_fasta) == read_fai(path_fai)
+
+
+@pytest.mark.parametrize(
+    "start, end",
+    [(0, 25), (0, 1), (3, 9), (6, 7), (7, 14), (20, 25), (24, 25)],
+)
+def test_fetch(path_fasta, start, end):
+    reference = FastaReference(path_fasta, chunk_size=4, cache_size=2)
+    result = reference.fetch("ref", start, end)
+    expected = SEQUENCE[start:end]
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+@pytest.mark.parametrize(
+    "rname, start, end",
+    [
+        ("ref", 20, 30),
+        ("ref", 25, 26),
+        ("ref", 30, 35),
+        ("ref", -1, 2),
+        ("chr0", 2, 6),
+    ],
+)
+def test_fetch_out_of_range(path_fasta, rname, start, end):
+    reference = FastaReference(path_fasta, chunk_size=4, cache_size=2)
+    with pytest.raises(ValueError, match=f"{rname}:{start}-{end}"):
+        reference.fetch(rname, start, end)
+
+
+def test_expand_short_form_out_of_range(path_fasta):
+    reference = FastaReference(path_fasta)
+    with pytest.raises(ValueError, match="ref"):
+        expand_short_form(":30", "ref", 1, reference)
+
+
+def test_fetch_after_pickle(path_fasta):
+    reference = pickle.loads(pickle.dumps(FastaReference(path_fasta)))
+    assert reference.fetch("chr0", 0, 4) == "ACGT"
+
+
+@pytest.mark.parametrize(
+    "csv_tag, pos, is_reverse, expected",
+    [
+        (":5", 1, False, "=AAAAA"),
+        (":2*TC:2", 11, False, "=TT*TC=TT"),
+        ("=AA-CCC:2+G:3", 4, False, "=AA-CCC=CC+G=TTT"),
+        (":2*AG:2", 11, True, "=AA*AG=AA"),  # reverse complement of "=TT*TC=TT"
+        ("=AAAAA", 1, False, "=AAAAA"),
+    ],
+)
+def test_expand_short_form(path_fasta, csv_tag, pos, is_reverse, expected):
+    reference = FastaReference(path_fasta)
+    result = expand_short_form(csv_tag, "ref", pos, reference, is_reverse=is_reverse)
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_call_short_form(path_fasta, tmp_path):
+    path_sam = tmp_path / "short_form.sam"
+    path_sam.write_text(
+        "@SQ\tSN:ref\tLN:25\n"
+        "read1\t0\tref\t1\t60\t5M\t*\t0\t\tAAAAA\t!!!!!\tcs:Z::5\n"
+        "read1\t16\tref\t11\t60\t5M\t*\t0\t\tTTCTT\t!!!!!\tcs:Z::2*tc:2\n"
+        "read1\t0\tref\t21\t60\t5M\t*\t0\t\tGGGGG\t!!!!!\tcs:Z::5\n"
+    )
+    result = list(call(path_sam, reference=path_fasta))
+    expected = [
+        {"QNAME": "read1", "RNAME": "ref", "POS": 1, "CSVTAG": ":5"},
+        {"QNAME": "read1", "RNAME": "ref", "POS": 11, "CSVTAG": "=aa*ag=aa"},
+        {"QNAME": "read1", "RNAME": "ref", "POS": 21, "CSVTAG": ":5"},
+    ]
+    assert result == expected, f"Expected {expected}, but got {result}"
@@ -1,12 +1,21 @@
 from __future__ import annotations
 
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
 import pytest
 
 from csvtag.sam_handler import (
+    AlignmentFilter,
     calculate_alignment_length,
     extract_alignment,
     extract_sqheaders,
     is_forward_strand,
+    read_records,
+    read_sam,
+    read_sam_range,
+    split_sam_by_qname,
     trim_softclip,
 )
 
@@ -64,6 +73,55 @@ def test_extract_alignment():
     assert result == expected, f"Expected {expected}, but got {result}"
 
 
+@pytest.mark.parametrize(
+    "alignment_filter, expected",
+    [
+        (AlignmentFilter(), ["r001", "r002", "r003", "r_004"]),
+        (AlignmentFilter(rname="chr2"), ["r003"]),
+        (AlignmentFilter(region="chr1:10-20"), ["r001", "r002"]),
+        (AlignmentFilter(region="chr1:16-20"), ["r002"]),  # r001 covers chr1:7-15
+        (AlignmentFilter(min_mapq=20), ["r001", "r003", "r_004"]),
+        (AlignmentFilter(exclude_secondary=True), ["r001", "r002", "r003"]),
+        (AlignmentFilter(qnames={"r002", "r,004"}), ["r002", "r_004"]),
+    ],
+)
+def test_extract_alignment_with_filter(alignment_filter, expected):
+    sam = [
+        ["@SQ", "SN:chr1", "LN:100"],
+        ["r001", "0", "chr1", "7", "60", "9M", "*", "0", "0", "AAAAAAAAA", "*", "cs:Z::9"],
+        ["r002", "16", "chr1", "18", "10", "2S5M", "*", "0", "0", "AAAAAAA", "*", "cs:Z::5"],
+        ["r003", "2048", "chr2", "1", "30", "5M", "*", "0", "0", "AAAAA", "*", "cs:Z::5"],
+        ["r,004", "256", "chr1", "50", "30", "5M", "*", "0", "0", "AAAAA", "*", "cs:Z::5"],
+    ]
+    result = [alignment["QNAME"] for alignment in extract_alignment(sam, alignment_filter)]
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+@pytest.mark.parametrize(
+    "region, expected",
+    [
+        ("chr1", ("chr1", 1, sys.maxsize)),
+        ("chr1:100", ("chr1", 100, sys.maxsize)),
+        ("chr1:1,000-2,000", ("chr1", 1000, 2000)),
+        ("HLA-A*01:01:1-5", ("HLA-A*01:01", 1, 5)),
+    ],
+)
+def test_alignment_filter_region(region, expected):
+    result = AlignmentFilter(region=region)._region
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+@pytest.mark.parametrize("region", ["chr1:", "chr1:200-100", "chr1:0-10", "chr1:a-b", ":1-10"])
+def test_alignment_filter_invalid_region(region):
+    with pytest.raises(ValueError, match="region"):
+        AlignmentFilter(region=region)
+
+
+def test_alignment_filter_cache_key():
+    assert AlignmentFilter(qnames=["a", "b"]).cache_key() == AlignmentFilter(qnames=("b", "a")).cache_key()
+    assert AlignmentFilter(min_mapq=20).cache_key() != AlignmentFilter().cache_key()
+
+
 @pytest.mark.parametrize(
     "cigar, expected",
     [
@@ -92,3 +150,116 @@ def testcalculate_alignment_length(cigar, expected):
 )
 def test_trim_softclip(qual, cigar, expected):
     assert trim_softclip(qual, cigar) == expected
+
+
+def test_split_sam_by_qname(tmp_path):
+    path_sam = tmp_path / "test.sam"
+    path_sam.write_text(
+        "@SQ\tSN:ref\tLN:100\n"
+        "read1\t0\tref\t1\n"
+        "read1\t16\tref\t11\n"
+        "read2\t0\tref\t1\n"
+        "read3\t0\tref\t1\n"
+        "read3\t0\tref\t21\n"
+        "read3\t16\tref\t11\n"
+    )
+    for n_chunks in range(1, 10):
+        ranges = split_sam_by_qname(path_sam, n_chunks)
+        assert ranges[0][0] == 0 and ranges[-1][1] == path_sam.stat().st_size
+        lines = [[line[0] for line in read_sam_range(path_sam, start, end)] for start, end in ranges]
+        assert sum(lines, []) == [line.split("\t")[0] for line in path_sam.read_text().splitlines()]
+        qnames = [{qname for qname in chunk if not qname.startswith("@")} for chunk in lines]
+        assert all(not (a & b) for i, a in enumerate(qnames) for b in qnames[i + 1 :])
+
+
+def test_alignment_filter_fraction():
+    fields = [[f"read{i}", "0", "chr1", "1", "60", "5M"] for i in range(10_000)]
+    kept = [f[0] for f in fields if AlignmentFilter(fraction=0.1)(f)]
+    assert 800 < len(kept) < 1200
+    assert kept == [f[0] for f in fields if AlignmentFilter(fraction=0.1)(f)]
+    assert kept != [f[0] for f in fields if AlignmentFilter(fraction=0.1, seed=1)(f)]
+    assert not any(AlignmentFilter(fraction=0.0)(f) for f in fields)
+    with pytest.raises(ValueError):
+        AlignmentFilter(fraction=1.5)
+
+
+def test_read_records():
+    path_sam = Path("tests/data/three_alignments_witn_inv.sam")
+    expected = list(read_sam(path_sam))
+    lines = path_sam.read_text().splitlines()
+    for records in [lines, [line.encode() for line in lines], [tuple(fields) for fields in expected]]:
+        result = list(read_records(records))
+        assert result == expected, f"Expected {expected}, but got {result}"
+
+
+class _AlignedSegment(SimpleNamespace):
+    """The attributes of pysam.AlignedSegment used by `read_records`"""
+
+    def get_tag(self, tag: str) -> str:
+        return self.tags[tag]
+
+
+def _aligned_segment(**kwargs) -> _AlignedSegment:
+    attributes = dict(
+        query_name="read1",
+        flag=16,
+        reference_name="chr1",
+        reference_start=99,
+        mapping_quality=60,
+        cigarstring="3M",
+        query_sequence="ACG",
+        query_qualities=[40, 40, 40],
+        is_unmapped=False,
+        tags={"cs": "=ACG"},
+    )
+    return _AlignedSegment(**{**attributes, **kwargs})
+
+
+def test_read_records_of_objects():
+    records = [
+        _aligned_segment(),
+        _aligned_segment(query_name="read2", is_unmapped=True, reference_name=None),
+        _aligned_segment(query_name="read3", query_sequence=None),
+        _aligned_segment(query_name="read,4", mapping_quality=10, query_qualities=None),
+    ]
+    result = list(extract_alignment(read_records(records)))
+    expected = [
+        {
+            "QNAME": "read1",
+            "FLAG": 16,
+            "RNAME": "chr1",
+            "POS": 100,
+            "MAPQ": 60,
+            "CIGAR": "3M",
+            "SEQ": "ACG",
+            "QUAL": "III",
+            "CSTAG": "=ACG",
+        },
+        {
+            "QNAME": "read_4",
+            "FLAG": 16,
+            "RNAME": "chr1",
+            "POS": 100,
+            "MAPQ": 10,
+            "CIGAR": "3M",
+            "SEQ": "ACG",
+            "QUAL": "*",
+            "CSTAG": "=ACG",
+        },
+    ]
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+@pytest.mark.parametrize(
+    "alignment_filter, expected",
+    [
+        (AlignmentFilter(min_mapq=20), ["read1"]),
+        (AlignmentFilter(region="chr1:102-200"), ["read1", "read_2"]),
+        (AlignmentFilter(region="chr1:103-200"), []),
+        (AlignmentFilter(qnames={"read,2"}), ["read_2"]),
+    ],
+)
+def test_read_records_of_objects_with_filter(alignment_filter, expected):
+    records = [_aligned_segment(), _aligned_segment(query_name="read,2", mapping_quality=10)]
+    result = [alignment["QNAME"] for alignment in extract_alignment(read_records(records), alignment_filter)]
+    assert result == expected, f"Expected {expected}, but got {result}"
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+from csvtag.caller import call
+from csvtag.reference import FastaReference
+from csvtag.short_form import convert_result_file, convert_results, to_long_form, to_short_form
+from csvtag.writer import read_results, write_results
+
+
+@pytest.mark.parametrize(
+    "csv_tag, expected",
+    [
+        ("=AAAAA", ":5"),
+        ("=AA*AG=AA", ":2*AG:2"),
+        ("=aa*ag=aa", "=aa*ag=aa"),  # inversion
+        ("=AA-CC+GG=TT~GT10AG=A", ":2-CC+GG:2~GT10AG:1"),
+        ("=AANNN=tt=nnnCC", ":2=NNN=tt=nnnCC"),
+        ("=ACGT*AG=CC=aa*ag=aa=TTNNNTT", ":4*AG:2=aa*ag=aa:2=NNN:2"),
+        ("", ""),
+    ],
+)
+def test_to_short_form(csv_tag, expected):
+    result = to_short_form(csv_tag)
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_to_long_form(tmp_path):
+    path_fasta = tmp_path / "reference.fa"
+    path_fasta.write_text(">ref\nAAAAACCCCCTTTTTCCCCCGGGGG\n")
+    result = to_long_form(":2*AG:2=aa*ag=aa:2=NNN:2", "ref", 9, FastaReference(path_fasta))
+    expected = "=CC*AG=TT=aa*ag=aa=CC=NNN=GG"
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_call_short_form():
+    path_sam = Path("tests/data/three_alignments_witn_inv.sam")
+    result = [alignment["CSVTAG"] for alignment in call(path_sam, short_form=True)]
+    expected = [":5", "=aa*ag=aa", ":5"]
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_convert_result_file_round_trip(tmp_path):
+    path_fasta = tmp_path / "reference.fa"
+    path_fasta.write_text(">ref\n" + "A" * 5 + "C" * 5 + "TTTTT" + "C" * 5 + "G" * 5 + "\n")
+    path_sam = Path("tests/data/three_alignments_witn_inv.sam")
+    expected = list(call(path_sam))
+
+    write_results(expected, tmp_path / "long.tsv")
+    convert_result_file(tmp_path / "long.tsv", tmp_path / "short.tsv", reference=path_fasta)
+    convert_result_file(tmp_path / "short.tsv", tmp_path / "restored.tsv", short_form=False, reference=path_fasta)
+
+    assert [r["CSVTAG"] for r in read_results(tmp_path / "short.tsv")] == [":5", "=aa*ag=aa", ":5"]
+    assert list(read_results(tmp_path / "restored.tsv")) == expected
+
+
+@pytest.mark.parametrize("cstag", ["=AAAAC", ":5"])
+def test_round_trip_of_reverse_strand(tmp_path, cstag):
+    path_fasta = tmp_path / "reference.fa"
+    path_fasta.write_text(">ref\nAAAACGGGGG\n")
+    path_sam = tmp_path / "reverse.sam"
+    path_sam.write_text(f"@SQ\tSN:ref\tLN:10\nread1\t16\tref\t1\t60\t5M\t*\t0\t0\tGTTTT\tIIIII\tcs:Z:{cstag}\n")
+    expected = [{"QNAME": "read1", "RNAME": "ref", "POS": 1, "CSVTAG": "=GTTTT"}]
+
+    # The csv tag is in the read orientation, so it is kept in the long form
+    result = list(call(path_sam, reference=path_fasta, short_form=True))
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+    result = list(convert_results(convert_results(expected, reference=path_fasta), False, path_fasta))
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+@pytest.mark.parametrize("short_form", [True, False])
+def test_convert_results_without_reference(short_form):
+    with pytest.raises(ValueError):
+        list(convert_results([], short_form=short_form))
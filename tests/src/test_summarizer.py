@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+from csvtag.caller import call
+from csvtag.summarizer import COLUMNS, LocusCounter, summarize, write_summary
+
+
+def _to_table(rows):
+    return [tuple(row[column] for column in COLUMNS[1:]) for row in rows]
+
+
+@pytest.mark.parametrize(
+    "csv_tag, pos, expected",
+    [
+        # POS, DEPTH, INVERSION, A, C, G, T, INSERTION, DELETION
+        ("=AC", 1, [(1, 1, 0, 0, 0, 0, 0, 0, 0), (2, 1, 0, 0, 0, 0, 0, 0, 0)]),
+        ("=A*AG", 5, [(5, 1, 0, 0, 0, 0, 0, 0, 0), (6, 1, 0, 0, 0, 1, 0, 0, 0)]),
+        ("=A+TT-C", 1, [(1, 1, 0, 0, 0, 0, 0, 0, 0), (2, 1, 0, 0, 0, 0, 0, 1, 1)]),
+        ("=a*ag", 1, [(1, 1, 1, 0, 0, 0, 0, 0, 0), (2, 1, 1, 0, 0, 1, 0, 0, 0)]),
+        ("=ANA", 1, [(1, 1, 0, 0, 0, 0, 0, 0, 0), (3, 1, 0, 0, 0, 0, 0, 0, 0)]),
+        (":1~GT2AG:1", 1, [(1, 1, 0, 0, 0, 0, 0, 0, 0), (4, 1, 0, 0, 0, 0, 0, 0, 0)]),
+    ],
+)
+def test_locus_counter(csv_tag, pos, expected):
+    counter = LocusCounter(capacity=1)
+    counter.add(csv_tag, pos)
+    result = _to_table(counter.rows("chr1"))
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_summarize():
+    results = [
+        {"QNAME": "read1", "RNAME": "chr1", "POS": 1, "CSVTAG": "=AA"},
+        {"QNAME": "read2", "RNAME": "chr1", "POS": 2, "CSVTAG": "=a*ag"},
+        {"QNAME": "read3", "RNAME": "chr2", "POS": 3, "CSVTAG": "=C"},
+    ]
+    result = [(row["RNAME"], row["POS"], row["DEPTH"], row["INVERSION"], row["G"]) for row in summarize(results)]
+    expected = [("chr1", 1, 1, 0, 0), ("chr1", 2, 2, 1, 0), ("chr1", 3, 1, 1, 1), ("chr2", 3, 1, 0, 0)]
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_summarize_call():
+    path_sam = Path("tests/data/three_alignments_witn_inv.sam")
+    rows = list(summarize(call(path_sam)))
+    result = sum(row["INVERSION"] > 0 for row in rows)
+    expected = 5
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_write_summary(tmp_path):
+    path_output = tmp_path / "summary.tsv"
+    write_summary([{"QNAME": "read1", "RNAME": "chr1", "POS": 1, "CSVTAG": "=A*AG"}], path_output)
+    result = path_output.read_text().splitlines()
+    expected = ["\t".join(COLUMNS), "chr1\t1\t1\t0\t0\t0\t0\t0\t0\t0", "chr1\t2\t1\t0\t0\t0\t1\t0\t0\t0"]
+    assert result == expected, f"Expected {expected}, but got {result}"
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+from csvtag.caller import call
+from csvtag.to_bed import iter_bed_records, iter_inversion_intervals, merge_bed_records, to_bed
+
+
+@pytest.mark.parametrize(
+    "csv_tag, pos, expected",
+    [
+        ("=AAAAA", 1, []),
+        ("=aaaaa", 1, [(0, 5)]),
+        ("=AA=aa*ag-a=AA=cc", 10, [(11, 15), (17, 19)]),
+        ("=aa+tt=AA", 1, [(0, 2)]),
+        (":2=aa:2", 1, [(2, 4)]),
+    ],
+)
+def test_iter_inversion_intervals(csv_tag, pos, expected):
+    result = list(iter_inversion_intervals(csv_tag, pos))
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_iter_bed_records():
+    path_sam = Path("tests/data/three_alignments_witn_inv.sam")
+    result = [(r["CHROM"], r["END"] - r["START"], r["STRAND"]) for r in iter_bed_records(call(path_sam, strand=True))]
+    expected = [(alignment["RNAME"], 5, "-") for alignment in call(path_sam) if alignment["CSVTAG"].islower()]
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+@pytest.mark.parametrize("strand, combine_distance", [(True, None), (True, 50), (False, None)])
+def test_iter_bed_records_of_reverse_read(tmp_path, strand, combine_distance):
+    path_sam = tmp_path / "reverse_read.sam"
+    lines = []
+    for line in Path("tests/data/three_alignments_witn_inv.sam").read_text().splitlines():
+        fields = line.split("\t")
+        if not line.startswith("@"):
+            fields[1] = str(int(fields[1]) ^ 16)  # reverse the strand of every alignment
+        lines.append("\t".join(fields))
+    path_sam.write_text("\n".join(lines) + "\n")
+    results = call(path_sam, strand=strand, combine_distance=combine_distance)
+    result = [r["STRAND"] for r in iter_bed_records(results)]
+    expected = ["+" if strand else "."]
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_merge_bed_records():
+    records = [
+        {"CHROM": "chr1", "START": 10, "END": 20, "NAME": "read1", "SCORE": 0, "STRAND": "-"},
+        {"CHROM": "chr2", "START": 0, "END": 5, "NAME": "read2", "SCORE": 0, "STRAND": "-"},
+        {"CHROM": "chr1", "START": 15, "END": 30, "NAME": "read3", "SCORE": 0, "STRAND": "-"},
+        {"CHROM": "chr1", "START": 30, "END": 40, "NAME": "read4", "SCORE": 0, "STRAND": "-"},
+    ]
+    result = [(r["CHROM"], r["START"], r["END"], r["NAME"]) for r in merge_bed_records(records)]
+    expected = [("chr1", 10, 30, 2), ("chr1", 30, 40, 1), ("chr2", 0, 5, 1)]
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+    records_sorted = sorted(records, key=lambda x: (x["CHROM"], x["START"], x["END"]))
+    result = [(r["CHROM"], r["START"], r["END"], r["NAME"]) for r in merge_bed_records(iter(records_sorted), True)]
+    assert result == expected, f"Expected {expected}, but got {result}"
+    with pytest.raises(ValueError):
+        list(merge_bed_records(records, presorted=True))
+
+
+def test_merge_bed_records_of_different_strands():
+    records = [
+        {"CHROM": "chr1", "START": 10, "END": 20, "NAME": "read1", "SCORE": 0, "STRAND": "-"},
+        {"CHROM": "chr1", "START": 15, "END": 30, "NAME": "read2", "SCORE": 0, "STRAND": "+"},
+    ]
+    result = [r["STRAND"] for r in merge_bed_records(records)]
+    expected = ["."]
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_to_bed(tmp_path):
+    results = [
+        {"QNAME": "read1", "RNAME": "chr1", "POS": 1, "CSVTAG": "=AA=aa=AA", "STRAND": "+"},
+        {"QNAME": "read2", "RNAME": "chr1", "POS": 2, "CSVTAG": "=A=aaa=AA", "STRAND": "+"},
+    ]
+    to_bed(results, tmp_path / "inversions.bed")
+    result = (tmp_path / "inversions.bed").read_text()
+    expected = "chr1\t2\t4\tread1\t0\t-\nchr1\t2\t5\tread2\t0\t-\n"
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+    to_bed(results, tmp_path / "merged.bed", merge=True)
+    result = (tmp_path / "merged.bed").read_text()
+    expected = "chr1\t2\t5\t2\t0\t-\n"
+    assert result == expected, f"Expected {expected}, but got {result}"
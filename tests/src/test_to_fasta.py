@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import gzip
+from pathlib import Path
+
+import pytest
+from csvtag.caller import call
+from csvtag.to_fasta import iter_fasta_records, query_sequence, to_fasta
+from csvtag.to_sequence import to_sequence
+
+
+@pytest.mark.parametrize(
+    "csv_tag, keep_case, expected",
+    [
+        ("=AA=aa*ga=a=AA", True, "AAaaaaAA"),
+        ("=AA=aa+gg=aa=AA", False, "AAAAGGAAAA"),
+        ("=AA=aa-gg=aa=AA", True, "AAaaaaAA"),
+        ("=AAGG*CT=AT", True, "AAGGTAT"),
+        ("=AANNN=ttnn=CC", True, "AANNNttnnCC"),
+        ("=AA~gt10ag=AA", True, "AAAA"),
+        ("", True, ""),
+    ],
+)
+def test_query_sequence(csv_tag, keep_case, expected):
+    result = query_sequence(csv_tag, keep_case)
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_query_sequence_of_short_form():
+    with pytest.raises(ValueError):
+        query_sequence(":5*ag=TT")
+
+
+def test_to_fasta_of_short_form(tmp_path):
+    path_fasta = tmp_path / "reference.fa"
+    path_fasta.write_text(">chr1\nAAAAACGTT\n")
+    results = [{"QNAME": "read1", "RNAME": "chr1", "POS": 1, "CSVTAG": ":5*CG:3"}]
+    path_output = tmp_path / "alleles.fa"
+    to_fasta(results, path_output, reference=path_fasta)
+    result = path_output.read_text()
+    expected = ">read1 chr1:1\nAAAAAGGTT\n"
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_query_sequence_same_as_to_sequence():
+    path_sam = Path("tests/data/inversion_sr_simulated.sam")
+    for alignment in call(path_sam, combine_distance=50):
+        result = query_sequence(alignment["CSVTAG"])
+        expected = to_sequence(alignment["CSVTAG"])
+        assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_iter_fasta_records_dedup():
+    results = [
+        {"QNAME": "read1", "RNAME": "chr1", "POS": 1, "CSVTAG": "=AA"},
+        {"QNAME": "read2", "RNAME": "chr1", "POS": 1, "CSVTAG": "=AC"},
+        {"QNAME": "read3", "RNAME": "chr1", "POS": 1, "CSVTAG": "=A*GC"},
+        {"QNAME": "read4", "RNAME": "chr1", "POS": 1, "CSVTAG": "-AA"},
+    ]
+    result = list(iter_fasta_records(results, dedup=True))
+    expected = [("read2 count=2", "AC"), ("read1 count=1", "AA")]
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+@pytest.mark.parametrize("name", ["alleles.fa", "alleles.fa.gz"])
+def test_to_fasta(tmp_path, name):
+    path_sam = Path("tests/data/three_alignments_witn_inv.sam")
+    path_output = tmp_path / name
+    to_fasta(call(path_sam), path_output, block_size=16)
+    with gzip.open(path_output, "rt") if name.endswith(".gz") else open(path_output) as f:
+        result = f.read()
+    expected = ">read1 ref:1\nAAAAA\n>read1 ref:11\naagaa\n>read1 ref:21\nGGGGG\n"
+    assert result == expected, f"Expected {expected}, but got {result}"
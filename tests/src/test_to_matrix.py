@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+from csvtag.to_matrix import DELETION, INVERTED, MATCH, NONE, SUBSTITUTION, UNKNOWN, iter_matrices, to_matrix
+
+
+@pytest.mark.parametrize(
+    "csv_tag, pos, expected",
+    [
+        ("=AAAAA", 1, [MATCH] * 5),
+        ("=AA", 2, [NONE, MATCH, MATCH, NONE, NONE]),
+        ("=A*AG-CC=A", 1, [MATCH, SUBSTITUTION, DELETION, DELETION, MATCH]),
+        ("=ANNA=A", 1, [MATCH, UNKNOWN, UNKNOWN, MATCH, MATCH]),
+        ("=A=aa*ag=A", 1, [MATCH, MATCH | INVERTED, MATCH | INVERTED, SUBSTITUTION | INVERTED, MATCH]),
+        (":2*AG:10", 0, [MATCH, SUBSTITUTION, MATCH, MATCH, MATCH]),  # clipped to the region
+    ],
+)
+def test_to_matrix(csv_tag, pos, expected):
+    results = [{"QNAME": "read1", "RNAME": "chr1", "POS": pos, "CSVTAG": csv_tag}]
+    result = to_matrix(results, "chr1", 1, 5).codes.tolist()
+    assert result == [expected], f"Expected {[expected]}, but got {result}"
+
+
+def test_to_matrix_insertions():
+    results = [
+        {"QNAME": "read1", "RNAME": "chr1", "POS": 1, "CSVTAG": "=AA+TTT=AA"},
+        {"QNAME": "read1", "RNAME": "chr1", "POS": 5, "CSVTAG": "=A"},
+        {"QNAME": "read2", "RNAME": "chr2", "POS": 1, "CSVTAG": "=AAAAA"},
+    ]
+    matrix = to_matrix(results, "chr1", 1, 5, insertions=True)
+    assert matrix.qnames == ["read1"]
+    assert matrix.codes.dtype == np.int8
+    assert matrix.codes.tolist() == [[MATCH] * 5]
+    assert matrix.insertions.tolist() == [[0, 0, 3, 0, 0]]
+
+
+def test_iter_matrices():
+    results = [{"QNAME": f"read{i}", "RNAME": "chr1", "POS": 1, "CSVTAG": "=AAA"} for i in range(5)]
+    result = [matrix.codes.shape for matrix in iter_matrices(iter(results), "chr1", 1, 3, chunk_size=2)]
+    expected = [(2, 3), (2, 3), (1, 3)]
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_to_matrix_skips_reads_outside_region():
+    results = [
+        {"QNAME": "read1", "RNAME": "chr1", "POS": 1, "CSVTAG": "=AAA"},
+        {"QNAME": "read2", "RNAME": "chr1", "POS": 6, "CSVTAG": "=AAA"},
+        {"QNAME": "read3", "RNAME": "chr1", "POS": 1, "CSVTAG": "=A+TT=A"},
+        {"QNAME": "read4", "RNAME": "chr1", "POS": 5, "CSVTAG": "=AA"},
+    ]
+    matrix = to_matrix(results, "chr1", 3, 5, insertions=True)
+    assert matrix.qnames == ["read1", "read4"]
+    assert matrix.codes.tolist() == [[MATCH, NONE, NONE], [NONE, NONE, MATCH]]
+    assert matrix.insertions.tolist() == [[0, 0, 0], [0, 0, 0]]
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import gzip
+
+import pytest
+from csvtag.bgzf import EOF_BLOCK
+from csvtag.reference import FastaReference
+from csvtag.to_vcf import iter_variants, merge_variants, to_vcf
+
+
+@pytest.mark.parametrize(
+    "csv_tag, pos, expected",
+    [
+        ("=AAAAA", 1, []),
+        ("=AC*AG=T", 10, [(12, "A", "G", 12)]),
+        ("=ACT-GG=A", 10, [(12, "TGG", "T", 14)]),
+        ("=ACT+GG=A", 10, [(12, "T", "TGG", 12)]),
+        ("-GG=A", 10, [(9, "NGG", "N", 11)]),  # no anchor base
+        ("=AC=aa*ag=A", 10, [(11, "C", "<INV>", 14)]),
+        (
+            "=AC*AG=T-GG=A+TT=aa",
+            10,
+            [(12, "A", "G", 12), (13, "TGG", "T", 15), (16, "A", "ATT", 16), (16, "A", "<INV>", 18)],
+        ),
+    ],
+)
+def test_iter_variants(csv_tag, pos, expected):
+    result = list(iter_variants(csv_tag, pos))
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_iter_variants_with_reference(tmp_path):
+    path_fasta = tmp_path / "reference.fa"
+    path_fasta.write_text(">ref\nAAAAACCCCCTTTTT\n")
+    result = list(iter_variants("-CC:3", 6, "ref", FastaReference(path_fasta)))
+    expected = [(5, "ACC", "A", 7)]
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_merge_variants():
+    results = [
+        {"QNAME": "read1", "RNAME": "chr1", "POS": 1, "CSVTAG": "=AA*AG=AA"},
+        {"QNAME": "read2", "RNAME": "chr1", "POS": 2, "CSVTAG": "=A*AG=AA"},
+        {"QNAME": "read3", "RNAME": "chr1", "POS": 2, "CSVTAG": "=A*AC=AA"},
+        {"QNAME": "read4", "RNAME": "chr2", "POS": 1, "CSVTAG": "=A*AG=AA"},
+    ]
+    result = [(v["CHROM"], v["POS"], v["ALT"], v["SUPPORT"]) for v in merge_variants(results)]
+    expected = [("chr1", 3, "C", 1), ("chr1", 3, "G", 2), ("chr2", 2, "G", 1)]
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_merge_variants_unsorted():
+    results = [
+        {"QNAME": "read1", "RNAME": "chr1", "POS": 10, "CSVTAG": "=AA*AG=AA"},
+        {"QNAME": "read2", "RNAME": "chr1", "POS": 1, "CSVTAG": "=A*AG=AA"},
+    ]
+    with pytest.raises(ValueError):
+        list(merge_variants(results))
+
+
+def test_to_vcf(tmp_path):
+    path_output = tmp_path / "example.vcf.gz"
+    results = [
+        {"QNAME": "read1", "RNAME": "chr1", "POS": 1, "CSVTAG": "=AA*AG=AA"},
+        {"QNAME": "read2", "RNAME": "chr1", "POS": 1, "CSVTAG": "=AA=aa=AA"},
+    ]
+    to_vcf(results, path_output)
+
+    assert path_output.read_bytes().endswith(EOF_BLOCK)
+    with gzip.open(path_output, "rt") as f:
+        records = [line.rstrip("\n").split("\t") for line in f if not line.startswith("#")]
+    expected = [
+        ["chr1", "2", ".", "A", "<INV>", ".", ".", "SVTYPE=INV;SVLEN=2;END=4;SUPPORT=1"],
+        ["chr1", "3", ".", "A", "G", ".", ".", "SUPPORT=1"],
+    ]
+    assert records == expected, f"Expected {expected}, but got {records}"
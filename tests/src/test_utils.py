@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+import pytest
+from csvtag.utils import query_length, reference_length, token_query_length, token_reference_length
+
+
+@pytest.mark.parametrize(
+    "tag, expected_reference, expected_query",
+    [
+        ("=ACGT", 4, 4),
+        (":4", 4, 4),
+        ("*ag", 1, 1),
+        ("-aa", 2, 0),
+        ("+TTT", 0, 3),
+        ("~GT10AG", 10, 0),
+    ],
+)
+def test_token_length(tag, expected_reference, expected_query):
+    result = (token_reference_length(tag), token_query_length(tag))
+    expected = (expected_reference, expected_query)
+    assert result == expected, f"Expected {expected}, but got {result}"
+
+
+@pytest.mark.parametrize(
+    "csv_tag, expected_reference, expected_query",
+    [
+        ("=AC*ag-ttt+GG:3", 9, 8),
+        ("=AA~GT10AG=AA", 14, 4),
+        ("=AANNN=ttnn=CC", 11, 11),
+    ],
+)
+def test_length(csv_tag, expected_reference, expected_query):
+    result = (reference_length(csv_tag), query_length(csv_tag))
+    expected = (expected_reference, expected_query)
+    assert result == expected, f"Expected {expected}, but got {result}"
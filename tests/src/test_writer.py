@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import pytest
+from csvtag.writer import QnameIndex, index_path, read_results, write_results
+
+
+def test_write_and_read_results(tmp_path):
+    results = [
+        {"QNAME": "read1", "RNAME": "ref", "POS": 1, "CSVTAG": "=AAAAA"},
+        {"QNAME": "read1", "RNAME": "ref", "POS": 11, "CSVTAG": "=aa*ag=aa"},
+    ]
+    path_output = tmp_path / "results.tsv"
+    write_results(results, path_output)
+    assert path_output.read_text().splitlines()[0] == "QNAME\tRNAME\tPOS\tCSVTAG"
+    assert list(read_results(path_output)) == results
+
+
+def test_write_and_read_bgzf_results(tmp_path):
+    results = [{"QNAME": f"read{i}", "RNAME": "ref", "POS": i, "CSVTAG": "=AAAAA"} for i in range(1, 1000)]
+    path_output = tmp_path / "results.tsv.gz"
+    write_results(results, path_output, threads=2)
+    assert path_output.read_bytes()[:4] == b"\x1f\x8b\x08\x04"
+    assert list(read_results(path_output)) == results
+
+
+@pytest.mark.parametrize("name", ["results.tsv", "results.tsv.gz"])
+def test_qname_index(tmp_path, name):
+    results = [
+        {"QNAME": f"read{i}", "RNAME": "ref", "POS": pos, "CSVTAG": "=ACGT" * (i % 100 + 1)}
+        for i in range(5000)
+        for pos in [1, 500]
+    ]
+    # Rows of a QNAME apart from the others are also found
+    results.append({"QNAME": "read0", "RNAME": "ref2", "POS": 1, "CSVTAG": "=aa"})
+    path_output = tmp_path / name
+    write_results(results, path_output, threads=2, index=True)
+    assert index_path(path_output).exists()
+    with QnameIndex(path_output) as index:
+        for qname in ["read0", "read1", "read4999", "read5000"]:
+            result = index.get(qname)
+            expected = [r for r in results if r["QNAME"] == qname]
+            assert result == expected, f"Expected {expected}, but got {result}"
+        assert "read10" in index
+        assert "read10000" not in index